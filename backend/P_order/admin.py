@@ -7,8 +7,8 @@ from .models import  *
 
 @admin.register(PurchaseRequest)
 class PurchaseRequestAdmin(admin.ModelAdmin):
-   list_display =["id", "title", "description", "amount", "created_by", "status", "created_at"]
-   list_filter = ["status", "created_at", "created_by"]
+   list_display =["id", "title", "description", "amount", "created_by", "status", "next_level", "created_at"]
+   list_filter = ["status", "next_level", "created_at", "created_by"]
 
 
 
@@ -29,11 +29,29 @@ class ApprovalAdmin(admin.ModelAdmin):
 
 @admin.register(PurchaseOrder)
 class PurchaseOrderAdmin(admin.ModelAdmin):
-   list_display=["id", "po_number", "vendor", "total_amount", "created_at"]
-   list_filter=["created_at"]
+   list_display=["id", "po_number", "vendor", "total_amount", "file_status", "created_at"]
+   list_filter=["file_status", "created_at"]
 
 
 @admin.register(Receipt)
 class ReceiptAdmin(admin.ModelAdmin):
    list_display=["id","purchase_request","created_at"]
    list_filter=["created_at"]
+
+
+@admin.register(SpendRollup)
+class SpendRollupAdmin(admin.ModelAdmin):
+   list_display=["dimension", "key", "label", "month", "request_count", "total_amount"]
+   list_filter=["dimension", "month"]
+
+
+@admin.register(ExtractionCacheEntry)
+class ExtractionCacheEntryAdmin(admin.ModelAdmin):
+   list_display=["sha256", "kind", "extractor_version", "created_at"]
+   list_filter=["kind", "extractor_version"]
+
+
+@admin.register(DocumentJob)
+class DocumentJobAdmin(admin.ModelAdmin):
+   list_display=["id", "kind", "status", "purchase_request", "attempts", "created_at", "finished_at"]
+   list_filter=["kind", "status"]
@@ -0,0 +1,134 @@
+"""
+Spend rollups: spend by vendor, requester, month and approval outcome.
+
+``SpendRollup`` rows are updated in the same transaction as the event that
+changes them (a purchase order being created, a request being rejected), so
+reports only ever read the small rollup table. ``rebuild_rollups()`` recomputes
+everything from the source tables.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Max, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import PurchaseOrder, PurchaseRequest, SpendRollup
+
+
+def month_of(value):
+    return timezone.localtime(value).date().replace(day=1)
+
+
+def _add(dimension, key, label, month, amount, count=1):
+    amount = Decimal(str(amount))
+    filters = {"dimension": dimension, "key": key, "month": month}
+    updated = SpendRollup.objects.filter(**filters).update(
+        request_count=F("request_count") + count,
+        total_amount=F("total_amount") + amount,
+        label=label,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            SpendRollup.objects.create(label=label, request_count=count, total_amount=amount, **filters)
+    except IntegrityError:
+        # Another transaction created the row first.
+        SpendRollup.objects.filter(**filters).update(
+            request_count=F("request_count") + count,
+            total_amount=F("total_amount") + amount,
+        )
+
+
+def record_purchase_order(po, purchase):
+    """Count a newly created purchase order as approved spend."""
+    month = month_of(po.created_at)
+    requester = purchase.created_by
+    with transaction.atomic():
+        _add("vendor", po.vendor, po.vendor, month, po.total_amount)
+        _add("requester", str(requester.pk), requester.username, month, po.total_amount)
+        _add("outcome", "approved", "approved", month, po.total_amount)
+
+
+def record_rejection(purchase):
+    """Count a rejected request's amount under the rejected outcome."""
+    month = month_of(purchase.last_action_at or timezone.now())
+    _add("outcome", "rejected", "rejected", month, purchase.amount)
+
+
+def rebuild_rollups():
+    """Recompute every rollup row from purchase orders and rejected requests."""
+    rows = []
+    orders = PurchaseOrder.objects.annotate(month=TruncMonth("created_at", output_field=DateField()))
+
+    for row in orders.values("vendor", "month").annotate(count=Count("id"), total=Sum("total_amount")):
+        rows.append(SpendRollup(
+            dimension="vendor", key=row["vendor"], label=row["vendor"], month=row["month"],
+            request_count=row["count"], total_amount=row["total"],
+        ))
+
+    by_requester = orders.values(
+        "purchase_request__created_by_id", "purchase_request__created_by__username", "month",
+    ).annotate(count=Count("id"), total=Sum("total_amount"))
+    for row in by_requester:
+        rows.append(SpendRollup(
+            dimension="requester", key=str(row["purchase_request__created_by_id"]),
+            label=row["purchase_request__created_by__username"], month=row["month"],
+            request_count=row["count"], total_amount=row["total"],
+        ))
+
+    for row in orders.values("month").annotate(count=Count("id"), total=Sum("total_amount")):
+        rows.append(SpendRollup(
+            dimension="outcome", key="approved", label="approved", month=row["month"],
+            request_count=row["count"], total_amount=row["total"],
+        ))
+
+    rejected = (
+        PurchaseRequest.objects.filter(status="rejected")
+        .annotate(month=TruncMonth(Coalesce("last_action_at", "updated_at"), output_field=DateField()))
+        .values("month")
+        .annotate(count=Count("id"), total=Sum("amount"))
+    )
+    for row in rejected:
+        rows.append(SpendRollup(
+            dimension="outcome", key="rejected", label="rejected", month=row["month"],
+            request_count=row["count"], total_amount=row["total"],
+        ))
+
+    with transaction.atomic():
+        SpendRollup.objects.all().delete()
+        SpendRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def spend_report(dimension, month_from=None, month_to=None):
+    """
+    Totals from the rollup table. ``dimension`` is vendor, requester, outcome
+    or month (approved spend per month).
+    """
+    queryset = SpendRollup.objects.all()
+    if month_from:
+        queryset = queryset.filter(month__gte=month_from)
+    if month_to:
+        queryset = queryset.filter(month__lte=month_to)
+
+    if dimension == "month":
+        rows = (
+            queryset.filter(dimension="outcome", key="approved")
+            .values("month")
+            .annotate(request_count=Sum("request_count"), total_amount=Sum("total_amount"))
+            .order_by("month")
+        )
+        return [
+            {"month": row["month"].strftime("%Y-%m"), "request_count": row["request_count"], "total_amount": row["total_amount"]}
+            for row in rows
+        ]
+
+    rows = (
+        queryset.filter(dimension=dimension)
+        .values("key")
+        .annotate(label=Max("label"), request_count=Sum("request_count"), total_amount=Sum("total_amount"))
+        .order_by("-total_amount", "key")
+    )
+    return list(rows)
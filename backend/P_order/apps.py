@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class POrderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'P_order'
+
+    def ready(self):
+        import P_order.signals
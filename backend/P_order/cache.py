@@ -0,0 +1,147 @@
+"""
+Per-user response cache for purchase request reads.
+
+Entries live in the Django cache named by ``PURCHASE_REQUEST_CACHE_ALIAS``.
+The document worker, mailer and digest scheduler change purchase requests
+from their own processes, so the generations they bump must be seen by the
+web process: the cache has to be shared (database, file or Redis backend).
+With a per-process backend (locmem, dummy) the response cache is off unless
+``PURCHASE_REQUEST_CACHE_ENABLED`` says otherwise. Each entry belongs to a
+scope whose generation number is part of its key:
+
+* ``all`` - listings seen by approvers and finance,
+* ``creator:<user id>`` - a staff member's own listing,
+* ``request:<id>`` - one request's detail.
+
+Signals bump the generations a change affects (see signals.py), which orphans
+exactly the stale entries; they then age out with the cache timeout.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .conditional import Validators
+
+KEY_PREFIX = "preq"
+STAT_NAMES = ("hits", "misses", "invalidations")
+# Backends whose entries are private to one process.
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def get_cache():
+    return caches[getattr(settings, "PURCHASE_REQUEST_CACHE_ALIAS", "default")]
+
+
+def cache_enabled():
+    enabled = getattr(settings, "PURCHASE_REQUEST_CACHE_ENABLED", None)
+    if enabled is not None:
+        return enabled
+    alias = getattr(settings, "PURCHASE_REQUEST_CACHE_ALIAS", "default")
+    return settings.CACHES[alias]["BACKEND"] not in PROCESS_LOCAL_BACKENDS
+
+
+def cache_timeout():
+    return getattr(settings, "PURCHASE_REQUEST_CACHE_TIMEOUT", 300)
+
+
+def _incr(cache, key, initial=1):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, initial, None)
+        return initial
+
+
+def _record(stat):
+    _incr(get_cache(), f"{KEY_PREFIX}:stats:{stat}")
+
+
+def _generation(cache, scope):
+    key = f"{KEY_PREFIX}:gen:{scope}"
+    value = cache.get(key)
+    if value is None:
+        # Seed from the clock so a generation lost to eviction can never
+        # come back with a number that matches old entries.
+        cache.add(key, int(time.time() * 1000), None)
+        value = cache.get(key)
+    return value
+
+
+def list_scope(user):
+    if getattr(user, "role", None) == "staff":
+        return f"creator:{user.pk}"
+    return "all"
+
+
+def detail_scope(purchase_request_id):
+    return f"request:{purchase_request_id}"
+
+
+def invalidate_purchase_request(purchase_request_id, created_by_id):
+    """Drop every cached response that can include this purchase request."""
+    cache = get_cache()
+    for scope in ("all", f"creator:{created_by_id}", detail_scope(purchase_request_id)):
+        key = f"{KEY_PREFIX}:gen:{scope}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass  # Nothing has been cached under this scope yet.
+    _record("invalidations")
+
+
+def cache_stats():
+    cache = get_cache()
+    stats = {name: cache.get(f"{KEY_PREFIX}:stats:{name}", 0) for name in STAT_NAMES}
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["enabled"] = cache_enabled()
+    return stats
+
+
+class ResponseCache:
+    """Looks up and stores the response for one request within a scope."""
+
+    def __init__(self, request, scope, enabled=True):
+        self.cache = get_cache()
+        self.enabled = enabled and cache_enabled()
+        if not self.enabled:
+            return
+        parts = [
+            request.get_host(),
+            request.get_full_path(),
+            getattr(request.user, "pk", None),
+            getattr(request.user, "role", None),
+        ]
+        digest = hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+        self.key = f"{KEY_PREFIX}:{scope}:{_generation(self.cache, scope)}:{digest}"
+
+    def lookup(self, request):
+        """The cached response (or a 304) for ``request``, or None on a miss."""
+        if not self.enabled:
+            return None
+        entry = self.cache.get(self.key)
+        if entry is None:
+            _record("misses")
+            return None
+        _record("hits")
+        validators = Validators(entry["etag"], entry["timestamp"])
+        response = validators.not_modified(request)
+        if response is None:
+            response = validators.apply(Response(entry["data"]))
+        response["X-Cache"] = "HIT"
+        return response
+
+    def store(self, response, validators):
+        if not self.enabled:
+            return response
+        if response.status_code == 200:
+            entry = {"data": response.data, "etag": validators.etag, "timestamp": validators.timestamp}
+            self.cache.set(self.key, entry, cache_timeout())
+        response["X-Cache"] = "MISS"
+        return response
@@ -0,0 +1,75 @@
+"""
+Conditional GET support (ETag / Last-Modified) for purchase request reads.
+
+The validators come from one cheap query over the rows a response would
+contain, so an unchanged list or detail can be answered with 304 before any
+serialization happens. A list page is fingerprinted by the ``(id,
+updated_at)`` of the rows it is cut from, which costs one index range scan
+and changes when a row joins, leaves or changes. Lists carry no
+Last-Modified: a row leaving the page makes it newer without any newer
+timestamp to show for it. Child rows (items, approvals, purchase orders and
+receipts) bump their request's updated_at, see signals.py.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+# Bump when the serialized representation changes shape.
+REPRESENTATION_VERSION = 1
+
+
+def fingerprint(queryset):
+    """Return ``(count, last_modified)`` for the rows in ``queryset``."""
+    result = queryset.order_by().aggregate(count=Count("id"), last_modified=Max("updated_at"))
+    return result["count"], result["last_modified"]
+
+
+def _etag(request, *parts):
+    parts = [
+        REPRESENTATION_VERSION,
+        request.get_host(),
+        request.get_full_path(),
+        getattr(request.user, "pk", None),
+        getattr(request.user, "role", None),
+        *parts,
+    ]
+    return quote_etag(hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).hexdigest())
+
+
+class Validators:
+    """ETag and Last-Modified for one response."""
+
+    def __init__(self, etag, timestamp, count=None):
+        self.etag = etag
+        self.timestamp = timestamp
+        self.count = count
+
+    @classmethod
+    def for_queryset(cls, request, queryset, *extra):
+        """Validators for a response built from ``queryset`` for ``request``."""
+        count, last_modified = fingerprint(queryset)
+        etag = _etag(request, count, last_modified.isoformat() if last_modified else "", *extra)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        return cls(etag, timestamp, count)
+
+    @classmethod
+    def for_page(cls, request, keys, *extra):
+        """Validators for a list page, from the ``(id, updated_at)`` of its rows."""
+        rows = ",".join(f"{pk}@{updated_at.isoformat()}" for pk, updated_at in keys)
+        return cls(_etag(request, rows, *extra), None, len(keys))
+
+    def not_modified(self, request):
+        """A 304 response, with the same validators and caching headers, if the client's copy is current, else None."""
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.timestamp)
+        return None if response is None else self.apply(response)
+
+    def apply(self, response):
+        response["ETag"] = self.etag
+        if self.timestamp is not None:
+            response["Last-Modified"] = http_date(self.timestamp)
+        # Responses are per user: let clients revalidate, never share.
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Authorization"])
+        return response
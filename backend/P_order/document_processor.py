@@ -2,55 +2,203 @@
 Document processing utilities for proforma and receipt extraction/validation.
 Uses OCR, PDF parsing, and AI for data extraction.
 """
+import logging
+import os
 import re
-import json
-from typing import Dict, List, Optional, Any
-import pdfplumber
-import PyPDF2
-from io import BytesIO
-import importlib
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Any
+from django.conf import settings
 from django.core.files.uploadedfile import UploadedFile
 
-try:
-    import importlib
-    pytesseract = importlib.import_module("pytesseract")
-    Image = importlib.import_module("PIL.Image")
-    TESSERACT_AVAILABLE = True
-except Exception:
-    pytesseract = None
-    Image = None
-    TESSERACT_AVAILABLE = False
-try:
-
-    openai_mod = importlib.import_module("openai")
-    OpenAI = getattr(openai_mod, "OpenAI", None)
-    OPENAI_AVAILABLE = OpenAI is not None
-except Exception:
-    OpenAI = None
-    OPENAI_AVAILABLE = False
-    OPENAI_AVAILABLE = False
+from .pdf_engines import ENGINES, EngineTimeout, engine_timeout, open_pdf, preferred_engines
+from .ocr import TESSERACT_AVAILABLE, Image, ocr_image
+from .llm import get_client
+from .matching import item_discrepancies
+from .parsing import GENERIC_ITEM_PATTERNS, parse_text
+from .sandbox import EXTRACTION_MAX_IMAGE_PIXELS, extract_text_sandboxed
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are a data extraction assistant. Return only valid JSON."
+
+# Bump whenever extraction output changes, so cached results are recomputed.
+EXTRACTOR_VERSION = "10"
+
+
+# Pages read before the rest of a PDF: quotations put the vendor and items up
+# front and the total at the end.
+PDF_HEAD_PAGES = 2
+PDF_TAIL_PAGES = 1
+# Documents at least this long are split across a process pool.
+PDF_PARALLEL_MIN_PAGES = getattr(settings, "PDF_PARALLEL_MIN_PAGES", 24)
+PDF_PAGES_PER_TASK = 8
+PDF_EXTRACTION_PROCESSES = getattr(settings, "PDF_EXTRACTION_PROCESSES", min(4, os.cpu_count() or 1))
+# Stop reading once this much text is collected; callers use far less.
+PDF_TEXT_BUDGET = getattr(settings, "PDF_TEXT_BUDGET", 20000)
+
+# Cheap probes for "this field is present", checked page by page. The total
+# is anchored like the parser's label, so "Subtotal:" and per-line
+# "Amount:" do not end reading before the real total.
+FIELD_PROBES = {
+    "vendor": re.compile(r"(?:vendor|supplier|company|from)\s*[:\-]\s*\S", re.IGNORECASE),
+    "seller": re.compile(r"(?:seller|store|vendor|from):\s*[A-Z]", re.IGNORECASE),
+    "total": re.compile(
+        r"^[ \t]*(?:(?:grand\s+)?total\b|amount\s+(?:due|paid)\b|balance\s+due\b)[^\n\d]{0,40}\d",
+        re.IGNORECASE | re.MULTILINE,
+    ),
+}
+# A page with item rows, using the parser's own line shapes without their group names.
+_GROUP_NAME = re.compile(r"\(\?P<\w+>")
+ITEM_PROBE = re.compile(
+    "|".join(rf"^[ \t]*(?:{_GROUP_NAME.sub('(?:', pattern)})[ \t]*$" for pattern in GENERIC_ITEM_PATTERNS),
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# 300 dpi, what Tesseract is tuned for.
+OCR_RENDER_SCALE = 300 / 72
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def page_order(page_count: int, head: int = PDF_HEAD_PAGES, tail: int = PDF_TAIL_PAGES) -> List[int]:
+    """Page indices with the first ``head`` and last ``tail`` pages ahead of the middle."""
+    first = list(range(min(head, page_count)))
+    last = list(range(max(page_count - tail, len(first)), page_count))
+    middle = list(range(len(first), page_count - len(last)))
+    return first + last + middle
+
+
+def _extract_page_range(engine: str, data: bytes, indices: List[int]) -> List[tuple]:
+    """Process-pool task: text of the given pages of a PDF held in memory."""
+    document = open_pdf(engine, data)
+    try:
+        return [(i, document.page_text(i)) for i in indices]
+    finally:
+        document.close()
 
 
-def extract_text_from_pdf(file: UploadedFile) -> str:
-    """Extract text from PDF file using pdfplumber."""
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_PROCESSES)
+        return _pool
+
+
+def _iter_pages_parallel(engine: str, data: bytes, order: List[int]) -> Iterator[tuple]:
+    chunks = [order[i:i + PDF_PAGES_PER_TASK] for i in range(0, len(order), PDF_PAGES_PER_TASK)]
+    futures = [_get_pool().submit(_extract_page_range, engine, data, chunk) for chunk in chunks]
     try:
-        file.seek(0)
-        with pdfplumber.open(file) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-        return text
-    except Exception as e:
-        
+        # Chunks are consumed in priority order, so an early stop skips the middle.
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def iter_pdf_pages(data: bytes, engine: str, parallel: bool = True) -> Iterator[tuple]:
+    """
+    Yield ``(page_index, text)`` one page at a time, first and last pages first.
+    Long documents are fanned out across a process pool unless ``parallel`` is
+    False. Stop iterating to stop extracting.
+    """
+    document = open_pdf(engine, data)
+    try:
+        order = page_order(len(document))
+        if not parallel or len(order) < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACTION_PROCESSES < 2:
+            for i in order:
+                yield i, document.page_text(i)
+            return
+    finally:
+        document.close()
+    yield from _iter_pages_parallel(engine, data, order)
+
+
+def _read_pages(pages: Iterator[tuple], fields: Iterable[str], max_chars: Optional[int], deadline: Optional[float] = None) -> Dict[int, str]:
+    collected = {}
+    wanted = {name: FIELD_PROBES[name] for name in fields}
+    item_pages = set()
+    size = 0
+    for index, text in pages:
+        collected[index] = text
+        size += len(text)
+        for name in [name for name, probe in wanted.items() if probe.search(text)]:
+            del wanted[name]
+        if fields and ITEM_PROBE.search(text):
+            item_pages.add(index)
+        if max_chars and size >= max_chars:
+            break
+        if fields and not wanted and not _items_continue(item_pages, collected):
+            break
+        if deadline and time.monotonic() > deadline:
+            raise EngineTimeout(collected)
+    return collected
+
+
+def _items_continue(item_pages, collected) -> bool:
+    """Whether an item table may run on into an unread page before the last one read."""
+    last = max(collected)
+    return any(i + 1 < last and i + 1 not in collected for i in item_pages)
+
+
+def extract_pdf_text(file: UploadedFile, fields: Iterable[str] = (), max_chars: Optional[int] = PDF_TEXT_BUDGET, parallel: bool = True) -> str:
+    """
+    Text layer of a PDF in page order, reading only as much as needed:
+    extraction stops once every probe in ``fields`` has matched and no item
+    table runs on into an unread page, or once ``max_chars`` is reached. Engines are tried in preference order; the next one is used
+    only if the previous one fails or runs out of time with nothing read.
+    An empty result means the PDF has no text layer.
+    """
+    file.seek(0)
+    data = file.read()
+    for engine in preferred_engines():
+        deadline = time.monotonic() + engine_timeout(engine)
         try:
-            file.seek(0)
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-            return text
+            pages = _read_pages(iter_pdf_pages(data, engine, parallel), fields, max_chars, deadline)
+        except EngineTimeout as timeout:
+            pages = timeout.args[0]
+            logger.warning("PDF engine %s timed out after %d pages", engine, len(pages))
+            if not any(pages.values()):
+                continue
         except Exception:
-            return ""
+            logger.warning("PDF engine %s failed", engine, exc_info=True)
+            continue
+        return "\n".join(pages[i] for i in sorted(pages))
+    return ""
+
+
+def extract_text_from_pdf(file: UploadedFile) -> str:
+    """Extract all text from a PDF file."""
+    return extract_pdf_text(file, max_chars=None)
+
+
+def ocr_pdf(file: UploadedFile, fields: Iterable[str] = (), max_chars: Optional[int] = PDF_TEXT_BUDGET) -> str:
+    """OCR a scanned PDF page by page, rendered with PDFium; same stopping rules."""
+    if not (TESSERACT_AVAILABLE and "pdfium" in ENGINES):
+        return ""
+    file.seek(0)
+    try:
+        document = open_pdf("pdfium", file.read())
+    except Exception:
+        return ""
+
+    def pages():
+        for i in page_order(len(document)):
+            image = document.render(i, scale=OCR_RENDER_SCALE, max_pixels=EXTRACTION_MAX_IMAGE_PIXELS)
+            # Full pages are laid out in blocks, not a single receipt column.
+            yield i, ocr_image(image, psm=3)
+
+    try:
+        collected = _read_pages(pages(), fields, max_chars)
+    except Exception:
+        return ""
+    finally:
+        document.close()
+    return "\n".join(collected[i] for i in sorted(collected))
 
 
 def extract_text_from_image(file: UploadedFile) -> str:
@@ -60,40 +208,53 @@ def extract_text_from_image(file: UploadedFile) -> str:
     
     try:
         file.seek(0)
-        image = Image.open(file)
-        text = pytesseract.image_to_string(image)
-        return text
+        return ocr_image(Image.open(file))
     except Exception:
         return ""
 
 
-def extract_text_from_file(file: UploadedFile) -> str:
-    """Extract text from file (PDF or image)."""
+def extract_text_from_file(file: UploadedFile, fields: Iterable[str] = (), max_chars: Optional[int] = PDF_TEXT_BUDGET, parallel: bool = True) -> str:
+    """
+    Extract text from file (PDF or image). ``fields``/``max_chars`` bound PDF
+    reading; ``parallel=False`` keeps long PDFs out of the process pool.
+    """
 
     content_type = getattr(file, "content_type", "") or ""
     name = getattr(file, "name", "") or ""
 
 
     if "pdf" in content_type.lower() or name.lower().endswith(".pdf"):
-        return extract_text_from_pdf(file)
+        # OCR only when there is no text layer to read.
+        return extract_pdf_text(file, fields, max_chars, parallel) or ocr_pdf(file, fields, max_chars)
     elif "image" in content_type.lower() or any(
         name.lower().endswith(ext) for ext in [".png", ".jpg", ".jpeg", ".gif"]
     ):
         return extract_text_from_image(file)
     else:
     
-        text = extract_text_from_pdf(file)
+        text = extract_pdf_text(file, fields, max_chars, parallel)
         if not text:
             text = extract_text_from_image(file)
         return text
 
 
+def _source(client, ai_result) -> str:
+    """
+    Where the fields came from: ``llm``, ``regex`` (no LLM configured) or
+    ``regex_fallback`` (the LLM was configured but gave no answer in time).
+    """
+    if ai_result:
+        return "llm"
+    return "regex_fallback" if client.enabled else "regex"
+
+
 def extract_proforma_data(file: UploadedFile) -> Dict[str, Any]:
     """
     Extract key data from proforma invoice/quotation.
     Returns: vendor, items, prices, terms, total_amount
     """
-    text = extract_text_from_file(file)
+    outcome = extract_text_sandboxed(file, fields=("vendor", "total"), max_chars=PDF_TEXT_BUDGET)
+    text = outcome.text
     
     if not text:
         return {
@@ -102,86 +263,33 @@ def extract_proforma_data(file: UploadedFile) -> Dict[str, Any]:
             "total_amount": 0.0,
             "terms": "",
             "raw_text": "",
+            "extraction": outcome.as_dict(),
         }
 
-    ai_result: Dict[str, Any] = {}
-    if OPENAI_AVAILABLE:
-        try:
-            client = OpenAI()
-            prompt = f"""Extract structured data from this proforma invoice/quotation:
+    prompt = f"""Extract structured data from this proforma invoice/quotation:
 {text[:3000]}
 
 Return JSON with: vendor (company name), items (array of {{description, quantity, unit_price}}), total_amount (number), terms (payment terms).
 """
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a data extraction assistant. Return only valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-            )
-            ai_result = json.loads(response.choices[0].message.content)
-        except Exception:
-            ai_result = {}
-
-  
-    vendor = ai_result.get("vendor", "") if isinstance(ai_result, dict) else ""
-    items = ai_result.get("items", []) if isinstance(ai_result, dict) else []
-    total_amount = float(ai_result.get("total_amount", 0.0)) if isinstance(ai_result, dict) else 0.0
-    terms = ai_result.get("terms", "") if isinstance(ai_result, dict) else ""
+    # None when no key is configured or the provider is slow or failing.
+    client = get_client()
+    ai_result = client.extract_json(SYSTEM_PROMPT, prompt) or {}
 
-    
-    if not vendor:
-  
-        vendor_match = re.search(r"(?:vendor|supplier|company|from)\s*[:\-]\s*([^\n\r]+)", text, re.IGNORECASE)
-        if vendor_match:
-            vendor = vendor_match.group(1).strip()
-        else:
-
-            for line in text.splitlines():
-                if re.search(r"vendor", line, re.IGNORECASE):
-                    parts = line.split(":", 1)
-                    if len(parts) == 2:
-                        candidate = parts[1].strip()
-                        if candidate:
-                            vendor = candidate
-                            break
+    vendor = ai_result.get("vendor") or ""
+    items = ai_result.get("items") or []
+    try:
+        total_amount = float(ai_result.get("total_amount") or 0.0)
+    except (TypeError, ValueError):
+        total_amount = 0.0
+    terms = ai_result.get("terms") or ""
 
- 
-    if not vendor:
-        for line in text.splitlines():
-            cleaned = line.strip()
-            if not cleaned:
-                continue
     
-            if re.search(r"proforma|invoice|quotation|quote", cleaned, re.IGNORECASE):
-                continue
-            vendor = cleaned
-            break
-
-
-    if not total_amount:
-        total_matches = re.findall(r"(?:total|amount|sum):\s*\$?(\d+[.,]?\d*)", text, re.IGNORECASE)
-        if total_matches:
-            try:
-                total_amount = float(total_matches[-1].replace(",", ""))
-            except ValueError:
-                total_amount = 0.0
-
-    if not items:
-      
-        item_pattern = r"(\d+)\s*x?\s*([A-Za-z\s]+?)\s*(?:@|at)?\s*\$?(\d+[.,]?\d*)"
-        item_matches = re.findall(item_pattern, text, re.IGNORECASE)
-        for match in item_matches[:10]:
-            try:
-                items.append({
-                    "description": match[1].strip(),
-                    "quantity": int(match[0]),
-                    "unit_price": float(match[2].replace(",", "")),
-                })
-            except ValueError:
-                continue
+    if not (vendor and items and total_amount and terms):
+        parsed = parse_text(text)
+        vendor = vendor or parsed["vendor"]
+        items = items or parsed["items"]
+        total_amount = total_amount or parsed["total_amount"]
+        terms = terms or parsed["terms"]
 
     return {
         "vendor": vendor or "Unknown Vendor",
@@ -189,6 +297,7 @@ Return JSON with: vendor (company name), items (array of {{description, quantity
         "total_amount": total_amount,
         "terms": terms,
         "raw_text": text[:500],
+        "extraction": dict(outcome.as_dict(), source=_source(client, ai_result)),
     }
 
 
@@ -197,7 +306,8 @@ def extract_receipt_data(file: UploadedFile) -> Dict[str, Any]:
     Extract data from receipt.
     Returns: seller, items, prices, total_amount
     """
-    text = extract_text_from_file(file)
+    outcome = extract_text_sandboxed(file, fields=("seller", "total"), max_chars=PDF_TEXT_BUDGET)
+    text = outcome.text
     
     if not text:
         return {
@@ -205,66 +315,33 @@ def extract_receipt_data(file: UploadedFile) -> Dict[str, Any]:
             "items": [],
             "total_amount": 0.0,
             "raw_text": "",
+            "extraction": outcome.as_dict(),
         }
     
   
-    if OPENAI_AVAILABLE:
-        try:
-            client = OpenAI()
-            prompt = f"""Extract structured data from this receipt:
+    prompt = f"""Extract structured data from this receipt:
 {text[:3000]}
 
 Return JSON with: seller (store/vendor name), items (array of {{description, quantity, unit_price}}), total_amount (number).
 """
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a data extraction assistant. Return only valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-            )
-            result = json.loads(response.choices[0].message.content)
-            result["raw_text"] = text[:500]
-            return result
-        except Exception:
-            pass
-    
-
-    seller = ""
-    items = []
-    total_amount = 0.0
-    
-  
-    seller_match = re.search(r"(?:seller|store|vendor|from):\s*([A-Z][A-Za-z\s&]+)", text, re.IGNORECASE)
-    if seller_match:
-        seller = seller_match.group(1).strip()
-
-    total_matches = re.findall(r"(?:total|amount|sum):\s*\$?(\d+[.,]?\d*)", text, re.IGNORECASE)
-    if total_matches:
-        try:
-            total_amount = float(total_matches[-1].replace(",", ""))
-        except ValueError:
-            pass
-    
-
-    item_pattern = r"(\d+)\s*x?\s*([A-Za-z\s]+?)\s*(?:@|at)?\s*\$?(\d+[.,]?\d*)"
-    item_matches = re.findall(item_pattern, text, re.IGNORECASE)
-    for match in item_matches[:10]:
-        try:
-            items.append({
-                "description": match[1].strip(),
-                "quantity": int(match[0]),
-                "unit_price": float(match[2].replace(",", "")),
-            })
-        except ValueError:
-            continue
+    client = get_client()
+    result = client.extract_json(SYSTEM_PROMPT, prompt)
+    if result is not None:
+        result["raw_text"] = text[:500]
+        result["extraction"] = dict(outcome.as_dict(), source="llm")
+        return result
+
+    parsed = parse_text(text)
+    seller = parsed["seller"]
+    items = parsed["items"]
+    total_amount = parsed["total_amount"]
     
     return {
         "seller": seller or "Unknown Seller",
         "items": items,
         "total_amount": total_amount,
         "raw_text": text[:500],
+        "extraction": dict(outcome.as_dict(), source=_source(client, result)),
     }
 
 
@@ -300,29 +377,14 @@ def validate_receipt_against_po(receipt_data: Dict[str, Any], po_data: Dict[str,
             validated = False
     
 
-    receipt_items = receipt_data.get("items", [])
+    receipt_items = [item for item in receipt_data.get("items") or [] if isinstance(item, dict)]
     po_items = po_data.get("item_snapshot", [])
-    
-    if len(receipt_items) != len(po_items):
-        discrepancies.append({
-            "type": "item_count_mismatch",
-            "message": f"Receipt has {len(receipt_items)} items, PO has {len(po_items)} items",
-        })
-        validated = False
-    
+    if receipt_items or po_items:
+        item_issues = item_discrepancies(po_items, receipt_items)
+        if item_issues:
+            discrepancies.extend(item_issues)
+            validated = False
 
-    if receipt_items and po_items:
-        receipt_descriptions = [item.get("description", "").lower() for item in receipt_items]
-        po_descriptions = [item.get("description", "").lower() for item in po_items]
-        
-        for po_desc in po_descriptions:
-            if not any(po_desc in rec_desc or rec_desc in po_desc for rec_desc in receipt_descriptions):
-                discrepancies.append({
-                    "type": "item_mismatch",
-                    "message": f"PO item '{po_desc}' not found in receipt",
-                })
-                validated = False
-    
     return {
         "validated": validated,
         "discrepancies": discrepancies,
@@ -0,0 +1,169 @@
+"""
+Serving stored documents (proformas, purchase order PDFs and receipts).
+
+``FILE_DOWNLOAD_MODE`` decides who sends the bytes once Django has checked
+the request:
+
+- ``python`` (default): the app worker streams the file and answers single
+  ``Range`` requests itself.
+- ``x-accel-redirect``: nginx. The response carries only headers and
+  ``X-Accel-Redirect: <FILE_DOWNLOAD_ACCEL_PREFIX><storage name>``, which
+  must map to an ``internal`` location aliased to MEDIA_ROOT. nginx
+  sends the body and handles ranges.
+- ``x-sendfile``: Apache (mod_xsendfile) or lighttpd, given the absolute path.
+
+In every mode the permission check, 304 / 412 handling, ``ETag``,
+``Last-Modified`` and ``Accept-Ranges`` come from here. Purchase order PDFs
+are stored under a name that ends in a hash of their content and are never
+rewritten, so their ETag is that hash and they are cached as immutable.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from .conditional import Validators
+
+MODES = ("python", "x-accel-redirect", "x-sendfile")
+MODE = getattr(settings, "FILE_DOWNLOAD_MODE", "python")
+ACCEL_PREFIX = getattr(settings, "FILE_DOWNLOAD_ACCEL_PREFIX", "/protected-media/")
+CHUNK_SIZE = getattr(settings, "FILE_DOWNLOAD_CHUNK_SIZE", 64 * 1024)
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+CONTENT_HASH = re.compile(r"-([0-9a-f]{16})\.[A-Za-z0-9]+$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def content_addressed_name(filename, data):
+    """``filename`` with a hash of ``data`` before the extension."""
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}-{hashlib.sha256(data).hexdigest()[:16]}{ext}"
+
+
+def content_hash(name):
+    match = CONTENT_HASH.search(name or "")
+    return match.group(1) if match else None
+
+
+def parse_range(header, size):
+    """
+    The inclusive ``(start, end)`` of a single byte range, or None to send the
+    whole file (malformed headers and multiple ranges are ignored, as RFC 9110
+    allows). Raises RangeNotSatisfiable when the range lies past the end.
+    """
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                raise RangeNotSatisfiable
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start < 0 or (end is not None and end < start):
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+def range_applies(request, validators):
+    """``If-Range``: only honour Range if the client's copy is still current."""
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', "W/")):
+        # Strong comparison; weak tags never match.
+        return if_range == validators.etag
+    return parse_http_date_safe(if_range) == validators.timestamp
+
+
+def read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, field_file, filename, immutable=False, mode=None):
+    """Response that downloads ``field_file`` as ``filename``."""
+    mode = mode or MODE
+    if mode not in MODES:
+        raise ValueError(f"FILE_DOWNLOAD_MODE must be one of {', '.join(MODES)}, not {mode!r}.")
+
+    path = field_file.path
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404("File not found on server")
+
+    digest = content_hash(field_file.name)
+    immutable = immutable and digest is not None
+    etag = quote_etag(digest) if digest else f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    validators = Validators(etag, int(stat.st_mtime))
+
+    response = validators.not_modified(request)
+    if response is not None:
+        return finish(response, validators, immutable)
+
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if mode == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = ACCEL_PREFIX.rstrip("/") + "/" + quote(field_file.name)
+    elif mode == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = path
+    else:
+        byte_range = None
+        if "HTTP_RANGE" in request.META and range_applies(request, validators):
+            try:
+                byte_range = parse_range(request.META["HTTP_RANGE"], stat.st_size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{stat.st_size}"
+                return finish(response, validators, immutable)
+        if byte_range is None:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+            # Also the block size handed to wsgi.file_wrapper; Django's default is 4 KiB.
+            response.block_size = CHUNK_SIZE
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(path, start, end - start + 1), status=206, content_type=content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = str(end - start + 1)
+
+    response["Content-Disposition"] = content_disposition_header(True, filename)
+    return finish(response, validators, immutable)
+
+
+def finish(response, validators, immutable):
+    response["ETag"] = validators.etag
+    if validators.timestamp is not None:
+        response["Last-Modified"] = http_date(validators.timestamp)
+    response["Accept-Ranges"] = "bytes"
+    # Downloads need a login, so browsers may keep them but shared caches may not.
+    if immutable:
+        response["Cache-Control"] = f"private, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response["Cache-Control"] = "private, no-cache"
+    response["Vary"] = "Authorization"
+    return response
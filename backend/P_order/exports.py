@@ -0,0 +1,122 @@
+"""
+Streaming CSV / NDJSON exports for reconciliation.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` (a server-side
+cursor on PostgreSQL) and written out one at a time, so memory stays flat and
+the first bytes go out before the query has been fully read.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import PurchaseOrder, RequestItem
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() just returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def line_item_rows(requests):
+    """One row per RequestItem, with its request and purchase order."""
+    columns = [
+        ("request_id", "purchase_request_id"),
+        ("title", "purchase_request__title"),
+        ("status", "purchase_request__status"),
+        ("created_at", "purchase_request__created_at"),
+        ("created_by", "purchase_request__created_by__username"),
+        ("request_amount", "purchase_request__amount"),
+        ("item_id", "id"),
+        ("description", "description"),
+        ("quantity", "quantity"),
+        ("unit_price", "unit_price"),
+        ("po_number", "purchase_request__purchase_order__po_number"),
+        ("vendor", "purchase_request__purchase_order__vendor"),
+    ]
+    header = [name for name, _ in columns] + ["line_total"]
+    rows = (
+        RequestItem.objects.filter(purchase_request__in=requests.values("pk"))
+        .order_by("purchase_request_id", "id")
+        .values_list(*(lookup for _, lookup in columns))
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    quantity_index = header.index("quantity")
+    price_index = header.index("unit_price")
+    return header, (row + (row[quantity_index] * row[price_index],) for row in rows)
+
+
+def purchase_request_rows(requests):
+    """One row per PurchaseRequest."""
+    columns = [
+        ("request_id", "id"),
+        ("title", "title"),
+        ("status", "status"),
+        ("amount", "amount"),
+        ("created_at", "created_at"),
+        ("updated_at", "updated_at"),
+        ("created_by", "created_by__username"),
+        ("approved_by", "approved_by__username"),
+        ("approved_level", "approved_level"),
+        ("po_number", "purchase_order__po_number"),
+        ("vendor", "purchase_order__vendor"),
+    ]
+    rows = (
+        requests.order_by("id")
+        .values_list(*(lookup for _, lookup in columns))
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    return [name for name, _ in columns], rows
+
+
+def purchase_order_rows(requests):
+    """One row per item in each PurchaseOrder.item_snapshot."""
+    header = [
+        "po_number", "request_id", "vendor", "po_total", "created_at",
+        "description", "quantity", "unit_price", "line_total",
+    ]
+    orders = (
+        PurchaseOrder.objects.filter(purchase_request__in=requests.values("pk"))
+        .order_by("id")
+        .values_list("po_number", "purchase_request_id", "vendor", "total_amount", "created_at", "item_snapshot")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    def rows():
+        for *order, snapshot in orders:
+            for item in snapshot or [{}]:
+                quantity = item.get("quantity")
+                unit_price = item.get("unit_price")
+                line_total = quantity * unit_price if quantity is not None and unit_price is not None else None
+                yield tuple(order) + (item.get("description"), quantity, unit_price, line_total)
+
+    return header, rows()
+
+
+DATASETS = {
+    "line_items": line_item_rows,
+    "requests": purchase_request_rows,
+    "purchase_orders": purchase_order_rows,
+}
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+OUTPUTS = {
+    "csv": (stream_csv, "text/csv"),
+    "ndjson": (stream_ndjson, "application/x-ndjson"),
+}
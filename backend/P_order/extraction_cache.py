@@ -0,0 +1,111 @@
+"""
+Content-addressed cache for proforma and receipt extraction.
+
+Results are keyed by the SHA-256 of the file bytes, the document kind and
+``EXTRACTOR_VERSION``. A bounded in-process LRU sits in front of the
+``ExtractionCacheEntry`` table, so the same document is never parsed twice,
+whichever worker sees it. Results parsed by regex only because the LLM was
+unavailable are returned but not stored. Bumping the version makes old
+entries unreachable; they are deleted as documents are re-extracted.
+"""
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError
+
+from .document_processor import EXTRACTOR_VERSION, extract_proforma_data, extract_receipt_data
+from .models import ExtractionCacheEntry
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class LRUCache:
+    """A small thread-safe LRU mapping."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+memory_cache = LRUCache(getattr(settings, "EXTRACTION_CACHE_SIZE", 256))
+
+
+def file_digest(file):
+    """SHA-256 of a file-like object's bytes; leaves it rewound."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def cached_extraction(kind, file, extractor, digest=None):
+    """Return ``extractor(file)``, reusing any earlier result for the same bytes."""
+    digest = digest or file_digest(file)
+    key = (digest, kind, EXTRACTOR_VERSION)
+
+    result = memory_cache.get(key)
+    if result is None:
+        result = (
+            ExtractionCacheEntry.objects.filter(sha256=digest, kind=kind, extractor_version=EXTRACTOR_VERSION)
+            .values_list("result", flat=True)
+            .first()
+        )
+        if result is None:
+            result = extractor(file)
+            extraction = result.get("extraction", {})
+            if extraction.get("status", "ok") != "ok" or extraction.get("source") == "regex_fallback":
+                # Timeouts, failures and stand-ins for an unavailable LLM may
+                # not recur; don't pin them.
+                return copy.deepcopy(result)
+            ExtractionCacheEntry.objects.filter(sha256=digest, kind=kind).exclude(
+                extractor_version=EXTRACTOR_VERSION
+            ).delete()
+            try:
+                ExtractionCacheEntry.objects.create(
+                    sha256=digest, kind=kind, extractor_version=EXTRACTOR_VERSION, result=result,
+                )
+            except IntegrityError:
+                pass  # Extracted concurrently elsewhere; both results are equivalent.
+        memory_cache.set(key, result)
+
+    # Callers are free to modify what they get back.
+    return copy.deepcopy(result)
+
+
+def extract_proforma(file):
+    return cached_extraction("proforma", file, extract_proforma_data)
+
+
+def extract_receipt(file):
+    return cached_extraction("receipt", file, extract_receipt_data)
@@ -0,0 +1,95 @@
+"""
+Query-string filters for purchase request listings.
+
+Every filter is translated into a queryset lookup so the database does the
+work; nothing here loads rows into Python.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import APPROVAL_LEVEL_BY_ROLE, PurchaseRequest
+from .querysets import awaiting_level
+
+
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+
+def _parse_bound(value, field, end=False):
+    """Turn a date or datetime string into an aware datetime bound."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({field: ["Expected a date (YYYY-MM-DD) or ISO datetime."]})
+        if end:
+            day += timedelta(days=1)
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_amount(value, field):
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError):
+        raise ValidationError({field: ["Expected a number."]})
+    # Decimal accepts "NaN" and "Infinity", which the database cannot compare.
+    if not amount.is_finite():
+        raise ValidationError({field: ["Expected a number."]})
+    return amount
+
+
+def filter_purchase_requests(queryset, params, user):
+    """
+    Apply list filters from ``params``:
+    status, created_after, created_before, min_amount, max_amount,
+    created_by and awaiting_my_level.
+    """
+    status_value = params.get("status")
+    if status_value:
+        statuses = [s.strip() for s in status_value.split(",") if s.strip()]
+        allowed = {choice for choice, _ in PurchaseRequest.STATUS_CHOICES}
+        unknown = [s for s in statuses if s not in allowed]
+        if unknown:
+            raise ValidationError({"status": [f"Unknown status: {', '.join(unknown)}."]})
+        queryset = queryset.filter(status__in=statuses)
+
+    created_after = params.get("created_after")
+    if created_after:
+        queryset = queryset.filter(created_at__gte=_parse_bound(created_after, "created_after"))
+
+    created_before = params.get("created_before")
+    if created_before:
+        bound = _parse_bound(created_before, "created_before", end=True)
+        if parse_datetime(created_before) is None:
+            queryset = queryset.filter(created_at__lt=bound)
+        else:
+            queryset = queryset.filter(created_at__lte=bound)
+
+    min_amount = params.get("min_amount")
+    if min_amount:
+        queryset = queryset.filter(amount__gte=_parse_amount(min_amount, "min_amount"))
+
+    max_amount = params.get("max_amount")
+    if max_amount:
+        queryset = queryset.filter(amount__lte=_parse_amount(max_amount, "max_amount"))
+
+    created_by = params.get("created_by")
+    if created_by:
+        try:
+            queryset = queryset.filter(created_by_id=int(created_by))
+        except ValueError:
+            raise ValidationError({"created_by": ["Expected a user id."]})
+
+    if str(params.get("awaiting_my_level", "")).lower() in TRUE_VALUES:
+        level = APPROVAL_LEVEL_BY_ROLE.get(getattr(user, "role", None))
+        if level is None:
+            return queryset.none()
+        queryset = awaiting_level(queryset, level)
+
+    return queryset
@@ -0,0 +1,255 @@
+"""
+Database-backed queue for document work that is too slow for a request.
+
+Upload endpoints store the file, ``enqueue`` a DocumentJob and answer 202.
+Finance approval does the same for the PO PDF, which is then emailed through
+the outbox (notifications.outbox).
+``manage.py run_doc_worker`` claims queued jobs with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so any number of workers can share the
+table without a broker, runs the handler registered for the job's kind and
+records the outcome. Failed jobs are retried with exponential backoff; jobs
+left ``running`` by a worker that died are reclaimed after ``LOCK_TIMEOUT``,
+or failed if that was their last attempt.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from notifications.outbox import queue_email
+
+from .document_processor import validate_receipt_against_po
+from .downloads import content_addressed_name
+from .extraction_cache import extract_proforma, extract_receipt
+from .models import DocumentJob, PurchaseOrder, PurchaseRequest, RequestItem
+from .po_pdf import render_purchase_order
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, "DOCUMENT_JOB_MAX_ATTEMPTS", 3)
+LOCK_TIMEOUT = timedelta(seconds=getattr(settings, "DOCUMENT_JOB_LOCK_TIMEOUT", 600))
+RETRY_DELAY = timedelta(seconds=getattr(settings, "DOCUMENT_JOB_RETRY_DELAY", 30))
+
+
+def enqueue(kind, purchase_request, created_by, receipt=None):
+    """Queue document work for a file that has already been stored."""
+    return DocumentJob.objects.create(
+        kind=kind,
+        purchase_request=purchase_request,
+        receipt=receipt,
+        created_by=created_by,
+    )
+
+
+def claim_next(worker_id):
+    """
+    Lock and mark the oldest runnable job as ours, or return None. A job
+    reclaimed from a dead worker after its last attempt is failed instead.
+    """
+    while True:
+        now = timezone.now()
+        runnable = Q(status="queued", run_after__lte=now) | Q(status="running", locked_at__lt=now - LOCK_TIMEOUT)
+        with transaction.atomic():
+            job = (
+                DocumentJob.objects.select_for_update(skip_locked=True)
+                .filter(runnable)
+                .order_by("run_after", "id")
+                .first()
+            )
+            if job is None:
+                return None
+            # Backends without row locks (SQLite) fall back to compare-and-set.
+            unchanged = DocumentJob.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts)
+            if job.attempts >= MAX_ATTEMPTS:
+                if unchanged.update(
+                    status="failed",
+                    error=f"Worker {job.locked_by or '?'} stopped during the last attempt.",
+                    locked_by="",
+                    locked_at=None,
+                    finished_at=now,
+                ):
+                    _dead_letter(job)
+                continue
+            claimed = unchanged.update(
+                status="running",
+                attempts=job.attempts + 1,
+                locked_by=worker_id,
+                locked_at=now,
+            )
+        if not claimed:
+            return None
+        job.refresh_from_db()
+        return job
+
+
+def _dead_letter(job):
+    job.refresh_from_db()
+    logger.error("Document job %s failed after %s attempts: %s", job.pk, job.attempts, job.error)
+    on_failure = FAILURE_HANDLERS.get(job.kind)
+    if on_failure is not None:
+        on_failure(job)
+
+
+def run_job(job):
+    """Run a claimed job and store its result, scheduling a retry on failure."""
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"No handler for job kind '{job.kind}'.")
+        result = handler(job)
+    except Exception as e:
+        logger.exception("Document job %s failed", job.pk)
+        job.error = str(e)[:2000]
+        if job.attempts < MAX_ATTEMPTS and handler is not None:
+            job.status = "queued"
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+        else:
+            job.status = "failed"
+            job.finished_at = timezone.now()
+            on_failure = FAILURE_HANDLERS.get(job.kind)
+            if on_failure is not None:
+                on_failure(job)
+    else:
+        job.status = "succeeded"
+        job.result = result
+        job.error = ""
+        job.finished_at = timezone.now()
+    job.locked_by = ""
+    job.locked_at = None
+    job.save(update_fields=["status", "result", "error", "run_after", "locked_by", "locked_at", "finished_at"])
+    return job
+
+
+def _items_from_extraction(items):
+    rows = []
+    for item in items:
+        try:
+            description = str(item.get("description", "")).strip()[:512]
+            quantity = int(item.get("quantity", 1))
+            unit_price = Decimal(str(item.get("unit_price", 0))).quantize(Decimal("0.01"))
+        except (AttributeError, TypeError, ValueError, InvalidOperation):
+            continue
+        if description and quantity > 0:
+            rows.append((description, quantity, unit_price))
+    return rows
+
+
+def process_proforma(job):
+    """Extract the proforma, store it on the request and fill in items if none were given."""
+    with job.purchase_request.proforma.open("rb") as proforma:
+        data = extract_proforma(proforma)
+
+    created = 0
+    with transaction.atomic():
+        purchase = PurchaseRequest.objects.select_for_update().get(pk=job.purchase_request_id)
+        purchase.proforma_data = data
+        update_fields = ["proforma_data", "updated_at"]
+        if not purchase.items.exists():
+            rows = _items_from_extraction(data.get("items") or [])
+            RequestItem.objects.bulk_create(
+                RequestItem(purchase_request=purchase, description=d, quantity=q, unit_price=p)
+                for d, q, p in rows
+            )
+            created = len(rows)
+            if rows:
+                purchase.amount = sum(q * p for _, q, p in rows)
+                update_fields.append("amount")
+        purchase.save(update_fields=update_fields)
+
+    return {
+        "vendor": data.get("vendor", ""),
+        "total_amount": data.get("total_amount", 0.0),
+        "items_created": created,
+        "extraction": data.get("extraction"),
+    }
+
+
+def process_receipt(job):
+    """Extract the receipt and validate it against the request's purchase order."""
+    receipt = job.receipt
+    with receipt.receipt_file.open("rb") as receipt_file:
+        data = extract_receipt(receipt_file)
+
+    po = job.purchase_request.purchase_order
+    po_data = {
+        "vendor": po.vendor,
+        "item_snapshot": po.item_snapshot,
+        "total_amount": float(po.total_amount),
+    }
+    validation = validate_receipt_against_po(data, po_data)
+
+    receipt.extracted_data = data
+    receipt.validated = validation["validated"]
+    receipt.discrepancies = validation["discrepancies"]
+    receipt.save(update_fields=["extracted_data", "validated", "discrepancies"])
+    return {
+        "validated": validation["validated"],
+        "discrepancies": validation["discrepancies"],
+        "extraction": data.get("extraction"),
+    }
+
+
+def process_purchase_order(job):
+    """
+    Render the PO PDF and queue the email that carries it to the requester.
+    Each step is skipped when an earlier attempt already finished it, so
+    retries never render or mail twice.
+    """
+    po = PurchaseOrder.objects.select_related("purchase_request__created_by").get(
+        purchase_request_id=job.purchase_request_id
+    )
+    purchase = po.purchase_request
+
+    if not po.po_file:
+        pdf_bytes = render_purchase_order(po, job.created_by)
+        # Named by content so downloads can be cached as immutable.
+        po.po_file.save(content_addressed_name(f"{po.po_number}.pdf", pdf_bytes), ContentFile(pdf_bytes), save=False)
+        po.file_status = "ready"
+        po.save(update_fields=["po_file", "file_status"])
+
+    if po.notified_at is None:
+        with transaction.atomic():
+            queue_email(
+                subject="Purchase Request Fully Approved",
+                body=(
+                    f"Hello {purchase.created_by.username},\n\n"
+                    f"Your purchase request '{purchase.title}' has been fully approved.\n"
+                    f"Purchase Order Number: {po.po_number}\n\n"
+                    f"The PDF Purchase Order is attached."
+                ),
+                to=purchase.created_by.email,
+                attachments=[(f"{po.po_number}.pdf", po.po_file.name, "application/pdf")],
+            )
+            po.notified_at = timezone.now()
+            po.save(update_fields=["notified_at"])
+
+    return {
+        "po_number": po.po_number,
+        "file_status": po.file_status,
+        "notified_at": po.notified_at.isoformat(),
+    }
+
+
+def purchase_order_failed(job):
+    """Out of retries: record that the PDF never got rendered."""
+    po = PurchaseOrder.objects.filter(purchase_request_id=job.purchase_request_id, po_file="").first()
+    if po is not None:
+        # A save, not update(), so the signals touch the request and drop its cached responses.
+        po.file_status = "failed"
+        po.save(update_fields=["file_status"])
+
+
+HANDLERS = {
+    "proforma": process_proforma,
+    "receipt": process_receipt,
+    "purchase_order": process_purchase_order,
+}
+# Called once a job has failed for the last time.
+FAILURE_HANDLERS = {
+    "purchase_order": purchase_order_failed,
+}
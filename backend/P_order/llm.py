@@ -0,0 +1,226 @@
+"""
+Shared client for LLM extraction over an OpenAI-compatible chat API.
+
+One client per process keeps a persistent HTTP connection per thread. Every
+call has a deadline (``LLM_TIMEOUT``) and a single retry for a stale
+keep-alive connection. No more than ``LLM_MAX_CONCURRENCY`` calls are in
+flight; callers that cannot get a slot before their deadline give up rather
+than queue. A circuit breaker opens after ``LLM_BREAKER_THRESHOLD``
+consecutive upstream failures and short-circuits calls for
+``LLM_BREAKER_COOLDOWN`` seconds, then lets one trial call through.
+
+Whenever a call gives no usable answer, ``extract_json`` returns None and
+the caller falls back to regex extraction.
+"""
+import http.client
+import json
+import logging
+import re
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LLM_BREAKER_THRESHOLD = getattr(settings, "LLM_BREAKER_THRESHOLD", 5)
+LLM_BREAKER_COOLDOWN = getattr(settings, "LLM_BREAKER_COOLDOWN", 60)
+# Upstream statuses that mean "degraded" rather than "bad request".
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+class UpstreamError(Exception):
+    """The provider failed or was too slow; counts against the breaker."""
+
+
+class CircuitBreaker:
+    """Closed -> open after ``threshold`` consecutive failures -> half-open after ``cooldown``."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class LLMClient:
+    def __init__(self, base_url, api_key, model, timeout, max_concurrency,
+                 breaker_threshold=LLM_BREAKER_THRESHOLD, breaker_cooldown=LLM_BREAKER_COOLDOWN):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.stats = {"calls": 0, "succeeded": 0, "failed": 0, "short_circuited": 0, "busy": 0}
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.api_key and self.host)
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _connection(self, timeout):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            factory = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            connection = factory(self.host, self.port, timeout=timeout)
+            self._local.connection = connection
+            self._local.used = False
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+        self._local.connection = None
+
+    def _post(self, body, deadline):
+        """POST to the chat endpoint, retrying once if a reused connection had gone stale."""
+        for attempt in (1, 2):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise UpstreamError("deadline exceeded")
+            connection = self._connection(remaining)
+            reused = self._local.used
+            try:
+                connection.request("POST", self.path, body=body, headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                })
+                response = connection.getresponse()
+                payload = response.read()
+                self._local.used = True
+            except (socket.timeout, TimeoutError) as e:
+                self._drop_connection()
+                raise UpstreamError("timed out") from e
+            except (http.client.HTTPException, OSError) as e:
+                self._drop_connection()
+                if reused and attempt == 1:
+                    continue
+                raise UpstreamError(f"connection failed: {e}") from e
+            if response.will_close:
+                self._drop_connection()
+            return response.status, payload
+
+    def extract_json(self, system, prompt, timeout=None):
+        """The model's JSON answer as a dict, or None when it could not be had in time."""
+        if not self.enabled:
+            return None
+        self._count("calls")
+        if self.breaker.state == "open":
+            self._count("short_circuited")
+            return None
+
+        deadline = time.monotonic() + (timeout or self.timeout)
+        if not self.slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self._count("busy")
+            return None
+        try:
+            # Re-checked with a slot held: only one half-open trial may run.
+            if not self.breaker.allow():
+                self._count("short_circuited")
+                return None
+            body = json.dumps({
+                "model": self.model,
+                "temperature": 0.1,
+                "messages": [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt},
+                ],
+            })
+            status, payload = self._post(body, deadline)
+            if status in RETRYABLE_STATUSES:
+                raise UpstreamError(f"HTTP {status}")
+        except UpstreamError as e:
+            self.breaker.record_failure()
+            self._count("failed")
+            logger.warning("LLM call failed: %s", e)
+            return None
+        finally:
+            self.slots.release()
+
+        self.breaker.record_success()
+        try:
+            if status != 200:
+                raise ValueError(f"HTTP {status}")
+            content = json.loads(payload)["choices"][0]["message"]["content"]
+            result = json.loads(FENCE_RE.sub("", content))
+            if not isinstance(result, dict):
+                raise ValueError("answer is not a JSON object")
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            self._count("failed")
+            logger.warning("LLM answer unusable: %s", e)
+            return None
+        self._count("succeeded")
+        return result
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client, built from settings on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(
+                base_url=getattr(settings, "OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                api_key=getattr(settings, "OPENAI_API_KEY", ""),
+                model=getattr(settings, "LLM_MODEL", "gpt-3.5-turbo"),
+                timeout=getattr(settings, "LLM_TIMEOUT", 15),
+                max_concurrency=getattr(settings, "LLM_MAX_CONCURRENCY", 4),
+            )
+        return _client
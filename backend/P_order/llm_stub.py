@@ -0,0 +1,94 @@
+"""
+A local stand-in for an OpenAI-compatible chat completions endpoint.
+
+It answers extraction prompts by running the regex parser over the document
+text in the prompt. It can also be told to answer slowly or with an error
+status, so timeouts, the concurrency limit and the circuit breaker can be
+exercised offline. Used by the tests and by ``manage.py run_llm_stub``.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .parsing import parse_text
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API.
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server.record(self.client_address)
+        if not self.path.endswith("/chat/completions"):
+            return self.reply(404, {"error": {"message": "not found"}})
+        if server.delay:
+            time.sleep(server.delay)
+        if server.status != 200:
+            return self.reply(server.status, {"error": {"message": "stub failure"}})
+
+        messages = json.loads(body)["messages"]
+        parsed = parse_text(messages[-1]["content"])
+        answer = {
+            "vendor": parsed["vendor"],
+            "seller": parsed["seller"],
+            "items": parsed["items"],
+            "total_amount": parsed["total_amount"],
+            "terms": parsed["terms"],
+        }
+        self.reply(200, {
+            "id": "stub",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(answer)}}],
+        })
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, status=200, verbose=False):
+        super().__init__((host, port), StubHandler)
+        self.delay = delay
+        self.status = status
+        self.verbose = verbose
+        self.requests = 0
+        self.clients = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record(self, client_address):
+        with self._lock:
+            self.requests += 1
+            self.clients.add(client_address)
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up on a slow answer are expected, not errors.
+        if self.verbose:
+            super().handle_error(request, client_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from P_order.extraction_cache import extract_proforma
+from P_order.models import PurchaseRequest
+
+
+class Command(BaseCommand):
+    help = "Extract and store proforma data for requests uploaded before it was kept."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Re-extract rows that already have data.")
+
+    def handle(self, *args, **options):
+        queryset = PurchaseRequest.objects.exclude(proforma="").exclude(proforma__isnull=True)
+        if not options["force"]:
+            queryset = queryset.filter(proforma_data__isnull=True)
+
+        done = failed = 0
+        # created_by_id is read by the post_save handlers; deferring it costs a query per row.
+        for purchase in queryset.only("id", "proforma", "created_by_id").iterator(chunk_size=100):
+            try:
+                with purchase.proforma.open("rb") as proforma:
+                    data = extract_proforma(proforma)
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"PR-{purchase.id}: {e}")
+                continue
+            purchase.proforma_data = data
+            purchase.save(update_fields=["proforma_data"])
+            done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Stored proforma data for {done} requests ({failed} failed)."))
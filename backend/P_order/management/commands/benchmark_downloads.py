@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from P_order.downloads import MODES, serve_file
+
+
+def drain(response):
+    """Consume the body the way a WSGI server would; returns the bytes the worker produced."""
+    sent = 0
+    for chunk in response:
+        sent += len(chunk)
+    response.close()
+    return sent
+
+
+class Command(BaseCommand):
+    help = "Measure app-worker time per file download in each FILE_DOWNLOAD_MODE."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=float, default=20.0, help="Size of the scanned document served.")
+        parser.add_argument("--downloads", type=int, default=20)
+        parser.add_argument("--range-kb", type=int, default=256, help="Length of the ranged request.")
+        parser.add_argument(
+            "--client-mbps", type=float, default=20.0,
+            help="Client bandwidth used to estimate how long a worker is held while it streams the body.",
+        )
+
+    def handle(self, *args, **options):
+        size = int(options["size_mb"] * 1024 * 1024)
+        range_bytes = options["range_kb"] * 1024
+        factory = RequestFactory()
+
+        with tempfile.TemporaryDirectory() as root:
+            field_file = SimpleNamespace(name="receipts/scan.pdf", path=os.path.join(root, "scan.pdf"))
+            with open(field_file.path, "wb") as f:
+                for _ in range(0, size, 1024 * 1024):
+                    f.write(os.urandom(min(1024 * 1024, size - f.tell())))
+            etag = serve_file(factory.get("/"), field_file, "scan.pdf", mode="x-sendfile")["ETag"]
+
+            cases = (
+                ("full", {}),
+                ("range", {"HTTP_RANGE": f"bytes=0-{range_bytes - 1}"}),
+                ("revalidate", {"HTTP_IF_NONE_MATCH": etag}),
+            )
+            self.stdout.write(
+                f"{'mode':<18}{'request':<12}{'status':>7}{'worker ms':>11}{'body MB':>9}"
+                f"{'held s @' + format(options['client_mbps'], 'g') + 'Mbps':>16}"
+            )
+            for mode in MODES:
+                for label, headers in cases:
+                    request = factory.get("/", **headers)
+                    start = time.perf_counter()
+                    for _ in range(options["downloads"]):
+                        response = serve_file(request, field_file, "scan.pdf", mode=mode)
+                        sent = drain(response)
+                    elapsed = (time.perf_counter() - start) / options["downloads"]
+                    # In python mode the worker writes the body itself, so a slow
+                    # client keeps it busy; offloaded modes return after the headers.
+                    held = elapsed + sent * 8 / (options["client_mbps"] * 1_000_000)
+                    self.stdout.write(
+                        f"{mode:<18}{label:<12}{response.status_code:>7}{elapsed * 1000:>11.3f}"
+                        f"{sent / 1024 / 1024:>9.2f}{held:>16.3f}"
+                    )
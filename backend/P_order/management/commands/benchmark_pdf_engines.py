@@ -0,0 +1,89 @@
+import random
+import time
+from collections import Counter
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from P_order.pdf_engines import ENGINES, open_pdf
+
+WORDS = (
+    "chair desk laptop monitor cable toner paper stapler invoice delivery "
+    "warranty quantity unit price total vendor supplier office kigali ltd"
+).split()
+
+
+def make_document(pages, rng):
+    """A quotation-like PDF and the exact text drawn on it."""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    expected = []
+    for page in range(pages):
+        y = 800
+        for line in range(40):
+            if line % 4 == 0:
+                text = f"{rng.randint(1, 20)} x {rng.choice(WORDS).title()} @ {rng.uniform(1, 900):.2f}"
+            else:
+                text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10)))
+            pdf.setFont("Helvetica", 10)
+            pdf.drawString(50, y, text)
+            expected.append(text)
+            y -= 18
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue(), " ".join(expected)
+
+
+def token_recall(expected, actual):
+    """Share of expected tokens present in the extracted text, with multiplicity."""
+    want = Counter(expected.split())
+    got = Counter(actual.split())
+    return sum((want & got).values()) / max(sum(want.values()), 1)
+
+
+class Command(BaseCommand):
+    help = "Compare PDF text engines on a synthetic reportlab corpus: pages/sec and token recall."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documents", type=int, default=5)
+        parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50])
+        parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        unknown = set(options["engines"]) - set(ENGINES)
+        if unknown:
+            raise CommandError(f"Unknown or unavailable engines: {', '.join(sorted(unknown))}")
+
+        rng = random.Random(options["seed"])
+        corpus = [
+            (pages, *make_document(pages, rng))
+            for pages in options["pages"]
+            for _ in range(options["documents"])
+        ]
+        total_pages = sum(pages for pages, _, _ in corpus)
+        self.stdout.write(f"Corpus: {len(corpus)} documents, {total_pages} pages")
+        self.stdout.write(f"{'engine':<12}{'pages/sec':>12}{'recall':>10}{'errors':>8}")
+
+        for name in options["engines"]:
+            elapsed = 0.0
+            recall = []
+            errors = 0
+            for pages, data, expected in corpus:
+                start = time.perf_counter()
+                try:
+                    document = open_pdf(name, data)
+                    try:
+                        text = "\n".join(document.page_text(i) for i in range(len(document)))
+                    finally:
+                        document.close()
+                except Exception:
+                    errors += 1
+                    text = ""
+                elapsed += time.perf_counter() - start
+                recall.append(token_recall(expected, text))
+            self.stdout.write(
+                f"{name:<12}{total_pages / elapsed:>12.1f}{sum(recall) / len(recall):>10.3f}{errors:>8}"
+            )
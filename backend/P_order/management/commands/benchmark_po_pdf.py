@@ -0,0 +1,81 @@
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from P_order.management.commands.benchmark_pdf_engines import WORDS
+from P_order.pdf_engines import open_pdf
+from P_order.po_pdf import compiled_parts, render_purchase_order
+
+
+def make_po(items, rng):
+    """A purchase order with ``items`` lines, shaped like the model instances the renderer gets."""
+    now = datetime(2025, 1, 15, 9, 30)
+    purchase = SimpleNamespace(
+        id=rng.randint(1, 9999),
+        title="Office refurbishment",
+        description=" ".join(rng.choice(WORDS) for _ in range(30)),
+        created_at=now,
+        updated_at=now,
+    )
+    snapshot = [
+        {
+            "description": f"{n + 1}. " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 8))),
+            "quantity": rng.randint(1, 20),
+            "unit_price": round(rng.uniform(1, 900), 2),
+        }
+        for n in range(items)
+    ]
+    return SimpleNamespace(
+        purchase_request=purchase,
+        po_number=f"PO-{purchase.id}-20250115",
+        vendor="Kigali Office Supplies Ltd",
+        item_snapshot=snapshot,
+        total_amount=sum(i["quantity"] * i["unit_price"] for i in snapshot),
+    )
+
+
+def rows_present(data, po):
+    """Whether every item row, and the table header on every page, made it into the PDF."""
+    document = open_pdf("pdfium", data)
+    try:
+        pages = [document.page_text(i) for i in range(len(document))]
+    finally:
+        document.close()
+    prefixes = [item["description"][:30] for item in po.item_snapshot]
+    # Rows are matched at the start of a line, so "37. ..." is not found in "137. ...".
+    found = [sum(any(line.startswith(prefix) for line in page.splitlines()) for prefix in prefixes) for page in pages]
+    rows_ok = sum(found) == len(prefixes)
+    headers_ok = all("ITEM DESCRIPTION" in page for page, rows in zip(pages, found) if rows)
+    return rows_ok and headers_ok, len(pages)
+
+
+class Command(BaseCommand):
+    help = "Measure purchase order PDFs rendered per second, with and without the cached static template."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, nargs="+", default=[1, 50, 500])
+        parser.add_argument("--documents", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        approver = SimpleNamespace(username="finance", get_full_name=lambda: "Finance Officer")
+        compiled_parts()  # Once per process, as in the worker.
+
+        self.stdout.write(f"{'items':>6}{'pages':>7}{'inline POs/s':>15}{'cached POs/s':>15}{'speedup':>9}{'rows ok':>9}")
+        for items in options["items"]:
+            corpus = [make_po(items, rng) for _ in range(options["documents"])]
+            rates = {}
+            for cached in (False, True):
+                start = time.perf_counter()
+                for po in corpus:
+                    data = render_purchase_order(po, approver, cached=cached)
+                rates[cached] = len(corpus) / (time.perf_counter() - start)
+            ok, pages = rows_present(data, corpus[-1])
+            self.stdout.write(
+                f"{items:>6}{pages:>7}{rates[False]:>15.1f}{rates[True]:>15.1f}"
+                f"{rates[True] / rates[False]:>8.2f}x{'yes' if ok else 'NO':>9}"
+            )
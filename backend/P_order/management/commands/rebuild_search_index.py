@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from P_order.models import PurchaseRequest
+from P_order.search import build_document
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search document for every purchase request."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        ids = PurchaseRequest.objects.order_by("id").values_list("id", flat=True)
+        for pk in ids.iterator(chunk_size=options["batch_size"]):
+            build_document(pk)
+            total += 1
+            if total % options["batch_size"] == 0:
+                self.stdout.write(f"Indexed {total} requests...")
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} purchase requests."))
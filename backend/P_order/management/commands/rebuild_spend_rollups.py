@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from P_order.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the spend rollup tables from purchase orders and rejected requests."
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} spend rollup rows."))
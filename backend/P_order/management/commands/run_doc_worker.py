@@ -0,0 +1,44 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from P_order.jobs import claim_next, run_job
+
+
+class Command(BaseCommand):
+    help = "Process queued document jobs (proforma extraction, receipt validation)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit instead of polling.")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        worker_id = options["worker_id"]
+        processed = 0
+        self.stdout.write(f"Document worker {worker_id} started.")
+        while not self.stopping:
+            close_old_connections()
+            job = claim_next(worker_id)
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+            job = run_job(job)
+            processed += 1
+            self.stdout.write(f"Job {job.id} ({job.kind}): {job.status}")
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs."))
+
+    def stop(self, signum, frame):
+        # Finish the current job, then exit.
+        self.stopping = True
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from P_order.llm_stub import StubLLMServer
+
+
+class Command(BaseCommand):
+    help = "Serve a local OpenAI-compatible stub for offline extraction testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8089)
+        parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering.")
+        parser.add_argument("--status", type=int, default=200, help="HTTP status to answer with.")
+
+    def handle(self, *args, **options):
+        server = StubLLMServer(options["host"], options["port"], options["delay"], options["status"], verbose=True)
+        self.stdout.write(f"Stub LLM listening; set OPENAI_BASE_URL={server.url} and any OPENAI_API_KEY.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,295 @@
+"""
+Line-item matching between a purchase order and a receipt.
+
+Descriptions are normalized once into sets of character trigrams, which
+tolerate OCR slips, plurals and reordered words. Identical descriptions pair
+off straight away. The rest are scored with a Dice-similarity matrix and
+paired one-to-one by a minimum-cost assignment. The matrix is filled from an
+inverted index, so only pairs that share a trigram are scored. The
+assignment is solved separately for each group of items that resemble one
+another, so a long PO stays cheap to check. A group larger than
+``ITEM_ASSIGNMENT_LIMIT`` is paired greedily, best score first, because the
+exact assignment grows with the cube of its size; so is everything when more
+than ``ITEM_ASSIGNMENT_LIMIT`` squared pairs were scored.
+
+Receipt lines left over that still resemble a matched PO item are counted
+towards it. This way an item the receipt prints on two lines is not reported
+as unexpected.
+"""
+import re
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Any, Dict, List
+
+from django.conf import settings
+
+# Pairs scoring below this are never matched.
+ITEM_MATCH_THRESHOLD = getattr(settings, "ITEM_MATCH_THRESHOLD", 0.45)
+# Relative unit price difference tolerated per item.
+ITEM_PRICE_TOLERANCE = getattr(settings, "ITEM_PRICE_TOLERANCE", 0.05)
+# Largest group of look-alike items given the exact assignment (a few ms at 50).
+ITEM_ASSIGNMENT_LIMIT = getattr(settings, "ITEM_ASSIGNMENT_LIMIT", 50)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(description) -> str:
+    """Lowercase alphanumeric words, with simple plurals reduced to the singular."""
+    words = []
+    for word in TOKEN_RE.findall(str(description or "").lower()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return " ".join(words)
+
+
+def features(normalized) -> frozenset:
+    padded = f" {normalized} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _number(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _similarities(left, right):
+    """
+    Dice scores of at least ITEM_MATCH_THRESHOLD between two lists of feature
+    sets, as {(i, j): score}.
+    """
+    if not left or not right:
+        return {}
+    index = defaultdict(list)
+    for j, feature_set in enumerate(right):
+        for feature in feature_set:
+            index[feature].append(j)
+    sizes = [len(feature_set) for feature_set in right]
+    result = {}
+    for i, feature_set in enumerate(left):
+        shared = Counter(chain.from_iterable(index.get(feature, ()) for feature in feature_set))
+        size = len(feature_set)
+        for j, count in shared.items():
+            score = 2.0 * count / (size + sizes[j])
+            if score >= ITEM_MATCH_THRESHOLD:
+                result[(i, j)] = score
+    return result
+
+
+def _assign(cost):
+    """
+    Minimum-cost one-to-one assignment for a rectangular cost matrix (a list of
+    rows), as a list of (row, column) pairs. Hungarian method with potentials.
+    """
+    n, m = len(cost), len(cost[0])
+    if n > m:
+        transposed = [[cost[i][j] for i in range(n)] for j in range(m)]
+        return [(i, j) for j, i in _assign(transposed)]
+
+    inf = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    owner = [0] * (m + 1)  # owner[j]: row assigned to column j (1-based, 0 = none)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            row = cost[i0 - 1]
+            delta, j1 = inf, 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    current = row[j - 1] - u[i0] - v[j]
+                    if current < minv[j]:
+                        minv[j], way[j] = current, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    return [(owner[j] - 1, j - 1) for j in range(1, m + 1) if owner[j]]
+
+
+def _assign_greedy(scores, rows=None, cols=None):
+    """
+    One-to-one pairs from ``scores``, taken best first; for groups too large
+    for _assign. Restricted to ``rows`` and ``cols`` when given.
+    """
+    candidates = scores.items()
+    if rows is not None:
+        rows, cols = set(rows), set(cols)
+        candidates = [((i, j), score) for (i, j), score in candidates if i in rows and j in cols]
+    ranked = sorted(candidates, key=lambda entry: (-entry[1], entry[0]))
+    used_rows, used_cols = set(), set()
+    pairs = []
+    for (i, j), _ in ranked:
+        if i not in used_rows and j not in used_cols:
+            pairs.append((i, j))
+            used_rows.add(i)
+            used_cols.add(j)
+    return pairs
+
+
+def _assignments(scores):
+    """(row, column) pairs for every group of look-alike items."""
+    if len(scores) > ITEM_ASSIGNMENT_LIMIT ** 2:
+        # Grouping this many pairs costs more than it saves. Greedy choices in
+        # one group never affect another, so one pass over all pairs will do.
+        return _assign_greedy(scores)
+    assigned = []
+    for rows, cols in _components(scores):
+        if max(len(rows), len(cols)) > ITEM_ASSIGNMENT_LIMIT:
+            assigned += _assign_greedy(scores, rows, cols)
+        else:
+            cost = [[-scores.get((r, c), 0.0) for c in cols] for r in rows]
+            assigned += [(rows[r], cols[c]) for r, c in _assign(cost)]
+    return assigned
+
+
+def _components(pairs):
+    """Groups of (left, right) indexes connected by scored pairs."""
+    parent = {}
+
+    def find(node):
+        while parent.setdefault(node, node) != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for i, j in pairs:
+        parent[find(("l", i))] = find(("r", j))
+    groups = defaultdict(lambda: ([], []))
+    for node in parent:
+        side, index = node
+        groups[find(node)][0 if side == "l" else 1].append(index)
+    return list(groups.values())
+
+
+def match_items(po_items: List[Dict[str, Any]], receipt_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Pair PO items with receipt lines.
+
+    Returns ``matches`` (one per matched PO item: ``po_index``,
+    ``receipt_indexes`` and ``score``), plus ``unmatched_po`` and
+    ``unmatched_receipt`` index lists.
+    """
+    po_norm = [normalize(item.get("description")) for item in po_items]
+    receipt_norm = [normalize(item.get("description")) for item in receipt_items]
+
+    pairs = {}
+    # Identical descriptions need no scoring.
+    waiting = defaultdict(list)
+    for j, text in enumerate(receipt_norm):
+        waiting[text].append(j)
+    po_left = []
+    for i, text in enumerate(po_norm):
+        if text and waiting.get(text):
+            pairs[i] = (waiting[text].pop(0), 1.0)
+        else:
+            po_left.append(i)
+    receipt_left = [j for js in waiting.values() for j in js]
+
+    po_features = [features(po_norm[i]) for i in po_left]
+    receipt_features = [features(receipt_norm[j]) for j in receipt_left]
+    scores = _similarities(po_features, receipt_features)
+    for r, c in _assignments(scores):
+        score = scores.get((r, c))
+        if score is not None:
+            pairs[po_left[r]] = (receipt_left[c], score)
+
+    matches = {i: {"po_index": i, "receipt_indexes": [j], "score": round(score, 3)} for i, (j, score) in pairs.items()}
+    matched_receipt = {j for j, _ in pairs.values()}
+    extra = [j for j in receipt_left if j not in matched_receipt]
+    # A leftover line that resembles a matched item is more of that item.
+    matched_po = sorted(matches)
+    extra_scores = _similarities(
+        [features(receipt_norm[j]) for j in extra],
+        [features(po_norm[i]) for i in matched_po],
+    )
+    best = {}
+    for (e, m), score in extra_scores.items():
+        if score > best.get(e, (None, 0.0))[1]:
+            best[e] = (m, score)
+    unmatched_receipt = []
+    for e, j in enumerate(extra):
+        if e in best:
+            matches[matched_po[best[e][0]]]["receipt_indexes"].append(j)
+        else:
+            unmatched_receipt.append(j)
+
+    return {
+        "matches": [matches[i] for i in sorted(matches)],
+        "unmatched_po": [i for i in range(len(po_items)) if i not in matches],
+        "unmatched_receipt": sorted(unmatched_receipt),
+    }
+
+
+def item_discrepancies(po_items: List[Dict[str, Any]], receipt_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Per-item discrepancies between a PO and a receipt, typed ``missing_item``,
+    ``unexpected_item``, ``quantity_mismatch`` or ``price_mismatch``.
+    """
+    result = match_items(po_items, receipt_items)
+    discrepancies = []
+
+    for i in result["unmatched_po"]:
+        discrepancies.append({
+            "type": "missing_item",
+            "message": f"PO item '{po_items[i].get('description', '')}' not found in receipt",
+            "po_item": po_items[i].get("description", ""),
+        })
+    for j in result["unmatched_receipt"]:
+        discrepancies.append({
+            "type": "unexpected_item",
+            "message": f"Receipt item '{receipt_items[j].get('description', '')}' is not on the PO",
+            "receipt_item": receipt_items[j].get("description", ""),
+        })
+
+    for match in result["matches"]:
+        po_item = po_items[match["po_index"]]
+        lines = [receipt_items[j] for j in match["receipt_indexes"]]
+        description = po_item.get("description", "")
+        po_quantity = _number(po_item.get("quantity"))
+        po_price = _number(po_item.get("unit_price"))
+
+        quantities = [_number(line.get("quantity"), 1.0) for line in lines]
+        receipt_quantity = sum(quantities)
+        if receipt_quantity != po_quantity:
+            discrepancies.append({
+                "type": "quantity_mismatch",
+                "message": f"'{description}': receipt quantity {receipt_quantity:g}, PO quantity {po_quantity:g}",
+                "po_item": description,
+                "po_quantity": po_quantity,
+                "receipt_quantity": receipt_quantity,
+            })
+
+        priced = [(q, _number(line.get("unit_price", line.get("price")), None)) for q, line in zip(quantities, lines)]
+        priced = [(q, p) for q, p in priced if p is not None and q > 0]
+        if priced and po_price > 0:
+            receipt_price = sum(q * p for q, p in priced) / sum(q for q, _ in priced)
+            if abs(receipt_price - po_price) > po_price * ITEM_PRICE_TOLERANCE:
+                discrepancies.append({
+                    "type": "price_mismatch",
+                    "message": f"'{description}': receipt unit price ${receipt_price:.2f}, PO unit price ${po_price:.2f}",
+                    "po_item": description,
+                    "po_unit_price": po_price,
+                    "receipt_unit_price": round(receipt_price, 2),
+                })
+
+    return discrepancies
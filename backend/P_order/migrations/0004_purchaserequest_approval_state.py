@@ -0,0 +1,66 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_approval_state(apps, schema_editor):
+    PurchaseRequest = apps.get_model('P_order', 'PurchaseRequest')
+    Approval = apps.get_model('P_order', 'Approval')
+
+    approved = {}
+    last_action = {}
+    for pr_id, level, is_approved, created_at in Approval.objects.values_list(
+        'purchase_request_id', 'level', 'approved', 'created_at'
+    ).iterator():
+        if is_approved:
+            approved.setdefault(pr_id, set()).add(level)
+        if pr_id not in last_action or created_at > last_action[pr_id]:
+            last_action[pr_id] = created_at
+
+    batch = []
+    for pr in PurchaseRequest.objects.only('id', 'status').iterator():
+        levels = approved.get(pr.id, set())
+        pr.approved_level = max(levels, default=0)
+        pr.last_action_at = last_action.get(pr.id)
+        if pr.status == 'pending':
+            pr.next_level = next((lvl for lvl in (1, 2, 3) if lvl not in levels), None)
+        else:
+            pr.next_level = None
+        batch.append(pr)
+        if len(batch) >= 1000:
+            PurchaseRequest.objects.bulk_update(batch, ['approved_level', 'next_level', 'last_action_at'])
+            batch = []
+    if batch:
+        PurchaseRequest.objects.bulk_update(batch, ['approved_level', 'next_level', 'last_action_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('P_order', '0003_purchaserequest_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='approved_level',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='last_action_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='next_level',
+            field=models.PositiveSmallIntegerField(blank=True, default=1, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='purchaserequest',
+            index=models.Index(fields=['status', 'next_level', 'created_at', 'id'], name='preq_queue_idx'),
+        ),
+        migrations.RunPython(backfill_approval_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE "P_order_searchdocument" ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(proforma_text, '') || ' ' || coalesce(receipt_text, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX "P_order_searchdocument_vector_gin" ON "P_order_searchdocument" USING GIN (search_vector)',
+]
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS "P_order_searchdocument_vector_gin"',
+    'ALTER TABLE "P_order_searchdocument" DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE "P_order_searchdocument_fts" USING fts5(
+        title, body, proforma_text, receipt_text, tokenize = 'porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER "P_order_searchdocument_ai" AFTER INSERT ON "P_order_searchdocument" BEGIN
+        INSERT INTO "P_order_searchdocument_fts" (rowid, title, body, proforma_text, receipt_text)
+        VALUES (new.purchase_request_id, new.title, new.body, new.proforma_text, new.receipt_text);
+    END
+    """,
+    """
+    CREATE TRIGGER "P_order_searchdocument_ad" AFTER DELETE ON "P_order_searchdocument" BEGIN
+        DELETE FROM "P_order_searchdocument_fts" WHERE rowid = old.purchase_request_id;
+    END
+    """,
+    """
+    CREATE TRIGGER "P_order_searchdocument_au" AFTER UPDATE ON "P_order_searchdocument" BEGIN
+        DELETE FROM "P_order_searchdocument_fts" WHERE rowid = old.purchase_request_id;
+        INSERT INTO "P_order_searchdocument_fts" (rowid, title, body, proforma_text, receipt_text)
+        VALUES (new.purchase_request_id, new.title, new.body, new.proforma_text, new.receipt_text);
+    END
+    """,
+]
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS "P_order_searchdocument_au"',
+    'DROP TRIGGER IF EXISTS "P_order_searchdocument_ad"',
+    'DROP TRIGGER IF EXISTS "P_order_searchdocument_ai"',
+    'DROP TABLE IF EXISTS "P_order_searchdocument_fts"',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+create_search_index = _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD})
+drop_search_index = _run({'postgresql': POSTGRES_REVERSE, 'sqlite': SQLITE_REVERSE})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('P_order', '0004_purchaserequest_approval_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('purchase_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='P_order.purchaserequest')),
+                ('title', models.TextField(blank=True, default='')),
+                ('body', models.TextField(blank=True, default='')),
+                ('proforma_text', models.TextField(blank=True, default='')),
+                ('receipt_text', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('P_order', '0005_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('vendor', 'vendor'), ('requester', 'requester'), ('outcome', 'outcome')], max_length=20)),
+                ('key', models.CharField(max_length=150)),
+                ('label', models.CharField(blank=True, default='', max_length=150)),
+                ('month', models.DateField()),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dimension', 'month'], name='spend_rollup_dim_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key', 'month'), name='spend_rollup_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('P_order', '0006_spendrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64)),
+                ('kind', models.CharField(choices=[('proforma', 'proforma'), ('receipt', 'receipt')], max_length=20)),
+                ('extractor_version', models.CharField(max_length=20)),
+                ('result', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sha256', 'kind', 'extractor_version'), name='extraction_cache_unique')],
+            },
+        ),
+    ]
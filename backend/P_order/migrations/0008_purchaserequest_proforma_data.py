@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('P_order', '0007_extractioncacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='proforma_data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
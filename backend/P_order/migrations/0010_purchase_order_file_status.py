@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:17
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_files(apps, schema_editor):
+    # POs created before this migration were rendered and emailed inline.
+    PurchaseOrder = apps.get_model('P_order', 'PurchaseOrder')
+    PurchaseOrder.objects.exclude(po_file='').exclude(po_file__isnull=True).update(
+        file_status='ready', notified_at=F('created_at'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('P_order', '0009_documentjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='file_status',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='documentjob',
+            name='kind',
+            field=models.CharField(choices=[('proforma', 'proforma'), ('receipt', 'receipt'), ('purchase_order', 'purchase_order')], max_length=30),
+        ),
+        migrations.RunPython(mark_existing_files, migrations.RunPython.noop),
+    ]
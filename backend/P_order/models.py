@@ -1,10 +1,19 @@
 from django.db import models
+from django.utils import timezone
 
 from accounts.models import CustomUser
 
 # Create your models here.
 
 
+APPROVAL_LEVEL_BY_ROLE = {
+    "manager_1": 1,
+    "manager_2": 2,
+    "finance": 3,
+}
+FINAL_APPROVAL_LEVEL = 3
+
+
  
 
 
@@ -23,14 +32,48 @@ class  PurchaseRequest(models.Model):
     created_by= models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="created_requests")
     approved_by= models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name="approved_requests")
     proforma= models.FileField(upload_to='proformas/', null=True, blank=True)
+    proforma_data = models.JSONField(null=True, blank=True)
     created_at=models.DateTimeField(auto_now_add=True)
     updated_at=models.DateTimeField(auto_now=True)
 
     purchase_order=models.OneToOneField('PurchaseOrder', on_delete=models.SET_NULL, null=True, blank=True) 
 
+    # Approval state, maintained by record_decision() alongside each Approval row.
+    approved_level=models.PositiveSmallIntegerField(default=0)
+    next_level=models.PositiveSmallIntegerField(null=True, blank=True, default=1)
+    last_action_at=models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="preq_created_id_idx"),
+            models.Index(fields=["created_by", "-created_at", "-id"], name="preq_creator_created_idx"),
+            models.Index(fields=["status", "next_level", "created_at", "id"], name="preq_queue_idx"),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.status}"
 
+    def record_decision(self, level, approved, approver=None):
+        """
+        Update the approval-state columns after an approval or rejection at
+        ``level``. Call inside the transaction that creates the Approval row.
+        """
+        self.last_action_at = timezone.now()
+        if not approved:
+            self.status = "rejected"
+            self.next_level = None
+        elif level >= FINAL_APPROVAL_LEVEL:
+            self.approved_level = level
+            self.status = "approved"
+            self.approved_by = approver
+            self.next_level = None
+        else:
+            self.approved_level = level
+            self.next_level = level + 1
+        self.save(update_fields=[
+            "status", "approved_by", "approved_level", "next_level", "last_action_at", "updated_at",
+        ])
+
 
 
 
@@ -62,6 +105,14 @@ class PurchaseOrder(models.Model):
     total_amount=models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     po_file = models.FileField(upload_to='pos/', null=True, blank=True)
+    # Rendered by the purchase_order document job after the PO is created.
+    FILE_STATUS_CHOICES = (
+        ('pending', 'pending'),
+        ('ready', 'ready'),
+        ('failed', 'failed'),
+    )
+    file_status = models.CharField(max_length=20, choices=FILE_STATUS_CHOICES, default='pending')
+    notified_at = models.DateTimeField(null=True, blank=True)
 
 
 
@@ -73,4 +124,105 @@ class Receipt(models.Model):
     validated = models.BooleanField(default=False)
     discrepancies = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
\ No newline at end of file
+    
+
+
+
+class SearchDocument(models.Model):
+    """
+    Denormalised text of a purchase request for full-text search, rebuilt by
+    search.index_purchase_request(). The database-specific index (tsvector +
+    GIN on PostgreSQL, FTS5 on SQLite) is created by migration 0005.
+    """
+    purchase_request = models.OneToOneField(PurchaseRequest, on_delete=models.CASCADE, primary_key=True, related_name="search_document")
+    title = models.TextField(blank=True, default="")
+    body = models.TextField(blank=True, default="")
+    proforma_text = models.TextField(blank=True, default="")
+    receipt_text = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+
+class SpendRollup(models.Model):
+    """
+    Pre-aggregated spend per (dimension, key, month), maintained incrementally
+    by analytics.py and rebuilt with ``manage.py rebuild_spend_rollups``.
+    """
+    DIMENSION_CHOICES = (
+        ('vendor', 'vendor'),
+        ('requester', 'requester'),
+        ('outcome', 'outcome'),
+    )
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=150)
+    label = models.CharField(max_length=150, blank=True, default="")
+    month = models.DateField()
+    request_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dimension", "key", "month"], name="spend_rollup_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["dimension", "month"], name="spend_rollup_dim_month_idx"),
+        ]
+
+
+
+class ExtractionCacheEntry(models.Model):
+    """Document extraction result keyed by file content hash and extractor version."""
+    KIND_CHOICES = (
+        ('proforma', 'proforma'),
+        ('receipt', 'receipt'),
+    )
+    sha256 = models.CharField(max_length=64)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    extractor_version = models.CharField(max_length=20)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sha256", "kind", "extractor_version"], name="extraction_cache_unique"),
+        ]
+
+
+
+class DocumentJob(models.Model):
+    """
+    A unit of background document work, claimed by ``manage.py run_doc_worker``
+    with SELECT ... FOR UPDATE SKIP LOCKED. See jobs.py for the handlers.
+    """
+    KIND_CHOICES = (
+        ('proforma', 'proforma'),
+        ('receipt', 'receipt'),
+        ('purchase_order', 'purchase_order'),
+    )
+    STATUS_CHOICES = (
+        ('queued', 'queued'),
+        ('running', 'running'),
+        ('succeeded', 'succeeded'),
+        ('failed', 'failed'),
+    )
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    purchase_request = models.ForeignKey(PurchaseRequest, on_delete=models.CASCADE, related_name="jobs")
+    receipt = models.ForeignKey(Receipt, on_delete=models.CASCADE, null=True, blank=True, related_name="jobs")
+    created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="document_jobs")
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after", "id"], name="document_job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} - {self.status}"
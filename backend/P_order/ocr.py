@@ -0,0 +1,133 @@
+"""
+OCR for receipt photos and scanned pages.
+
+Images are cleaned up before Tesseract sees them:
+
+- rotated according to their EXIF orientation;
+- scaled to about ``OCR_TARGET_DPI`` (phone photos are 12+ MP, far more than
+  Tesseract needs);
+- converted to grayscale and binarized with an Otsu threshold;
+- optionally cropped to the inked region.
+
+Tesseract's language, engine mode and page segmentation mode come from
+settings.
+"""
+import importlib
+
+from django.conf import settings
+
+try:
+    pytesseract = importlib.import_module("pytesseract")
+    Image = importlib.import_module("PIL.Image")
+    ImageFilter = importlib.import_module("PIL.ImageFilter")
+    ImageOps = importlib.import_module("PIL.ImageOps")
+    TESSERACT_AVAILABLE = True
+except Exception:
+    pytesseract = None
+    Image = None
+    ImageFilter = None
+    ImageOps = None
+    TESSERACT_AVAILABLE = False
+
+OCR_LANG = getattr(settings, "OCR_LANG", "eng")
+# 1 = LSTM engine only; 4 = a single column of text of variable sizes, like a receipt.
+OCR_OEM = getattr(settings, "OCR_OEM", 1)
+OCR_PSM = getattr(settings, "OCR_PSM", 4)
+OCR_TARGET_DPI = getattr(settings, "OCR_TARGET_DPI", 300)
+# Cameras always claim 72 dpi, so lower values are ignored and the photo is
+# assumed to span about this many inches of paper on its long edge.
+OCR_MIN_TRUSTED_DPI = 100
+OCR_ASSUMED_LONG_EDGE_INCHES = getattr(settings, "OCR_ASSUMED_LONG_EDGE_INCHES", 8)
+OCR_BINARIZE = getattr(settings, "OCR_BINARIZE", True)
+OCR_CROP = getattr(settings, "OCR_CROP", True)
+CROP_MARGIN = 16
+CROP_REDUCTION = 4
+
+
+def tesseract_config(psm=None, oem=None):
+    return f"--oem {OCR_OEM if oem is None else oem} --psm {OCR_PSM if psm is None else psm}"
+
+
+def otsu_threshold(image):
+    """Grey level that best separates ink from paper in an "L" image."""
+    histogram = image.histogram()
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background = background_sum = 0
+    best_level, best_variance = 127, 0.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        background_sum += level * count
+        mean_background = background_sum / background
+        mean_foreground = (weighted_total - background_sum) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def downscale_factor(image, target_dpi=OCR_TARGET_DPI):
+    """Scale that brings ``image`` to ``target_dpi``, never more than 1."""
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] >= OCR_MIN_TRUSTED_DPI:
+        scale = target_dpi / float(dpi[0])
+    else:
+        scale = target_dpi * OCR_ASSUMED_LONG_EDGE_INCHES / max(image.size)
+    return min(scale, 1.0)
+
+
+def crop_to_text(binary):
+    """
+    Crop a binarized image to the text on it: first to the paper (the light
+    area, dropping a dark desk or scanner lid around it), then to the ink on
+    the paper, plus a margin. Boxes are found on a reduced, median-filtered
+    copy so specks of noise don't stretch them.
+    """
+    factor = CROP_REDUCTION
+    small = binary.reduce(factor).filter(ImageFilter.MedianFilter(3))
+    small = small.point(lambda level: 255 if level > 127 else 0)
+    paper = small.getbbox()
+    if not paper:
+        return binary
+    # Step inside the paper's edge, which is blurred into the background.
+    left, top, right, bottom = paper
+    paper = (left + 1, top + 1, max(right - 1, left + 2), max(bottom - 1, top + 2))
+    ink = ImageOps.invert(small.crop(paper)).getbbox()
+    if not ink:
+        return binary
+    margin = CROP_MARGIN
+    return binary.crop((
+        max((paper[0] + ink[0]) * factor - margin, 0),
+        max((paper[1] + ink[1]) * factor - margin, 0),
+        min((paper[0] + ink[2]) * factor + margin, binary.width),
+        min((paper[1] + ink[3]) * factor + margin, binary.height),
+    ))
+
+
+def preprocess(image, binarize=OCR_BINARIZE, crop=OCR_CROP):
+    scale = downscale_factor(image)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # Lets the JPEG decoder skip most of the work for big reductions.
+        image.draft("RGB", size)
+        image = image.resize(size, Image.LANCZOS)
+    image = ImageOps.exif_transpose(image)
+    image = ImageOps.autocontrast(image.convert("L"))
+    if binarize:
+        threshold = otsu_threshold(image)
+        image = image.point(lambda level: 255 if level > threshold else 0)
+        if crop:
+            image = crop_to_text(image)
+    return image
+
+
+def ocr_image(image, clean=True, psm=None):
+    """Text of a PIL image, preprocessed unless ``clean`` is false."""
+    if clean:
+        image = preprocess(image)
+    return pytesseract.image_to_string(image, lang=OCR_LANG, config=tesseract_config(psm))
@@ -0,0 +1,125 @@
+"""
+Keyset (cursor) pagination for purchase request listings.
+
+Pages are addressed by the (created_at, id) of the boundary row rather than an
+offset, so fetching page 1000 costs the same index range scan as page 1.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+# Largest value of a bigint primary key.
+MAX_ID = 2 ** 63 - 1
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first pagination keyed on (created_at, id)."""
+
+    descending = True
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            size = int(value)
+        except (TypeError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def encode_cursor(self, row, reverse):
+        raw = f"{int(reverse)}|{row.created_at.isoformat()}|{row.pk}"
+        encoded = base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode("ascii")).decode("ascii")
+            reverse, created_at, pk = raw.split("|")
+            created_at, pk = datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+        # A tampered cursor must not reach the query: a naive timestamp or an
+        # id past the column's range would fail there instead.
+        if reverse not in ("0", "1") or created_at.tzinfo is None or not 0 < pk <= MAX_ID:
+            raise ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+        return created_at, pk, reverse == "1"
+
+    def get_window(self, queryset, request):
+        """The rows a page is cut from, in index order, plus one to tell whether more follow."""
+        size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+
+        # Walking backwards through a newest-first listing means walking the
+        # index oldest-first, and vice versa.
+        descending = self.descending != reverse
+        if cursor:
+            created_at, pk, _ = cursor
+            op = "lt" if descending else "gt"
+            queryset = queryset.filter(
+                Q(**{f"created_at__{op}": created_at}) | Q(created_at=created_at, **{f"id__{op}": pk})
+            )
+
+        ordering = ("-created_at", "-id") if descending else ("created_at", "id")
+        return queryset.order_by(*ordering)[: size + 1]
+
+    def page_keys(self, queryset, request):
+        """``(id, updated_at)`` of the rows the page for ``request`` is cut from."""
+        return list(self.get_window(queryset, request).values_list("id", "updated_at"))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+
+        rows = list(self.get_window(queryset, request))
+        has_more = len(rows) > size
+        page = rows[:size]
+        if reverse:
+            page.reverse()
+
+        self.next_link = None
+        self.previous_link = None
+        if page:
+            if reverse:
+                self.next_link = self.encode_cursor(page[-1], reverse=False)
+                if has_more:
+                    self.previous_link = self.encode_cursor(page[0], reverse=True)
+            else:
+                if has_more:
+                    self.next_link = self.encode_cursor(page[-1], reverse=False)
+                if cursor:
+                    self.previous_link = self.encode_cursor(page[0], reverse=True)
+        elif cursor and not reverse:
+            self.previous_link = remove_query_param(self.base_url, self.cursor_query_param)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.next_link,
+            "previous": self.previous_link,
+            "results": data,
+        })
+
+
+class OldestFirstKeysetPagination(KeysetPagination):
+    """Oldest-first variant, for work queues."""
+
+    descending = False
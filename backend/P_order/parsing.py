@@ -0,0 +1,214 @@
+"""
+Regex extraction of vendor, items, total and terms from document text.
+
+Every line pattern of a layout template is compiled at import into one
+alternation, so a document is classified line by line in a single
+``finditer`` pass. Which template applies is decided by one combined
+fingerprint regex over the start of the text. Templates for repeat suppliers
+can be added in settings (``EXTRACTION_TEMPLATES``) or with
+``register_template``. The generic layout is used when no fingerprint matches.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+# Amounts as printed: 1,234.56 / 1234.56 / 1234,56 / 1234
+NUMBER = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:[.,]\d+)?"
+CURRENCY = r"(?:[$€£]|RWF|USD|EUR|FRW)?\s*"
+
+# Only the start of a document is fingerprinted.
+FINGERPRINT_WINDOW = 2000
+MAX_ITEMS = 200
+# Longer lines are prose or extraction noise, never a field; skipping them
+# keeps the per-line patterns linear.
+MAX_LINE_LENGTH = 300
+
+# Lines that are headings, labels or boilerplate rather than a company name.
+NOT_A_NAME = re.compile(
+    r"proforma|invoice|quotation|quote|receipt|date|\btel\b|phone|e-?mail|www\.|@|:|^\W*$|^[\d\s/:.#+-]+$|^#"
+    r"|^(?:(?:item|description|qty|quantity|unit|price|rate|amount|total|no\.?)\s*)+$",
+    re.IGNORECASE,
+)
+
+# A description starts with something other than a digit and is bounded, so
+# matching a line never backtracks more than this many characters.
+DESC = r"(?P<desc>[^\d\s][^\n]{0,119}?)"
+QTY = r"(?P<qty>\d{1,6})"
+PRICE = rf"{CURRENCY}(?P<price>{NUMBER})"
+AMOUNT = rf"(?:\s+{CURRENCY}(?:{NUMBER}))?"
+# "1." / "2)" in numbered lists.
+LIST_NUMBER = r"(?:\d{1,3}[.)]\s+)?"
+SEPARATOR = r"\s*[—–|,;-]?\s*"
+
+GENERIC_ITEM_PATTERNS = [
+    # 2 x Office chair @ 50.00 [100.00]
+    rf"{QTY}\s*[xX×*]\s+{DESC}\s+(?:@|at)?\s*{PRICE}{AMOUNT}",
+    # Office chair 2 x 50.00 [100.00]
+    rf"{LIST_NUMBER}{DESC}\s+{QTY}\s*[xX×*@]\s*{PRICE}{AMOUNT}",
+    # 1. Laptop — Qty: 2 — Unit: $1200
+    rf"{LIST_NUMBER}{DESC}{SEPARATOR}(?:qty|quantity)\s*[:.]?\s*{QTY}{SEPARATOR}"
+    rf"(?:unit\s+price|unit|price|rate|@)\s*[:.]?\s*{PRICE}{AMOUNT}",
+    # Office chair   2   50.00   100.00   (description, quantity, unit price, amount)
+    rf"{LIST_NUMBER}{DESC}\s+{QTY}\s+{PRICE}\s+{CURRENCY}(?:{NUMBER})",
+    # 2 Office chair 50.00 [100.00]   (quantity, description, unit price)
+    rf"{QTY}\s+{DESC}\s+{PRICE}{AMOUNT}",
+]
+# Labels are matched at the start of a line; vendor and seller labels may
+# follow a few words ("Quotation from: ...").
+# A value that is itself a label ("FROM: TO:") is a column heading, not a name.
+GENERIC_VENDOR = r"(?:[A-Za-z][A-Za-z \t]{0,30}?\s)?(?:vendor|supplier|company|from)\s*[:\-]\s*(?![A-Za-z ]{1,20}:)(?P<value>[^\n]*\S)"
+GENERIC_SELLER = r"(?:[A-Za-z][A-Za-z \t]{0,30}?\s)?(?:seller|store|vendor|from)\s*:\s*(?P<value>[A-Z][A-Za-z\s&.'-]*[A-Za-z.])"
+# "Subtotal" never matches: labels are anchored at the start of the line.
+GENERIC_TOTAL = (
+    r"(?:grand\s+total|total(?:\s+(?:due|amount|payable|paid))?|amount\s+(?:due|paid)|balance\s+due|sum)"
+    rf"\s*[:\-]?\s*{CURRENCY}(?P<value>{NUMBER})[^\n]{{0,40}}"
+)
+GENERIC_TERMS = r"(?:payment\s+)?terms\s*[:\-]\s*(?P<value>[^\n]*\S)"
+
+
+def parse_number(value):
+    """Float from a printed amount, reading a lone comma as a decimal separator."""
+    if "," in value and "." not in value and re.fullmatch(r"\d+,\d{1,2}", value):
+        value = value.replace(",", ".")
+    return float(value.replace(",", ""))
+
+
+@dataclass
+class LayoutTemplate:
+    """
+    How one supplier (or the generic layout) prints its documents.
+
+    ``fingerprint`` is a regex that identifies the supplier near the top of the
+    text. ``vendor`` overrides whatever name the text suggests. The
+    remaining fields are line patterns: items need ``desc``, ``qty`` and
+    ``price`` groups; vendor, seller, total and terms need a ``value`` group.
+    """
+
+    name: str
+    fingerprint: Optional[str] = None
+    vendor: Optional[str] = None
+    item_patterns: List[str] = field(default_factory=lambda: list(GENERIC_ITEM_PATTERNS))
+    vendor_pattern: str = GENERIC_VENDOR
+    seller_pattern: str = GENERIC_SELLER
+    total_pattern: str = GENERIC_TOTAL
+    terms_pattern: str = GENERIC_TERMS
+
+    def __post_init__(self):
+        self.compile()
+
+    def compile(self):
+        # Each line is claimed by the first alternative that matches all of it.
+        # Items go first so "1 x Total 10.00" is an item, and the catch-all
+        # ``line`` alternative makes sure every line is visited.
+        alternatives = [_named("item", pattern, n) for n, pattern in enumerate(self.item_patterns)]
+        alternatives += [
+            _named("total", self.total_pattern),
+            _named("terms", self.terms_pattern),
+            _named("vendor", self.vendor_pattern),
+            _named("seller", self.seller_pattern),
+            r"(?P<line>[^\n]*\S[^\n]*)",
+        ]
+        self.regex = re.compile(
+            "|".join(rf"^[ \t]*{alternative}[ \t]*$" for alternative in alternatives),
+            re.IGNORECASE | re.MULTILINE,
+        )
+
+
+def _named(kind, pattern, index=0):
+    """Wrap a pattern in a group named for its kind, prefixing its own groups to keep them unique."""
+    prefix = f"{kind}{index}"
+    renamed = re.sub(r"\(\?P<(\w+)>", lambda m: f"(?P<{prefix}_{m.group(1)}>", pattern)
+    return f"(?P<{prefix}>{renamed})"
+
+
+GENERIC = LayoutTemplate(name="generic")
+_templates: List[LayoutTemplate] = []
+_fingerprints = None
+
+
+def register_template(template):
+    """Add a supplier layout; later registrations are tried after earlier ones."""
+    global _fingerprints
+    if not template.fingerprint:
+        raise ValueError(f"Template '{template.name}' needs a fingerprint.")
+    _templates.append(template)
+    _fingerprints = re.compile(
+        "|".join(f"(?P<t{n}>{t.fingerprint})" for n, t in enumerate(_templates)),
+        re.IGNORECASE,
+    )
+    return template
+
+
+def select_template(text):
+    """The first registered template whose fingerprint appears near the top, else GENERIC."""
+    if _fingerprints is None:
+        return GENERIC
+    # The combined regex reports matches in text order; registration order decides.
+    found = [int(match.lastgroup[1:]) for match in _fingerprints.finditer(text, 0, FINGERPRINT_WINDOW)]
+    if not found:
+        return GENERIC
+    return _templates[min(found)]
+
+
+def parse_text(text, template=None) -> Dict:
+    """
+    Vendor, seller, items, total and terms found in ``text`` in one pass.
+    Empty values mean the field was not found.
+    """
+    template = template or select_template(text)
+    if len(text) > MAX_LINE_LENGTH:
+        text = "\n".join("" if len(line) > MAX_LINE_LENGTH else line for line in text.split("\n"))
+    vendor = seller = terms = ""
+    first_name = ""
+    totals = []
+    items = []
+
+    for match in template.regex.finditer(text):
+        kind = match.lastgroup
+        groups = {
+            key.split("_", 1)[1]: value
+            for key, value in match.groupdict().items()
+            if value is not None and key.startswith(kind + "_")
+        }
+        if kind.startswith("total"):
+            totals.append(groups["value"])
+        elif kind.startswith("item"):
+            if len(items) < MAX_ITEMS and int(groups["qty"]) > 0:
+                items.append({
+                    "description": groups["desc"].strip(" \t-:|"),
+                    "quantity": int(groups["qty"]),
+                    "unit_price": parse_number(groups["price"]),
+                })
+        elif kind.startswith("vendor"):
+            vendor = vendor or groups["value"].strip()
+            seller = seller or groups["value"].strip()
+        elif kind.startswith("seller"):
+            seller = seller or groups["value"].strip()
+        elif kind.startswith("terms"):
+            terms = terms or groups["value"].strip()
+        elif not first_name:
+            line = match.group().strip()
+            if not NOT_A_NAME.search(line):
+                first_name = line
+
+    total_amount = 0.0
+    if totals:
+        try:
+            total_amount = parse_number(totals[-1])
+        except ValueError:
+            pass
+
+    return {
+        "template": template.name,
+        "vendor": template.vendor or vendor or first_name,
+        "seller": template.vendor or seller or first_name,
+        "items": items,
+        "total_amount": total_amount,
+        "terms": terms,
+    }
+
+
+for _config in getattr(settings, "EXTRACTION_TEMPLATES", []):
+    register_template(LayoutTemplate(**_config))
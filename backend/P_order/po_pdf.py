@@ -0,0 +1,375 @@
+"""
+PDF rendering for purchase orders. Called by the ``purchase_order`` document
+job, never from a request.
+
+Everything that is the same on every PO (the header band, the FROM block,
+the item table header, the terms, the signature block and the footer) is
+drawn once per process, and the resulting PDF operators are cached. Each
+document copies them in, or refers to them as form XObjects when they
+repeat on every page. Copying relies on reportlab internals (the canvas
+operator buffer), which is why reportlab is pinned in requirements.txt; if
+they change, parts are drawn through the public API instead. Per document,
+only the PO's own fields and its item rows are drawn. Item rows flow onto
+continuation pages, and the table header is repeated at the top of each
+one.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger(__name__)
+
+WIDTH, HEIGHT = A4
+DARK_BLUE = (0.1, 0.2, 0.4)
+LIGHT_GRAY = (0.9, 0.9, 0.9)
+# Registered first in every document so cached operators name the same fonts.
+FONTS = ("Helvetica", "Helvetica-Bold")
+
+ROW_HEIGHT = 20
+# Top of the item table on the first and on continuation pages.
+FIRST_TABLE_TOP = HEIGHT - 300
+CONTINUED_TABLE_TOP = HEIGHT - 80
+TABLE_HEADER_HEIGHT = 35
+# Rows and the closing block stay above the footer.
+CONTENT_FLOOR = 45
+CLOSING_HEIGHT = 245
+DESCRIPTION_CHARS = 45
+
+TERMS = [
+    "1. Delivery must be made within 30 days of PO approval.",
+    "2. All items must meet specified quality standards.",
+    "3. Payment terms: Net 30 days from invoice date.",
+    "4. This PO is subject to company approval and budget availability.",
+]
+
+
+def _draw_first_page(c):
+    c.setFillColorRGB(*DARK_BLUE)
+    c.rect(0, HEIGHT - 100, WIDTH, 100, fill=1, stroke=0)
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica-Bold", 24)
+    c.drawString(50, HEIGHT - 45, "IST AFRICA")
+    c.setFont("Helvetica-Bold", 18)
+    c.drawString(50, HEIGHT - 70, "PURCHASE ORDER")
+
+    y = HEIGHT - 130
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(50, y, "FROM:")
+    c.setFont("Helvetica", 10)
+    c.drawString(50, y - 15, "IST Africa")
+    c.drawString(50, y - 30, "Procurement Department")
+    c.drawString(50, y - 45, "Email: procurement@ist.africa")
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(300, y, "TO:")
+
+    y -= 80
+    c.setFillColorRGB(*LIGHT_GRAY)
+    c.rect(50, y - 20, WIDTH - 100, 50, fill=1, stroke=0)
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(60, y, "PURCHASE REQUEST DETAILS")
+
+
+def _draw_continued_page(c):
+    c.setFillColorRGB(*DARK_BLUE)
+    c.rect(0, HEIGHT - 50, WIDTH, 50, fill=1, stroke=0)
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, HEIGHT - 32, "PURCHASE ORDER (continued)")
+
+
+def _draw_table_header(c):
+    # Drawn relative to the top of the table; placed with a translation.
+    c.setFillColorRGB(*DARK_BLUE)
+    c.rect(50, -20, WIDTH - 100, 25, fill=1, stroke=0)
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(60, -5, "ITEM DESCRIPTION")
+    c.drawString(350, -5, "QTY")
+    c.drawString(400, -5, "UNIT PRICE")
+    c.drawString(480, -5, "TOTAL")
+
+
+def _draw_closing(c):
+    # Drawn relative to the rule under the last item row.
+    c.setStrokeColorRGB(0, 0, 0)
+    c.setLineWidth(1)
+    c.line(50, 0, WIDTH - 50, 0)
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica", 9)
+    c.drawString(400, -10, "Subtotal:")
+    c.drawString(400, -25, "Tax (0%):")
+    c.drawString(480, -25, "$0.00")
+
+    c.setFillColorRGB(*DARK_BLUE)
+    c.rect(330, -65, WIDTH - 380, 25, fill=1, stroke=0)
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(340, -50, "TOTAL AMOUNT:")
+
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(50, -95, "TERMS AND CONDITIONS:")
+    c.setFont("Helvetica", 8)
+    for n, term in enumerate(TERMS):
+        c.drawString(60, -110 - 12 * n, term)
+
+    c.setFont("Helvetica-Bold", 9)
+    c.drawString(50, -178, "APPROVED BY:")
+    c.setFont("Helvetica", 9)
+    c.drawString(50, -210, "Finance Department")
+    c.setLineWidth(0.5)
+    c.line(50, -233, 200, -233)
+    c.setFont("Helvetica", 7)
+    c.drawString(50, -240, "Authorized Signature")
+
+
+def _draw_footer(c):
+    c.setFont("Helvetica", 7)
+    c.setFillColorRGB(0.5, 0.5, 0.5)
+    c.drawCentredString(WIDTH / 2, 30, "This is a computer-generated document. No signature required.")
+
+
+# name: (draw function, form bounding box)
+STATIC_PARTS = {
+    "po_first_page": (_draw_first_page, (0, 0, WIDTH, HEIGHT)),
+    "po_continued_page": (_draw_continued_page, (0, 0, WIDTH, HEIGHT)),
+    "po_table_header": (_draw_table_header, (0, -25, WIDTH, 10)),
+    "po_closing": (_draw_closing, (0, -CLOSING_HEIGHT, WIDTH, 5)),
+    "po_footer": (_draw_footer, (0, 0, WIDTH, 40)),
+}
+# Drawn on every page. In a multi-page PO these become form XObjects, so each
+# page refers to one copy. A form is an extra PDF object, which is not worth
+# writing for a part drawn once; those parts are copied into the page instead.
+REPEATED_PARTS = ("po_continued_page", "po_table_header", "po_footer")
+
+_compiled = None
+_compiled_lock = threading.Lock()
+_a85_lock = threading.Lock()
+
+
+def _register_fonts(c):
+    for font in FONTS:
+        c._doc.getInternalFontName(font)
+
+
+def compiled_parts():
+    """
+    PDF operators for each static part, drawn once per process, or None when
+    this reportlab does not expose the internals they are copied through.
+    """
+    global _compiled
+    with _compiled_lock:
+        if _compiled is None:
+            try:
+                scratch = canvas.Canvas(BytesIO(), pagesize=A4)
+                _register_fonts(scratch)
+                compiled = {}
+                for name, (draw, _) in STATIC_PARTS.items():
+                    scratch.saveState()
+                    start = len(scratch._code)
+                    draw(scratch)
+                    compiled[name] = scratch._code[start:]
+                    scratch.restoreState()
+            except AttributeError:
+                logger.warning("reportlab internals changed; purchase order parts will be drawn per document.")
+                compiled = {}
+            _compiled = compiled
+        return _compiled or None
+
+
+@contextmanager
+def _without_a85():
+    """
+    Streams are already zlib-compressed. Wrapping them in ASCII85 makes them a
+    quarter larger, and without reportlab's C accelerator the encoding costs
+    more than drawing the page. reportlab only reads ``rl_config.useA85``, when
+    a document is written, so it is switched off for that write alone.
+    """
+    with _a85_lock:
+        previous = rl_config.useA85
+        rl_config.useA85 = 0
+        try:
+            yield
+        finally:
+            rl_config.useA85 = previous
+
+
+class _Template:
+    """Places static parts on one document's canvas."""
+
+    def __init__(self, c, pages, cached):
+        self.c = c
+        self.code = compiled_parts() if cached else None
+        self.forms = set()
+        if self.code is not None:
+            # Fonts first, so the cached operators name the same fonts as here.
+            _register_fonts(c)
+        if pages > 1:
+            for name in REPEATED_PARTS:
+                c.beginForm(name, *STATIC_PARTS[name][1])
+                self._draw(name)
+                c.endForm()
+                self.forms.add(name)
+
+    def _draw(self, name):
+        if self.code is not None:
+            self.c._code.extend(self.code[name])
+        else:
+            STATIC_PARTS[name][0](self.c)
+
+    def place(self, name, y=0):
+        c = self.c
+        c.saveState()
+        if y:
+            c.translate(0, y)
+        if name in self.forms:
+            c.doForm(name)
+        else:
+            self._draw(name)
+        c.restoreState()
+
+
+def paginate(row_count):
+    """
+    Split ``row_count`` item rows over pages. Returns the number of rows on each
+    page; the closing block goes on a page of its own when it does not fit
+    under the last row.
+    """
+    pages = []
+    remaining = row_count
+    top = FIRST_TABLE_TOP - TABLE_HEADER_HEIGHT
+    while True:
+        fits = int((top - CONTENT_FLOOR) // ROW_HEIGHT)
+        rows = min(remaining, fits)
+        pages.append(rows)
+        remaining -= rows
+        if remaining == 0:
+            if top - rows * ROW_HEIGHT - CLOSING_HEIGHT < CONTENT_FLOOR:
+                pages.append(0)
+            return pages
+        top = CONTINUED_TABLE_TOP - TABLE_HEADER_HEIGHT
+
+
+def render_purchase_order(po, approver, cached=True):
+    """
+    The PDF for ``po`` as bytes, signed off by ``approver``. ``cached=False``
+    draws the static parts from scratch; it exists for the benchmark.
+    """
+    purchase = po.purchase_request
+    items = po.item_snapshot
+    total_amount = float(po.total_amount)
+    generated = f"Generated on {purchase.updated_at.strftime('%Y-%m-%d %H:%M:%S')}"
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    pages = paginate(len(items))
+    template = _Template(c, len(pages), cached)
+
+    index = 0
+    for page, rows in enumerate(pages):
+        if page == 0:
+            _draw_first_page_fields(c, template, po, purchase)
+            table_top = FIRST_TABLE_TOP
+        else:
+            c.showPage()
+            template.place("po_continued_page")
+            c.setFillColorRGB(1, 1, 1)
+            c.setFont("Helvetica-Bold", 12)
+            c.drawRightString(WIDTH - 50, HEIGHT - 32, f"PO #: {po.po_number}")
+            table_top = CONTINUED_TABLE_TOP
+
+        y = table_top
+        if rows or page == 0:
+            template.place("po_table_header", table_top)
+            y = table_top - TABLE_HEADER_HEIGHT
+            y = _draw_rows(c, items[index:index + rows], index, y)
+            index += rows
+
+        if page == len(pages) - 1:
+            template.place("po_closing", y)
+            _draw_closing_fields(c, y, total_amount, approver, purchase)
+
+        template.place("po_footer")
+        c.setFillColorRGB(0.5, 0.5, 0.5)
+        c.setFont("Helvetica", 7)
+        c.drawCentredString(WIDTH / 2, 20, generated)
+        c.drawRightString(WIDTH - 50, 20, f"Page {page + 1} of {len(pages)}")
+
+    c.showPage()
+    with _without_a85():
+        c.save()
+    return buffer.getvalue()
+
+
+def _draw_first_page_fields(c, template, po, purchase):
+    template.place("po_first_page")
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawRightString(WIDTH - 50, HEIGHT - 45, f"PO #: {po.po_number}")
+    c.setFont("Helvetica", 10)
+    c.drawRightString(WIDTH - 50, HEIGHT - 65, f"Date: {purchase.created_at.strftime('%B %d, %Y')}")
+    c.drawRightString(WIDTH - 50, HEIGHT - 80, f"Request ID: PR-{purchase.id}")
+
+    y = HEIGHT - 130
+    c.setFillColorRGB(0, 0, 0)
+    for i, line in enumerate(po.vendor.split("\n")[:4]):
+        c.drawString(300, y - 15 - i * 15, line[:50])
+
+    y -= 80
+    c.setFont("Helvetica", 9)
+    c.drawString(60, y - 15, f"Title: {purchase.title}")
+    description = purchase.description
+    for i in range(2):
+        line = description[i * 80:(i + 1) * 80]
+        if line:
+            c.drawString(60, y - 30 - i * 12, line)
+
+
+def _draw_rows(c, rows, first_index, y):
+    """Draw striped item rows from ``y`` down; returns the y under the last one."""
+    c.setFillColorRGB(*LIGHT_GRAY)
+    for n in range(len(rows)):
+        if (first_index + n) % 2 == 0:
+            c.rect(50, y - (n + 1) * ROW_HEIGHT, WIDTH - 100, ROW_HEIGHT, fill=1, stroke=0)
+
+    # One text object for the whole table instead of one per cell.
+    text = c.beginText()
+    text.setFont("Helvetica", 9)
+    text.setFillColorRGB(0, 0, 0)
+    for n, item in enumerate(rows):
+        baseline = y - n * ROW_HEIGHT - 14
+        description = item["description"]
+        if len(description) > DESCRIPTION_CHARS:
+            description = description[:DESCRIPTION_CHARS - 3] + "..."
+        for x, value in (
+            (60, description),
+            (350, str(item["quantity"])),
+            (400, f"${item['unit_price']:,.2f}"),
+            (480, f"${item['quantity'] * item['unit_price']:,.2f}"),
+        ):
+            text.setTextOrigin(x, baseline)
+            text.textOut(value)
+    c.drawText(text)
+    return y - len(rows) * ROW_HEIGHT
+
+
+def _draw_closing_fields(c, y, total_amount, approver, purchase):
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica", 9)
+    c.drawString(480, y - 10, f"${total_amount:,.2f}")
+    c.setFillColorRGB(1, 1, 1)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawRightString(WIDTH - 60, y - 50, f"${total_amount:,.2f}")
+
+    name = approver.get_full_name() if hasattr(approver, "get_full_name") and approver.get_full_name() else approver.username
+    c.setFillColorRGB(0, 0, 0)
+    c.setFont("Helvetica", 9)
+    c.drawString(50, y - 198, name)
+    c.drawString(50, y - 222, f"Date: {purchase.updated_at.strftime('%B %d, %Y')}")
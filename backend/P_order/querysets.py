@@ -0,0 +1,82 @@
+"""
+Shared queryset builders for purchase request reads.
+
+Every endpoint that serializes through ``PurchaseRequestSerialzer`` should
+start from these so the nested items, approvals, approvers and purchase order
+are fetched in a fixed number of queries, however many rows are returned.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Prefetch, Q
+from django.utils import timezone
+
+from .models import Approval, PurchaseRequest
+
+
+SUMMARY_FIELDS = ("id", "title", "status", "amount", "created_at", "updated_at")
+
+# (label, lower bound in days) for inbox age buckets, youngest first.
+INBOX_AGE_BUCKETS = (
+    ("under_1_day", 0),
+    ("1_to_3_days", 1),
+    ("3_to_7_days", 3),
+    ("over_7_days", 7),
+)
+
+
+def purchase_request_queryset(fields=None):
+    """
+    Purchase requests with the relations the full serializer touches preloaded.
+    When ``fields`` is given only the relations named in it are loaded.
+    """
+    wanted = None if fields is None else set(fields)
+
+    def wants(name):
+        return wanted is None or name in wanted
+
+    queryset = PurchaseRequest.objects.defer("proforma_data")
+    related = [name for name in ("created_by", "purchase_order") if wants(name)]
+    if related:
+        queryset = queryset.select_related(*related)
+    if wants("items"):
+        queryset = queryset.prefetch_related("items")
+    if wants("approvals"):
+        queryset = queryset.prefetch_related(
+            Prefetch("approvals", queryset=Approval.objects.select_related("approver"))
+        )
+    return queryset
+
+
+def purchase_request_summary_queryset():
+    """Only the columns the summary representation needs, with no joins."""
+    return PurchaseRequest.objects.only(*SUMMARY_FIELDS)
+
+
+def purchase_requests_for(user, queryset=None):
+    """Restrict ``queryset`` to the purchase requests ``user`` may list."""
+    if queryset is None:
+        queryset = purchase_request_queryset()
+    if getattr(user, "role", None) == "staff":
+        return queryset.filter(created_by=user)
+    return queryset
+
+
+def awaiting_level(queryset, level):
+    """
+    Restrict to pending requests whose next required approval is ``level``.
+    Served by the (status, next_level, created_at) index.
+    """
+    return queryset.filter(status="pending", next_level=level)
+
+
+def inbox_age_counts(level, now=None):
+    """Count the requests waiting at ``level`` by age, in one aggregate query."""
+    now = now or timezone.now()
+    bounds = [now - timedelta(days=days) for _, days in INBOX_AGE_BUCKETS]
+    aggregates = {"total": Count("id")}
+    for index, (label, _) in enumerate(INBOX_AGE_BUCKETS):
+        condition = Q(created_at__lte=bounds[index])
+        if index + 1 < len(bounds):
+            condition &= Q(created_at__gt=bounds[index + 1])
+        aggregates[label] = Count("id", filter=condition)
+    return awaiting_level(PurchaseRequest.objects.all(), level).aggregate(**aggregates)
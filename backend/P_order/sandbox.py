@@ -0,0 +1,206 @@
+"""
+Text extraction in a supervised, resource-limited subprocess.
+
+pdfminer, PDFium and Tesseract can spin or balloon on a malformed or huge
+upload. ``extract_text_sandboxed`` runs ``extract_text_from_file`` in a child
+process with an address-space cap (RLIMIT_AS), a CPU-time backstop and a
+wall-clock timeout, after rejecting documents over the page or pixel limits.
+At most ``EXTRACTION_SANDBOX_PROCESSES`` children run at once, and the wait
+for one counts against the timeout. A child reads pages serially rather than
+through the document processor's process pool. The caller gets
+an ``ExtractionOutcome`` whose status is ok, timeout, too_large or failed.
+"""
+import multiprocessing
+import signal
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from .pdf_engines import open_pdf, preferred_engines
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+EXTRACTION_SANDBOX = getattr(settings, "EXTRACTION_SANDBOX", True)
+EXTRACTION_TIMEOUT = getattr(settings, "EXTRACTION_TIMEOUT", 60)
+EXTRACTION_MEMORY_LIMIT = getattr(settings, "EXTRACTION_MEMORY_LIMIT", 1024 * 1024 * 1024)
+EXTRACTION_MAX_PAGES = getattr(settings, "EXTRACTION_MAX_PAGES", 500)
+EXTRACTION_MAX_IMAGE_PIXELS = getattr(settings, "EXTRACTION_MAX_IMAGE_PIXELS", 25_000_000)
+EXTRACTION_MAX_BYTES = getattr(settings, "EXTRACTION_MAX_BYTES", 50 * 1024 * 1024)
+
+_slots = threading.BoundedSemaphore(getattr(settings, "EXTRACTION_SANDBOX_PROCESSES", 2))
+_context = None
+_context_lock = threading.Lock()
+
+
+@dataclass
+class ExtractionOutcome:
+    status: str
+    text: str = ""
+    detail: str = ""
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    def as_dict(self):
+        return {"status": self.status, "detail": self.detail, "elapsed": round(self.elapsed, 3)}
+
+
+class TooLarge(Exception):
+    """The document is over one of the configured size limits."""
+
+
+def _get_context():
+    # A forkserver child starts from a small, preloaded, single-threaded parent
+    # rather than a copy of the web or worker process.
+    global _context
+    with _context_lock:
+        if _context is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                _context = multiprocessing.get_context("forkserver")
+                _context.set_forkserver_preload(["P_order.document_processor"])
+            else:
+                _context = multiprocessing.get_context("spawn")
+        return _context
+
+
+def is_pdf(file):
+    content_type = (getattr(file, "content_type", "") or "").lower()
+    name = (getattr(file, "name", "") or "").lower()
+    return "pdf" in content_type or name.endswith(".pdf")
+
+
+def check_size(file):
+    """Raise TooLarge if the document has too many pages or pixels."""
+    file.seek(0)
+    if is_pdf(file):
+        data = file.read()
+        for engine in preferred_engines():
+            try:
+                document = open_pdf(engine, data)
+            except Exception:
+                continue
+            try:
+                pages = len(document)
+            finally:
+                document.close()
+            if pages > EXTRACTION_MAX_PAGES:
+                raise TooLarge(f"{pages} pages, limit is {EXTRACTION_MAX_PAGES}")
+            return
+        return
+
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+    try:
+        # Reads the header only.
+        width, height = Image.open(file).size
+    except Exception:
+        return
+    if width * height > EXTRACTION_MAX_IMAGE_PIXELS:
+        raise TooLarge(f"{width}x{height} pixels, limit is {EXTRACTION_MAX_IMAGE_PIXELS}")
+
+
+def _apply_limits(memory_limit, cpu_seconds):
+    if resource is None:
+        return
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+
+
+def _extract(name, content_type, data, fields, max_chars, parallel=True):
+    from .document_processor import extract_text_from_file
+
+    file = SimpleUploadedFile(name, data, content_type)
+    check_size(file)
+    return extract_text_from_file(file, fields, max_chars, parallel)
+
+
+def _child(conn, name, content_type, data, fields, max_chars, memory_limit, cpu_seconds):
+    _apply_limits(memory_limit, cpu_seconds)
+    try:
+        # Pages are read in this process: pool workers would escape the
+        # limits above and outlive the kill on timeout.
+        conn.send(("ok", _extract(name, content_type, data, fields, max_chars, parallel=False), ""))
+    except TooLarge as e:
+        conn.send(("too_large", "", str(e)))
+    except MemoryError:
+        conn.send(("too_large", "", "memory limit exceeded"))
+    except Exception as e:
+        conn.send(("failed", "", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def _run_inline(name, content_type, data, fields, max_chars):
+    try:
+        return "ok", _extract(name, content_type, data, fields, max_chars), ""
+    except TooLarge as e:
+        return "too_large", "", str(e)
+    except Exception as e:
+        return "failed", "", f"{type(e).__name__}: {e}"
+
+
+def _run_child(name, content_type, data, fields, max_chars, timeout):
+    context = _get_context()
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_child,
+        args=(sender, name, content_type, data, tuple(fields), max_chars, EXTRACTION_MEMORY_LIMIT, int(timeout) + 1),
+    )
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            return "timeout", "", f"no result after {timeout}s"
+        try:
+            return receiver.recv()
+        except EOFError:
+            process.join(1)
+            if process.exitcode == -signal.SIGXCPU:
+                return "timeout", "", "CPU time limit exceeded"
+            return "failed", "", f"extraction process exited with code {process.exitcode}"
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        receiver.close()
+
+
+def extract_text_sandboxed(file, fields=(), max_chars=None, timeout=None):
+    """Text of ``file`` as an ExtractionOutcome, never raising and never overrunning ``timeout``."""
+    started = time.monotonic()
+    file.seek(0)
+    data = file.read()
+    if len(data) > EXTRACTION_MAX_BYTES:
+        return ExtractionOutcome("too_large", detail=f"{len(data)} bytes, limit is {EXTRACTION_MAX_BYTES}")
+
+    args = (
+        getattr(file, "name", "") or "",
+        getattr(file, "content_type", "") or "",
+        data,
+        fields,
+        max_chars,
+    )
+    if EXTRACTION_SANDBOX:
+        deadline = started + (timeout or EXTRACTION_TIMEOUT)
+        # Waiting for a free slot counts against the same timeout.
+        if not _slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            return ExtractionOutcome("timeout", detail="no extraction slot free", elapsed=time.monotonic() - started)
+        try:
+            status, text, detail = _run_child(*args, max(deadline - time.monotonic(), 0))
+        finally:
+            _slots.release()
+    else:
+        status, text, detail = _run_inline(*args)
+    return ExtractionOutcome(status, text, detail, time.monotonic() - started)
@@ -0,0 +1,161 @@
+"""
+Full-text search over purchase requests.
+
+Each request has a SearchDocument holding its title, its description, line
+items and PO vendor (``body``), and the text extracted from its proforma and
+receipts. Migration 0005 indexes those columns with a
+weighted tsvector + GIN index on PostgreSQL, or an FTS5 table kept in sync by
+triggers on SQLite. Queries go to that index directly and never scan
+``purchase_request`` with LIKE. Other databases fall back to substring
+matching over the search documents.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Case, FloatField, Q, Value, When
+
+from .models import PurchaseOrder, PurchaseRequest, Receipt, SearchDocument
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+MAX_TOKENS = 8
+
+def _document_table():
+    return connection.ops.quote_name(SearchDocument._meta.db_table)
+
+
+def _fts_table():
+    return connection.ops.quote_name(f"{SearchDocument._meta.db_table}_fts")
+
+
+def build_document(purchase_request_id):
+    """Rebuild the SearchDocument for one request, or drop it if the request is gone."""
+    purchase = (
+        PurchaseRequest.objects.filter(pk=purchase_request_id)
+        .only("id", "title", "description", "proforma_data")
+        .first()
+    )
+    if purchase is None:
+        SearchDocument.objects.filter(purchase_request_id=purchase_request_id).delete()
+        return None
+
+    parts = [purchase.description]
+    parts.extend(purchase.items.values_list("description", flat=True))
+    parts.extend(
+        PurchaseOrder.objects.filter(purchase_request_id=purchase_request_id).values_list("vendor", flat=True)
+    )
+    receipt_texts = [
+        (data or {}).get("raw_text") or ""
+        for data in Receipt.objects.filter(purchase_request_id=purchase_request_id).values_list("extracted_data", flat=True)
+    ]
+
+    document, _ = SearchDocument.objects.update_or_create(
+        purchase_request_id=purchase_request_id,
+        defaults={
+            "title": purchase.title,
+            "body": "\n".join(part for part in parts if part),
+            "proforma_text": (purchase.proforma_data or {}).get("raw_text") or "",
+            "receipt_text": "\n".join(text for text in receipt_texts if text),
+        },
+    )
+    return document
+
+
+def index_purchase_request(purchase_request_id):
+    """
+    Rebuild a request's search document once the current transaction commits.
+    Calls for the same request inside one transaction collapse into a single
+    rebuild.
+    """
+    conn = transaction.get_connection()
+    if not conn.in_atomic_block:
+        build_document(purchase_request_id)
+        return
+    # The queued callbacks are the only record kept: a rollback discards them
+    # together with the rebuilds they stood for.
+    if any(getattr(entry[1], "search_request_id", None) == purchase_request_id for entry in conn.run_on_commit):
+        return
+
+    def rebuild():
+        build_document(purchase_request_id)
+
+    rebuild.search_request_id = purchase_request_id
+    transaction.on_commit(rebuild)
+
+
+def _tokens(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TOKENS]
+
+
+def search(query, user=None, limit=20, offset=0):
+    """
+    Return ``[(purchase_request_id, rank), ...]`` best match first. Every term
+    must match; the last term also matches as a prefix. Staff only see their
+    own requests.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+
+    creator_id = user.pk if getattr(user, "role", None) == "staff" else None
+    requests_table = connection.ops.quote_name(PurchaseRequest._meta.db_table)
+
+    if connection.vendor == "postgresql":
+        terms = tokens[:-1] + [f"{tokens[-1]}:*"]
+        sql = (
+            f"SELECT d.purchase_request_id, ts_rank_cd(d.search_vector, q) AS rank "
+            f"FROM {_document_table()} d, to_tsquery('english', %s) q "
+            f"WHERE d.search_vector @@ q"
+        )
+        params = [" & ".join(terms)]
+        if creator_id is not None:
+            sql += f" AND d.purchase_request_id IN (SELECT id FROM {requests_table} WHERE created_by_id = %s)"
+            params.append(creator_id)
+        sql += " ORDER BY rank DESC, d.purchase_request_id DESC LIMIT %s OFFSET %s"
+    elif connection.vendor == "sqlite":
+        terms = [f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*']
+        # bm25() is lower-is-better; negate so rank sorts like PostgreSQL.
+        sql = (
+            f"SELECT rowid, -bm25({_fts_table()}, 10.0, 4.0, 1.0, 1.0) AS rank "
+            f"FROM {_fts_table()} WHERE {_fts_table()} MATCH %s"
+        )
+        params = [" ".join(terms)]
+        if creator_id is not None:
+            sql += f" AND rowid IN (SELECT id FROM {requests_table} WHERE created_by_id = %s)"
+            params.append(creator_id)
+        sql += " ORDER BY rank DESC, rowid DESC LIMIT %s OFFSET %s"
+    else:
+        return _search_substrings(tokens, creator_id, limit, offset)
+
+    params.extend([limit, offset])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(row[0], float(row[1])) for row in cursor.fetchall()]
+
+
+# Weights of the same columns in the full-text indexes.
+FIELD_WEIGHTS = (("title", 10.0), ("body", 4.0), ("proforma_text", 1.0), ("receipt_text", 1.0))
+
+
+def _search_substrings(tokens, creator_id, limit, offset):
+    """Fallback without a full-text index: every term must appear in some column."""
+    documents = SearchDocument.objects.all()
+    if creator_id is not None:
+        documents = documents.filter(purchase_request__created_by_id=creator_id)
+    rank = Value(0.0)
+    for token in tokens:
+        documents = documents.filter(
+            Q(title__icontains=token) | Q(body__icontains=token)
+            | Q(proforma_text__icontains=token) | Q(receipt_text__icontains=token)
+        )
+        # Each term scores the weight of the best column it appears in.
+        rank = rank + Case(
+            *[When(**{f"{column}__icontains": token}, then=Value(weight)) for column, weight in FIELD_WEIGHTS],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    rows = (
+        documents.annotate(rank=rank)
+        .order_by("-rank", "-purchase_request_id")
+        .values_list("purchase_request_id", "rank")[offset:offset + limit]
+    )
+    return [(pk, float(score)) for pk, score in rows]
@@ -1,8 +1,55 @@
+from django.db import transaction
 from rest_framework import serializers
 from decimal import Decimal
 import json
 
 from .models import *
+from .querysets import SUMMARY_FIELDS
+
+
+def requested_fields(request):
+    """
+    Read ``?fields=`` and ``?expand=`` from the query string.
+    Returns a ``(fields, expand)`` pair of lists, either of which may be None.
+    """
+    def split(name):
+        value = request.query_params.get(name) if request is not None else None
+        if value is None:
+            return None
+        return [part.strip() for part in value.split(",") if part.strip()]
+
+    return split("fields"), split("expand")
+
+
+class DynamicFieldsMixin:
+    """
+    Lets the caller trim the representation by passing ``fields=[...]``.
+    Relations named in ``Meta.expandable_fields`` are only kept in a trimmed
+    representation when they are listed in ``fields`` or ``expand``. With
+    ``expand`` alone, every other field is kept and the expandable relations
+    not named in it are left out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        expand = kwargs.pop("expand", None)
+        super().__init__(*args, **kwargs)
+        allowed = self.selected_fields(fields, expand)
+        if allowed is None:
+            return
+        for name in list(self.fields):
+            if name not in allowed:
+                self.fields.pop(name)
+
+    @classmethod
+    def selected_fields(cls, fields, expand):
+        """The field names a ``fields``/``expand`` pair keeps, or None for all of them."""
+        if fields is None and expand is None:
+            return None
+        expandable = set(getattr(cls.Meta, "expandable_fields", ()))
+        if fields is None:
+            fields = [name for name in cls.Meta.fields if name not in expandable]
+        return list(fields) + [name for name in expand or () if name in expandable and name not in fields]
 
 
 class RequestItemSerialzer(serializers.ModelSerializer):
@@ -28,12 +75,13 @@ class ApprovalSerializer(serializers.ModelSerializer):
         read_only_fields = ["purchase_request", "approver", "created_at"]
 
 
-class PurchaseOrderSerializer(serializers.ModelSerializer):
+class PurchaseOrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     po_file = serializers.SerializerMethodField()
 
     class Meta:
         model=PurchaseOrder
-        fields=["id","purchase_request", "po_number", "vendor", "item_snapshot", "total_amount", "created_at", "po_file"]
+        fields=["id","purchase_request", "po_number", "vendor", "item_snapshot", "total_amount", "created_at", "po_file", "file_status"]
+        expandable_fields = ["item_snapshot"]
     
     def get_po_file(self, obj):
         if obj.po_file:
@@ -44,8 +92,9 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
         return None
 
 
-class PurchaseRequestSerialzer(serializers.ModelSerializer):
-    items = RequestItemSerialzer(many=True)
+class PurchaseRequestSerialzer(DynamicFieldsMixin, serializers.ModelSerializer):
+    # Optional on create only when a proforma is attached; its items are extracted later.
+    items = RequestItemSerialzer(many=True, required=False)
     created_by = serializers.StringRelatedField(read_only=True)
     approvals = ApprovalSerializer(many=True, read_only=True)
     purchase_order = serializers.SerializerMethodField()
@@ -58,7 +107,7 @@ class PurchaseRequestSerialzer(serializers.ModelSerializer):
     def to_representation(self, instance):
         """Override to return full URL for proforma when reading"""
         representation = super().to_representation(instance)
-        if instance.proforma:
+        if "proforma" in representation and instance.proforma:
             request = self.context.get('request')
             if request:
                 representation['proforma'] = request.build_absolute_uri(instance.proforma.url)
@@ -82,7 +131,11 @@ class PurchaseRequestSerialzer(serializers.ModelSerializer):
             "items",
             "purchase_order",
             "approvals",
+            "approved_level",
+            "next_level",
+            "last_action_at",
         ]
+        expandable_fields = ["items", "purchase_order", "approvals"]
         read_only_fields = [
             "status",
             "created_by",
@@ -91,6 +144,9 @@ class PurchaseRequestSerialzer(serializers.ModelSerializer):
             "updated_at",
             "purchase_order",
             "amount",  
+            "approved_level",
+            "next_level",
+            "last_action_at",
         ]
 
     def to_internal_value(self, data):
@@ -108,6 +164,11 @@ class PurchaseRequestSerialzer(serializers.ModelSerializer):
                     pass  # Let serializer handle the error
         return super().to_internal_value(data)
 
+    def validate(self, attrs):
+        if self.instance is None and not attrs.get("items") and not attrs.get("proforma"):
+            raise serializers.ValidationError({"items": ["This field is required."]})
+        return attrs
+
     def create(self, validated_data):
         items_data = validated_data.pop("items", [])
         
@@ -126,10 +187,11 @@ class PurchaseRequestSerialzer(serializers.ModelSerializer):
         validated_data["amount"] = total_amount
 
         user = self.context["request"].user
-        pr = PurchaseRequest.objects.create(created_by=user, **validated_data)
-
-        for item_data in items_data:
-            RequestItem.objects.create(purchase_request=pr, **item_data)
+        with transaction.atomic():
+            pr = PurchaseRequest.objects.create(created_by=user, **validated_data)
+            RequestItem.objects.bulk_create(
+                RequestItem(purchase_request=pr, **item_data) for item_data in items_data
+            )
         return pr
 
     def update(self, instance, validated_data):
@@ -152,20 +214,37 @@ class PurchaseRequestSerialzer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        instance.save()
-
-        if items_data is not None:
-            instance.items.all().delete()
-            for item_data in items_data:
-                RequestItem.objects.create(purchase_request=instance, **item_data)
+        with transaction.atomic():
+            instance.save()
+            if items_data is not None:
+                instance.items.all().delete()
+                RequestItem.objects.bulk_create(
+                    RequestItem(purchase_request=instance, **item_data) for item_data in items_data
+                )
         return instance
 
 
 
-class ReceiptSerializer(serializers.ModelSerializer):
+class ReceiptSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     uploaded_by=serializers.StringRelatedField(read_only=True)
 
     class Meta:
         model=Receipt
         fields=["id","purchase_request", "uploaded_by", "receipt_file", "extracted_data", "validated", "discrepancies", "created_at"]
         read_only_fields=["extracted_data", "validated", "discrepancies", "created_at"]
+
+
+class PurchaseRequestSummarySerializer(serializers.ModelSerializer):
+    """Compact read-only row for dashboards: no nested objects, no file URLs."""
+
+    class Meta:
+        model = PurchaseRequest
+        fields = list(SUMMARY_FIELDS)
+        read_only_fields = fields
+
+
+class DocumentJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DocumentJob
+        fields = ["id", "kind", "status", "purchase_request", "receipt", "attempts", "result", "error", "created_at", "finished_at"]
+        read_only_fields = fields
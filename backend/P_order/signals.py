@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_purchase_request
+from .models import Approval, PurchaseOrder, PurchaseRequest, Receipt, RequestItem
+from .search import index_purchase_request
+
+
+def _invalidate(purchase_request_id, created_by_id):
+    invalidate_purchase_request(purchase_request_id, created_by_id)
+    # Once more after commit, in case a concurrent read re-cached the
+    # pre-commit state in between.
+    transaction.on_commit(lambda: invalidate_purchase_request(purchase_request_id, created_by_id))
+
+
+@receiver(post_save, sender=PurchaseRequest)
+@receiver(post_delete, sender=PurchaseRequest)
+def purchase_request_changed(sender, instance, **kwargs):
+    _invalidate(instance.pk, instance.created_by_id)
+
+
+@receiver(post_save, sender=PurchaseRequest)
+@receiver(post_save, sender=RequestItem)
+@receiver(post_delete, sender=RequestItem)
+@receiver(post_save, sender=PurchaseOrder)
+@receiver(post_delete, sender=PurchaseOrder)
+@receiver(post_save, sender=Receipt)
+@receiver(post_delete, sender=Receipt)
+def reindex_purchase_request(sender, instance, **kwargs):
+    """Keep the full-text search document in step with the searchable fields."""
+    if sender is PurchaseRequest:
+        index_purchase_request(instance.pk)
+    else:
+        index_purchase_request(instance.purchase_request_id)
+
+
+@receiver(post_save, sender=RequestItem)
+@receiver(post_delete, sender=RequestItem)
+@receiver(post_save, sender=Approval)
+@receiver(post_delete, sender=Approval)
+@receiver(post_save, sender=PurchaseOrder)
+@receiver(post_delete, sender=PurchaseOrder)
+@receiver(post_save, sender=Receipt)
+@receiver(post_delete, sender=Receipt)
+def touch_purchase_request(sender, instance, **kwargs):
+    """
+    Bump the parent request's updated_at whenever one of its children changes,
+    so max(updated_at) alone tells whether a request's representation changed,
+    and drop the cached responses that include it.
+    """
+    PurchaseRequest.objects.filter(pk=instance.purchase_request_id).update(updated_at=timezone.now())
+    created_by_id = (
+        PurchaseRequest.objects.filter(pk=instance.purchase_request_id)
+        .values_list("created_by_id", flat=True)
+        .first()
+    )
+    if created_by_id is not None:
+        _invalidate(instance.purchase_request_id, created_by_id)
@@ -1,3 +1,1601 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+from importlib import import_module
+import multiprocessing
+import os
+from pathlib import Path
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.apps import apps as django_apps
+from django.core import mail
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image, ImageDraw
+from reportlab import rl_config
+from reportlab.pdfgen import canvas
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from notifications.models import OutboxEmail
+from notifications.outbox import Mailer, claim_batch
+
+from .analytics import rebuild_rollups
+from .cache import get_cache
+from .extraction_cache import cached_extraction, memory_cache
+from .jobs import LOCK_TIMEOUT, MAX_ATTEMPTS, RETRY_DELAY, claim_next, run_job
+from .document_processor import _read_pages, extract_proforma_data, validate_receipt_against_po
+from .llm import LLMClient
+from .llm_stub import StubLLMServer
+from .management.commands.benchmark_po_pdf import make_po
+from .matching import ITEM_ASSIGNMENT_LIMIT, _assign as matching_assign, match_items
+from .ocr import TESSERACT_AVAILABLE as OCR_AVAILABLE, crop_to_text, downscale_factor, otsu_threshold, preprocess
+from .parsing import DESC, FINGERPRINT_WINDOW, GENERIC, PRICE, QTY, LayoutTemplate, parse_text, register_template, select_template
+from .pdf_engines import PDFIUM_AVAILABLE, open_pdf
+from .po_pdf import render_purchase_order
+from .sandbox import _child as sandbox_child, extract_text_sandboxed
+from .search import search
+from .serializer import PurchaseOrderSerializer
+from .models import *
 
 # Create your tests here.
+
+
+def make_requests(creator, approver, count):
+    """Bulk-create ``count`` fully populated purchase requests for ``creator``."""
+    requests = PurchaseRequest.objects.bulk_create(
+        PurchaseRequest(
+            title=f"Request {i}",
+            description="Office supplies",
+            amount=Decimal("30.00"),
+            created_by=creator,
+        )
+        for i in range(count)
+    )
+    RequestItem.objects.bulk_create(
+        RequestItem(purchase_request=pr, description=f"Item {n}", quantity=n + 1, unit_price=Decimal("5.00"))
+        for pr in requests
+        for n in range(2)
+    )
+    Approval.objects.bulk_create(
+        Approval(purchase_request=pr, approver=approver, level=level, approved=True)
+        for pr in requests
+        for level in (1, 2)
+    )
+    for pr in requests[: max(1, count // 10)]:
+        po = PurchaseOrder.objects.create(
+            purchase_request=pr,
+            po_number=f"PO-{pr.id}",
+            vendor="Acme",
+            item_snapshot=[],
+            total_amount=Decimal("30.00"),
+        )
+        pr.purchase_order = po
+        pr.status = "approved"
+        pr.save(update_fields=["purchase_order", "status"])
+    return requests
+
+
+def proforma_pdf(lines):
+    """A one-page PDF with ``lines`` drawn top to bottom."""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for n, line in enumerate(lines):
+        pdf.drawString(50, 800 - 20 * n, line)
+    pdf.save()
+    return buffer.getvalue()
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Read endpoints must run a constant number of queries however many rows
+    exist or are returned. Raising a budget here should be a deliberate choice.
+    """
+
+    # One query for the page's ETag, then the page and two prefetches.
+    LIST_BUDGET = 4
+    DETAIL_BUDGET = 4
+    # Includes the savepoint pair around the insert inside the test transaction.
+    CREATE_BUDGET = 7
+    SIZES = (1, 100, 1000)
+
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.manager = CustomUser.objects.create_user(username="manager", password="password123", role="manager_1")
+        self.finance = CustomUser.objects.create_user(username="finance", password="password123", role="finance")
+        self.client = APIClient()
+
+    def count_queries(self, method, url, user, **kwargs):
+        # Budgets are for the uncached path.
+        get_cache().clear()
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 300, response.content[:300])
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_is_constant(self):
+        counts = []
+        created = 0
+        for size in self.SIZES:
+            make_requests(self.staff, self.manager, size - created)
+            created = size
+            count, response = self.count_queries("get", "/api/v1/Get-purchase-request/?page_size=200", self.finance)
+            self.assertEqual(len(response.data["results"]), min(size, 200))
+            counts.append(count)
+        self.assertEqual(len(set(counts)), 1, counts)
+        self.assertLessEqual(counts[0], self.LIST_BUDGET)
+
+    def test_staff_list_query_count_is_constant(self):
+        counts = []
+        created = 0
+        for size in self.SIZES:
+            make_requests(self.staff, self.manager, size - created)
+            created = size
+            count, _ = self.count_queries("get", "/api/v1/Get-purchase-request/?page_size=200", self.staff)
+            counts.append(count)
+        self.assertEqual(len(set(counts)), 1, counts)
+        self.assertLessEqual(counts[0], self.LIST_BUDGET)
+
+    def test_detail_query_count_is_constant(self):
+        counts = []
+        created = 0
+        for size in self.SIZES:
+            requests = make_requests(self.staff, self.manager, size - created)
+            created = size
+            count, _ = self.count_queries("get", f"/api/v1/Get-purchase-request/{requests[0].id}/", self.staff)
+            counts.append(count)
+        self.assertEqual(len(set(counts)), 1, counts)
+        self.assertLessEqual(counts[0], self.DETAIL_BUDGET)
+
+    def test_create_response_query_count_is_constant(self):
+        counts = []
+        created = 0
+        payload = {
+            "title": "Laptops",
+            "description": "New laptops",
+            "items": json.dumps([
+                {"description": "Laptop", "quantity": 2, "unit_price": "900.00"},
+                {"description": "Mouse", "quantity": 2, "unit_price": "20.00"},
+                {"description": "Dock", "quantity": 1, "unit_price": "150.00"},
+            ]),
+        }
+        for size in self.SIZES:
+            make_requests(self.staff, self.manager, size - created)
+            created = size
+            count, response = self.count_queries("post", "/api/v1/purchase-request/", self.staff, data=payload, format="multipart")
+            self.assertEqual(len(response.data["items"]), 3)
+            counts.append(count)
+        self.assertEqual(len(set(counts)), 1, counts)
+        self.assertLessEqual(counts[0], self.CREATE_BUDGET)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.manager = CustomUser.objects.create_user(username="manager", password="password123", role="manager_1")
+        self.requests = make_requests(self.staff, self.manager, 5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        get_cache().clear()
+
+    def test_unchanged_list_returns_304_without_serializing(self):
+        url = "/api/v1/Get-purchase-request/"
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 304)
+        self.assertLessEqual(len(ctx.captured_queries), 1)
+
+    def test_child_change_invalidates_detail_etag(self):
+        url = f"/api/v1/Get-purchase-request/{self.requests[-1].id}/"
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        Receipt.objects.create(purchase_request=self.requests[-1], uploaded_by=self.staff, receipt_file="receipts/r.pdf")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+
+    def test_query_parameters_change_etag(self):
+        url = "/api/v1/Get-purchase-request/"
+        self.assertNotEqual(self.client.get(url)["ETag"], self.client.get(url + "?view=summary")["ETag"])
+
+    def test_not_modified_keeps_validators_and_cache_control(self):
+        url = "/api/v1/Get-purchase-request/"
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+    def test_list_etag_covers_only_the_page_served(self):
+        url = "/api/v1/Get-purchase-request/?page_size=2"
+        first = self.client.get(url)
+        self.assertNotIn("Last-Modified", first)
+        # The oldest request is not on the newest-first page, nor the row after it.
+        self.requests[0].save(update_fields=["updated_at"])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        # A row leaving the page changes it, though no remaining row is newer.
+        self.requests[-1].delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.manager = CustomUser.objects.create_user(username="manager", password="password123", role="manager_1")
+        self.requests = make_requests(self.staff, self.manager, 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        get_cache().clear()
+
+    def test_fields_trim_and_expand_adds_relations(self):
+        response = self.client.get("/api/v1/Get-purchase-request/", {"fields": "id,title", "expand": "items,vendor"})
+        self.assertEqual(set(response.data["results"][0]), {"id", "title", "items"})
+
+    def test_expand_alone_keeps_plain_fields_and_named_relations(self):
+        url = f"/api/v1/Get-purchase-request/{self.requests[0].id}/"
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(url, {"expand": "items"}).data
+        self.assertIn("title", data)
+        self.assertIn("created_by", data)
+        self.assertEqual(len(data["items"]), 2)
+        self.assertNotIn("approvals", data)
+        self.assertNotIn("purchase_order", data)
+        self.assertFalse(any("approval" in query["sql"] for query in ctx.captured_queries))
+        self.assertIn("approvals", self.client.get(url).data)
+
+    def test_purchase_order_item_snapshot_is_expandable(self):
+        po = PurchaseOrder.objects.get()
+        self.assertNotIn("item_snapshot", PurchaseOrderSerializer(po, expand=[]).data)
+        self.assertIn("item_snapshot", PurchaseOrderSerializer(po, expand=["item_snapshot"]).data)
+        self.assertEqual(set(PurchaseOrderSerializer(po, fields=["po_number"], expand=["item_snapshot"]).data), {"po_number", "item_snapshot"})
+
+
+class KeysetPaginationTests(TestCase):
+    url = "/api/v1/Get-purchase-request/"
+
+    def setUp(self):
+        self.finance = CustomUser.objects.create_user(username="finance", password="password123", role="finance")
+        self.requests = make_requests(self.finance, self.finance, 7)
+        self.client = APIClient()
+        self.client.force_authenticate(self.finance)
+
+    def walk(self, url, link):
+        """The ids on each page reached by following ``link``, and the last response."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+            pages.append([row["id"] for row in response.data["results"]])
+            url = response.data[link]
+        return pages, response
+
+    def test_next_and_previous_links_round_trip(self):
+        newest_first = sorted((pr.id for pr in self.requests), reverse=True)
+        forward, last = self.walk(f"{self.url}?page_size=3", "next")
+        self.assertEqual(forward, [newest_first[0:3], newest_first[3:6], newest_first[6:]])
+        backward, first = self.walk(last.data["previous"], "previous")
+        self.assertEqual(backward, forward[-2::-1])
+        self.assertIsNotNone(first.data["next"])
+
+    def test_rows_sharing_created_at_are_neither_skipped_nor_repeated(self):
+        PurchaseRequest.objects.update(created_at=timezone.now())
+        pages, _ = self.walk(f"{self.url}?page_size=2", "next")
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(ids, sorted((pr.id for pr in self.requests), reverse=True))
+
+    def test_bad_cursors_are_rejected(self):
+        def encode(raw):
+            return base64.urlsafe_b64encode(raw.encode()).decode()
+
+        for cursor in (
+            "!!!",
+            "%FF%FE",
+            encode("only|two"),
+            encode("0|yesterday|3"),
+            encode("0|2025-01-01T00:00:00|3"),
+            encode("2|2025-01-01T00:00:00+00:00|3"),
+            encode("0|2025-01-01T00:00:00+00:00|-1"),
+            encode(f"0|2025-01-01T00:00:00+00:00|{2 ** 64}"),
+        ):
+            response = self.client.get(f"{self.url}?cursor={cursor}")
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertIn("cursor", response.data)
+
+
+class ApproverInboxTests(TestCase):
+    url = "/api/v1/inbox/"
+
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.users = {
+            role: CustomUser.objects.create_user(username=role, password="password123", role=role)
+            for role in ("manager_1", "manager_2", "finance")
+        }
+        now = timezone.now()
+        self.level_2 = {}
+        for label, age in (("10 days", 10), ("5 days", 5), ("2 days", 2), ("30 days", 30), ("2 hours", 1 / 12)):
+            self.level_2[label] = self.make(label, now - timedelta(days=age), next_level=2, approved_level=1)
+        self.make("level 1", now - timedelta(days=40), next_level=1, approved_level=0)
+        self.make("level 3", now - timedelta(days=40), next_level=3, approved_level=2)
+        self.make("rejected", now - timedelta(days=40), status="rejected", next_level=None, approved_level=1)
+        self.client = APIClient()
+
+    def make(self, title, created_at, **fields):
+        pr = PurchaseRequest.objects.create(title=title, description="d", amount=1, created_by=self.staff, **fields)
+        PurchaseRequest.objects.filter(pk=pr.pk).update(created_at=created_at)
+        return pr
+
+    def inbox(self, role, **params):
+        self.client.force_authenticate(self.users[role])
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_only_requests_at_the_callers_level_oldest_first(self):
+        data = self.inbox("manager_2")
+        self.assertEqual(data["level"], 2)
+        self.assertEqual(
+            [row["title"] for row in data["results"]],
+            ["30 days", "10 days", "5 days", "2 days", "2 hours"],
+        )
+        self.assertEqual([row["title"] for row in self.inbox("manager_1")["results"]], ["level 1"])
+        self.assertEqual([row["title"] for row in self.inbox("finance")["results"]], ["level 3"])
+
+    def test_pages_continue_oldest_first(self):
+        first = self.inbox("manager_2", page_size=2)
+        self.assertEqual([row["title"] for row in first["results"]], ["30 days", "10 days"])
+        second = self.client.get(first["next"]).data
+        self.assertEqual([row["title"] for row in second["results"]], ["5 days", "2 days"])
+
+    def test_age_counts(self):
+        self.assertEqual(self.inbox("manager_2")["counts"], {
+            "total": 5, "under_1_day": 1, "1_to_3_days": 1, "3_to_7_days": 1, "over_7_days": 2,
+        })
+        self.assertEqual(self.inbox("finance")["counts"]["total"], 1)
+
+    def test_staff_have_no_inbox(self):
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class FilterTests(TestCase):
+    def setUp(self):
+        self.finance = CustomUser.objects.create_user(username="finance", password="password123", role="finance")
+        self.client = APIClient()
+        self.client.force_authenticate(self.finance)
+
+    def test_non_finite_amounts_are_rejected(self):
+        for value in ("NaN", "sNaN", "Infinity", "-inf", "abc"):
+            for url in ("/api/v1/Get-purchase-request/", "/api/v1/export/"):
+                response = self.client.get(url, {"min_amount": value, "max_amount": "10"})
+                self.assertEqual(response.status_code, 400, (url, value))
+        self.assertEqual(self.client.get("/api/v1/Get-purchase-request/", {"min_amount": "1e2"}).status_code, 200)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.finance = CustomUser.objects.create_user(username="finance", password="password123", role="finance")
+        self.approved = PurchaseRequest.objects.create(
+            title="Laptops", description="Two laptops", amount=Decimal("1000.00"), created_by=self.staff, status="approved",
+        )
+        RequestItem.objects.create(purchase_request=self.approved, description="Laptop", quantity=2, unit_price=Decimal("500.00"))
+        po = PurchaseOrder.objects.create(
+            purchase_request=self.approved, po_number="PO-1", vendor="Acme", total_amount=Decimal("1000.00"),
+            item_snapshot=[{"description": "Laptop", "quantity": 2, "unit_price": 500.0}],
+        )
+        PurchaseRequest.objects.filter(pk=self.approved.pk).update(purchase_order=po)
+        self.pending = PurchaseRequest.objects.create(
+            title="Chairs", description="One chair", amount=Decimal("50.00"), created_by=self.staff,
+        )
+        RequestItem.objects.create(purchase_request=self.pending, description="Chair", quantity=1, unit_price=Decimal("50.00"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.finance)
+
+    def export(self, dataset, output, **params):
+        response = self.client.get("/api/v1/export/", {"dataset": dataset, "output": output, **params})
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def csv_rows(self, dataset, **params):
+        return list(csv.DictReader(self.export(dataset, "csv", **params).splitlines()))
+
+    def ndjson_rows(self, dataset, **params):
+        return [json.loads(line) for line in self.export(dataset, "ndjson", **params).splitlines()]
+
+    def test_requests(self):
+        header = self.export("requests", "csv").splitlines()[0].split(",")
+        self.assertEqual(header, [
+            "request_id", "title", "status", "amount", "created_at", "updated_at",
+            "created_by", "approved_by", "approved_level", "po_number", "vendor",
+        ])
+        for rows in (self.csv_rows("requests"), self.ndjson_rows("requests")):
+            self.assertEqual([row["title"] for row in rows], ["Laptops", "Chairs"])
+            first = rows[0]
+            self.assertEqual(str(first["request_id"]), str(self.approved.id))
+            self.assertEqual((first["status"], first["created_by"], first["po_number"], first["vendor"]),
+                             ("approved", "staff", "PO-1", "Acme"))
+            self.assertEqual(Decimal(str(first["amount"])), Decimal("1000.00"))
+        self.assertEqual([row["title"] for row in self.ndjson_rows("requests", status="pending")], ["Chairs"])
+
+    def test_line_items(self):
+        header = self.export("line_items", "csv").splitlines()[0].split(",")
+        self.assertEqual(header, [
+            "request_id", "title", "status", "created_at", "created_by", "request_amount", "item_id",
+            "description", "quantity", "unit_price", "po_number", "vendor", "line_total",
+        ])
+        for rows in (self.csv_rows("line_items"), self.ndjson_rows("line_items")):
+            self.assertEqual([row["description"] for row in rows], ["Laptop", "Chair"])
+            laptop = rows[0]
+            self.assertEqual((laptop["title"], str(laptop["quantity"]), laptop["vendor"]), ("Laptops", "2", "Acme"))
+            self.assertEqual(Decimal(str(laptop["unit_price"])), Decimal("500.00"))
+            self.assertEqual(Decimal(str(laptop["line_total"])), Decimal("1000.00"))
+        self.assertEqual([row["description"] for row in self.csv_rows("line_items", max_amount="100")], ["Chair"])
+
+    def test_purchase_orders(self):
+        header = self.export("purchase_orders", "csv").splitlines()[0].split(",")
+        self.assertEqual(header, [
+            "po_number", "request_id", "vendor", "po_total", "created_at",
+            "description", "quantity", "unit_price", "line_total",
+        ])
+        for rows in (self.csv_rows("purchase_orders"), self.ndjson_rows("purchase_orders")):
+            self.assertEqual(len(rows), 1)
+            row = rows[0]
+            self.assertEqual((row["po_number"], str(row["request_id"]), row["vendor"], row["description"]),
+                             ("PO-1", str(self.approved.id), "Acme", "Laptop"))
+            self.assertEqual(float(row["line_total"]), 1000.0)
+            self.assertEqual(Decimal(str(row["po_total"])), Decimal("1000.00"))
+        self.assertEqual(self.ndjson_rows("purchase_orders", status="pending"), [])
+
+    def test_finance_only(self):
+        for role in ("staff", "manager_1", "manager_2"):
+            user = CustomUser.objects.create_user(username=f"user-{role}", password="password123", role=role)
+            self.client.force_authenticate(user)
+            for dataset in ("requests", "line_items", "purchase_orders"):
+                response = self.client.get("/api/v1/export/", {"dataset": dataset})
+                self.assertEqual(response.status_code, 403, (role, dataset))
+
+
+@override_settings(PURCHASE_REQUEST_CACHE_ENABLED=True)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.other = CustomUser.objects.create_user(username="other", password="password123", role="staff")
+        self.manager = CustomUser.objects.create_user(username="manager", password="password123", role="manager_1")
+        self.admin = CustomUser.objects.create_user(username="admin", password="password123", role="finance", is_staff=True)
+        self.request = PurchaseRequest.objects.create(title="Chairs", description="d", amount=10, created_by=self.staff)
+        self.client = APIClient()
+        get_cache().clear()
+
+    def get(self, url, user):
+        self.client.force_authenticate(user)
+        return self.client.get(url)
+
+    def test_repeat_read_is_served_from_cache(self):
+        url = "/api/v1/Get-purchase-request/"
+        self.assertEqual(self.get(url, self.staff)["X-Cache"], "MISS")
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get(url, self.staff)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(self.get(url, self.manager)["X-Cache"], "MISS")
+
+    def test_changes_invalidate_only_affected_scopes(self):
+        url = "/api/v1/Get-purchase-request/"
+        detail = f"/api/v1/Get-purchase-request/{self.request.id}/"
+        for user in (self.staff, self.other, self.manager):
+            self.get(url, user)
+        self.get(detail, self.staff)
+
+        Approval.objects.create(purchase_request=self.request, approver=self.manager, level=1, approved=True)
+
+        self.assertEqual(self.get(url, self.staff)["X-Cache"], "MISS")
+        self.assertEqual(self.get(url, self.manager)["X-Cache"], "MISS")
+        self.assertEqual(self.get(detail, self.staff)["X-Cache"], "MISS")
+        self.assertEqual(self.get(url, self.other)["X-Cache"], "HIT")
+        self.assertEqual(len(self.get(detail, self.staff).data["approvals"]), 1)
+
+    def test_stats_endpoint(self):
+        url = "/api/v1/Get-purchase-request/"
+        self.get(url, self.staff)
+        self.get(url, self.staff)
+        stats = self.get("/api/v1/cache-stats/", self.admin).data
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(self.get("/api/v1/cache-stats/", self.manager).status_code, 403)
+
+    def test_inbox_is_not_cached(self):
+        self.get("/api/v1/inbox/", self.manager)
+        response = self.get("/api/v1/inbox/", self.manager)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Cache", response)
+
+    @override_settings(PURCHASE_REQUEST_CACHE_ENABLED=None)
+    def test_process_local_backend_disables_the_cache(self):
+        # Saves made by the worker would never reach this process's locmem cache.
+        url = "/api/v1/Get-purchase-request/"
+        self.get(url, self.staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get(url, self.staff)
+        self.assertNotIn("X-Cache", response)
+        self.assertGreater(len(ctx.captured_queries), 0)
+
+
+class ApprovalWorkflowTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", email="staff@example.com", password="password123", role="staff")
+        self.approvers = {
+            role: CustomUser.objects.create_user(username=role, password="password123", role=role)
+            for role in ("manager_1", "manager_2", "finance")
+        }
+        self.request = PurchaseRequest.objects.create(title="Chairs", description="d", amount=100, created_by=self.staff)
+        self.client = APIClient()
+
+    def act(self, role, action="approve"):
+        self.client.force_authenticate(self.approvers[role])
+        response = self.client.patch(f"/api/v1/{action}-request/{self.request.id}/", {"comments": ""}, format="json")
+        self.request.refresh_from_db()
+        return response
+
+    def state(self):
+        return self.request.status, self.request.approved_level, self.request.next_level
+
+    def test_record_decision(self):
+        self.request.record_decision(1, approved=True)
+        self.assertEqual(self.state(), ("pending", 1, 2))
+        self.request.record_decision(3, approved=True, approver=self.approvers["finance"])
+        self.assertEqual(self.state(), ("approved", 3, None))
+        self.assertEqual(self.request.approved_by, self.approvers["finance"])
+        self.assertIsNotNone(self.request.last_action_at)
+
+        other = PurchaseRequest.objects.create(title="Desks", description="d", amount=1, created_by=self.staff)
+        other.record_decision(1, approved=True)
+        other.record_decision(2, approved=False)
+        self.assertEqual((other.status, other.approved_level, other.next_level), ("rejected", 1, None))
+
+    def test_levels_approve_in_order(self):
+        self.assertEqual(self.act("manager_2").status_code, 400)
+        self.assertEqual(self.act("finance").status_code, 400)
+        self.assertEqual(self.act("finance", "reject").status_code, 400)
+        self.assertEqual(self.state(), ("pending", 0, 1))
+
+        self.assertEqual(self.act("manager_1").status_code, 200)
+        self.assertEqual(self.state(), ("pending", 1, 2))
+        self.assertEqual(self.act("manager_2").status_code, 200)
+        self.assertEqual(self.act("finance").status_code, 202)
+        self.assertEqual(self.state(), ("approved", 3, None))
+        self.assertEqual(self.request.approvals.count(), 3)
+
+    def test_double_approval_is_refused(self):
+        self.act("manager_1")
+        response = self.act("manager_1")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("already approved at level 1", response.data["message"])
+        self.assertEqual(self.request.approvals.count(), 1)
+        self.assertEqual(self.state(), ("pending", 1, 2))
+
+    def test_no_approval_after_rejection(self):
+        self.act("manager_1")
+        self.assertEqual(self.act("manager_2", "reject").status_code, 200)
+        self.assertEqual(self.state(), ("rejected", 1, None))
+        for role in ("manager_2", "finance"):
+            self.assertEqual(self.act(role).status_code, 400)
+            self.assertEqual(self.act(role, "reject").status_code, 400)
+        self.assertEqual(self.request.approvals.count(), 2)
+
+    def test_finance_approval_waits_for_the_proforma(self):
+        self.act("manager_1")
+        self.act("manager_2")
+        PurchaseRequest.objects.filter(pk=self.request.pk).update(proforma="proformas/quote.pdf", proforma_data=None)
+        response = self.act("finance")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.state(), ("pending", 2, 3))
+        self.assertFalse(PurchaseOrder.objects.exists())
+
+        PurchaseRequest.objects.filter(pk=self.request.pk).update(proforma_data={"vendor": "Acme Ltd"})
+        self.assertEqual(self.act("finance").status_code, 202)
+        self.assertEqual(self.request.purchase_order.vendor, "Acme Ltd")
+
+    def test_no_placeholder_vendor_without_a_proforma(self):
+        for role in ("manager_1", "manager_2", "finance"):
+            self.act(role)
+        self.assertEqual(self.request.purchase_order.vendor, "")
+
+    def test_migration_backfills_approval_state(self):
+        backfill = import_module("P_order.migrations.0004_purchaserequest_approval_state").backfill_approval_state
+        manager_1, manager_2 = self.approvers["manager_1"], self.approvers["manager_2"]
+        at_level_2 = PurchaseRequest.objects.create(title="A", description="d", amount=1, created_by=self.staff)
+        Approval.objects.create(purchase_request=at_level_2, approver=manager_1, level=1, approved=True)
+        rejected = PurchaseRequest.objects.create(title="B", description="d", amount=1, created_by=self.staff, status="rejected")
+        Approval.objects.create(purchase_request=rejected, approver=manager_1, level=1, approved=True)
+        Approval.objects.create(purchase_request=rejected, approver=manager_2, level=2, approved=False)
+        approved = PurchaseRequest.objects.create(title="C", description="d", amount=1, created_by=self.staff, status="approved")
+        for level, role in ((1, "manager_1"), (2, "manager_2"), (3, "finance")):
+            Approval.objects.create(purchase_request=approved, approver=self.approvers[role], level=level, approved=True)
+        # As the columns were when migration 0004 added them.
+        PurchaseRequest.objects.update(approved_level=0, next_level=1, last_action_at=None)
+
+        backfill(django_apps, None)
+
+        rows = {
+            pr.pk: (pr.approved_level, pr.next_level, pr.last_action_at is not None)
+            for pr in PurchaseRequest.objects.all()
+        }
+        self.assertEqual(rows[self.request.pk], (0, 1, False))
+        self.assertEqual(rows[at_level_2.pk], (1, 2, True))
+        self.assertEqual(rows[rejected.pk], (1, None, True))
+        self.assertEqual(rows[approved.pk], (3, None, True))
+
+
+class SpendRollupTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", email="staff@example.com", password="password123", role="staff")
+        self.approvers = {
+            role: CustomUser.objects.create_user(username=role, password="password123", role=role)
+            for role in ("manager_1", "manager_2", "finance")
+        }
+        self.client = APIClient()
+
+    def purchase_request(self, title, amount, vendor):
+        pr = PurchaseRequest.objects.create(
+            title=title, description="d", amount=Decimal(amount), created_by=self.staff, proforma_data={"vendor": vendor},
+        )
+        RequestItem.objects.create(purchase_request=pr, description=title, quantity=1, unit_price=Decimal(amount))
+        return pr
+
+    def act(self, pr, role, action="approve"):
+        self.client.force_authenticate(self.approvers[role])
+        response = self.client.patch(f"/api/v1/{action}-request/{pr.id}/", {"comments": ""}, format="json")
+        self.assertLess(response.status_code, 300, response.data)
+
+    def approve(self, pr):
+        for role in ("manager_1", "manager_2", "finance"):
+            self.act(pr, role)
+
+    def rollups(self):
+        return sorted(
+            SpendRollup.objects.values_list("dimension", "key", "label", "month", "request_count", "total_amount")
+        )
+
+    def test_approval_and_rejection_update_rollups(self):
+        month = timezone.localdate().replace(day=1)
+        self.approve(self.purchase_request("Laptops", "900.00", "Acme"))
+        self.approve(self.purchase_request("Desks", "100.00", "Acme"))
+        rejected = self.purchase_request("Chairs", "40.00", "Other")
+        self.act(rejected, "manager_1")
+        self.act(rejected, "manager_2", "reject")
+
+        self.assertEqual(self.rollups(), [
+            ("outcome", "approved", "approved", month, 2, Decimal("1000.00")),
+            ("outcome", "rejected", "rejected", month, 1, Decimal("40.00")),
+            ("requester", str(self.staff.pk), "staff", month, 2, Decimal("1000.00")),
+            ("vendor", "Acme", "Acme", month, 2, Decimal("1000.00")),
+        ])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for title, amount, vendor in (("Laptops", "900.00", "Acme"), ("Paper", "12.50", "Stationers")):
+            self.approve(self.purchase_request(title, amount, vendor))
+        rejected = self.purchase_request("Chairs", "40.00", "Other")
+        self.act(rejected, "manager_1", "reject")
+        incremental = self.rollups()
+
+        SpendRollup.objects.update(request_count=0)
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_report_totals_by_dimension_and_month_range(self):
+        rows = [
+            ("vendor", "Acme", date(2025, 1, 1), 2, "300.00"),
+            ("vendor", "Acme", date(2025, 2, 1), 1, "50.00"),
+            ("vendor", "Stationers", date(2025, 2, 1), 3, "400.00"),
+            ("vendor", "Acme", date(2025, 4, 1), 1, "999.00"),
+            ("outcome", "approved", date(2025, 1, 1), 2, "300.00"),
+            ("outcome", "approved", date(2025, 2, 1), 4, "450.00"),
+            ("outcome", "rejected", date(2025, 2, 1), 1, "20.00"),
+        ]
+        SpendRollup.objects.bulk_create(
+            SpendRollup(dimension=dimension, key=key, label=key, month=month, request_count=count, total_amount=Decimal(total))
+            for dimension, key, month, count, total in rows
+        )
+        self.client.force_authenticate(self.approvers["finance"])
+        url = "/api/v1/reports/spend/"
+
+        response = self.client.get(url, {"dimension": "vendor", "from": "2025-01", "to": "2025-02"})
+        self.assertEqual(
+            [(row["key"], row["request_count"], row["total_amount"]) for row in response.data["results"]],
+            [("Stationers", 3, Decimal("400.00")), ("Acme", 3, Decimal("350.00"))],
+        )
+        response = self.client.get(url, {"dimension": "month", "from": "2025-02"})
+        self.assertEqual(response.data["results"], [{"month": "2025-02", "request_count": 4, "total_amount": Decimal("450.00")}])
+        response = self.client.get(url, {"dimension": "outcome", "to": "2025-02"})
+        self.assertEqual(
+            [(row["key"], row["total_amount"]) for row in response.data["results"]],
+            [("approved", Decimal("750.00")), ("rejected", Decimal("20.00"))],
+        )
+        self.assertEqual(self.client.get(url, {"dimension": "vendor", "from": "2025"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"dimension": "colour"}).status_code, 400)
+
+
+class PurchaseOrderDeliveryTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media.name,
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.staff = CustomUser.objects.create_user(username="staff", email="staff@example.com", password="password123", role="staff")
+        self.finance = CustomUser.objects.create_user(username="finance", password="password123", role="finance")
+        self.request = PurchaseRequest.objects.create(title="Chairs", description="d", amount=100, created_by=self.staff)
+        RequestItem.objects.create(purchase_request=self.request, description="Chair", quantity=2, unit_price=Decimal("50.00"))
+        for level, role in ((1, "manager_1"), (2, "manager_2")):
+            manager = CustomUser.objects.create_user(username=role, password="password123", role=role)
+            Approval.objects.create(purchase_request=self.request, approver=manager, level=level, approved=True)
+            self.request.record_decision(level, approved=True, approver=manager)
+        self.client = APIClient()
+        self.client.force_authenticate(self.finance)
+
+    def test_finance_approval_defers_pdf_and_email(self):
+        response = self.client.patch(f"/api/v1/approve-request/{self.request.id}/", {"comments": ""}, format="json")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["purchase_order"]["file_status"], "pending")
+        self.assertIsNone(response.data["purchase_order"]["po_file"])
+        self.assertEqual(len(mail.outbox), 0)
+
+        job = run_job(claim_next("test"))
+        self.assertEqual(job.status, "succeeded")
+        po = PurchaseOrder.objects.get(purchase_request=self.request)
+        self.assertEqual(po.file_status, "ready")
+        self.assertTrue(po.po_file.name.endswith(".pdf"))
+
+        # A retry after success must not email the requester again.
+        run_job(job)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+        Mailer().deliver(claim_batch("test"))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].attachments[0][0], f"{po.po_number}.pdf")
+
+    def test_failed_po_creation_rolls_back_the_approval(self):
+        with mock.patch("P_order.views.enqueue", side_effect=RuntimeError("queue down")):
+            with self.assertRaises(RuntimeError):
+                self.client.patch(f"/api/v1/approve-request/{self.request.id}/", {"comments": ""}, format="json")
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.status, "pending")
+        self.assertFalse(Approval.objects.filter(purchase_request=self.request, level=3).exists())
+        self.assertFalse(PurchaseOrder.objects.exists())
+
+    def test_po_download_is_content_addressed_and_immutable(self):
+        self.client.patch(f"/api/v1/approve-request/{self.request.id}/", {"comments": ""}, format="json")
+        run_job(claim_next("test"))
+        po = PurchaseOrder.objects.get(purchase_request=self.request)
+
+        response = self.client.get(f"/api/v1/download/po/{po.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn(response["ETag"].strip('"'), po.po_file.name)
+        self.assertIn(f'filename="{po.po_number}.pdf"', response["Content-Disposition"])
+        self.assertEqual(b"".join(response.streaming_content)[:5], b"%PDF-")
+
+        response = self.client.get(f"/api/v1/download/po/{po.id}/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_rendering_failure_marks_file_failed(self):
+        self.client.patch(f"/api/v1/approve-request/{self.request.id}/", {"comments": ""}, format="json")
+        before = PurchaseRequest.objects.get(pk=self.request.pk).updated_at
+        with mock.patch("P_order.jobs.render_purchase_order", side_effect=RuntimeError("boom")), \
+                mock.patch("P_order.jobs.MAX_ATTEMPTS", 1):
+            job = run_job(claim_next("test"))
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(PurchaseOrder.objects.get(purchase_request=self.request).file_status, "failed")
+        # The request's validators must change, or clients keep seeing "pending".
+        self.assertGreater(PurchaseRequest.objects.get(pk=self.request.pk).updated_at, before)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+class PurchaseOrderPdfTests(SimpleTestCase):
+    """The cached template layer renders the same pages as drawing every part."""
+
+    def setUp(self):
+        self.approver = mock.Mock(username="finance", get_full_name=lambda: "Finance Officer")
+
+    def page_texts(self, data):
+        document = open_pdf("pdfplumber", data)
+        try:
+            return [document.page_text(i) for i in range(len(document))]
+        finally:
+            document.close()
+
+    def test_cached_parts_match_drawn_parts(self):
+        for items in (1, 50):
+            po = make_po(items, random.Random(items))
+            cached = render_purchase_order(po, self.approver)
+            drawn = render_purchase_order(po, self.approver, cached=False)
+            self.assertEqual(self.page_texts(cached), self.page_texts(drawn))
+            self.assertEqual(len(cached), len(drawn))
+
+    def test_ascii85_is_off_for_the_document_only(self):
+        data = render_purchase_order(make_po(1, random.Random(0)), self.approver)
+        self.assertNotIn(b"ASCII85Decode", data)
+        self.assertEqual(rl_config.useA85, 1)
+
+    def test_draws_parts_when_reportlab_internals_are_missing(self):
+        po = make_po(50, random.Random(2))
+        with mock.patch("P_order.po_pdf._compiled", {}):
+            data = render_purchase_order(po, self.approver)
+        self.assertEqual(self.page_texts(data), self.page_texts(render_purchase_order(po, self.approver)))
+
+
+class ProformaDataTests(TestCase):
+    LINES = ["Vendor: Acme Ltd", "2 x Chairs @ 50.00", "Total: 100.00"]
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        memory_cache.clear()
+        self.addCleanup(memory_cache.clear)
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+
+    def test_upload_stores_proforma_data(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        response = client.post(
+            "/api/v1/purchase-request/",
+            {"title": "Chairs", "description": "d", "proforma": SimpleUploadedFile("quote.pdf", proforma_pdf(self.LINES))},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertIsNone(PurchaseRequest.objects.get(pk=response.data["id"]).proforma_data)
+
+        run_job(claim_next("w1"))
+        data = PurchaseRequest.objects.get(pk=response.data["id"]).proforma_data
+        self.assertEqual((data["vendor"], data["total_amount"]), ("Acme Ltd", 100.0))
+
+    def test_backfill_stores_missing_data(self):
+        missing = []
+        for title in ("A", "B", "C"):
+            pr = PurchaseRequest.objects.create(title=title, description="d", amount=100, created_by=self.staff)
+            pr.proforma.save("quote.pdf", SimpleUploadedFile("quote.pdf", proforma_pdf(self.LINES)))
+            missing.append(pr)
+        PurchaseRequest.objects.filter(pk__in=[pr.pk for pr in missing]).update(proforma_data=None)
+        done = PurchaseRequest.objects.create(title="D", description="d", amount=1, created_by=self.staff, proforma_data={"vendor": "Kept"})
+        done.proforma.save("quote.pdf", SimpleUploadedFile("quote.pdf", proforma_pdf(self.LINES)))
+
+        refresh = PurchaseRequest.refresh_from_db
+        deferred_loads = []
+
+        def record(instance, *args, **kwargs):
+            deferred_loads.append(kwargs.get("fields"))
+            return refresh(instance, *args, **kwargs)
+
+        out = StringIO()
+        with mock.patch.object(PurchaseRequest, "refresh_from_db", record):
+            call_command("backfill_proforma_data", stdout=out)
+        self.assertEqual(deferred_loads, [])
+        self.assertIn("for 3 requests (0 failed)", out.getvalue())
+        for pr in missing:
+            pr.refresh_from_db()
+            self.assertEqual(pr.proforma_data["vendor"], "Acme Ltd")
+        done.refresh_from_db()
+        self.assertEqual(done.proforma_data, {"vendor": "Kept"})
+
+
+class DocumentJobHandlerTests(TestCase):
+    """The upload endpoints' 202 paths and what their jobs do once a worker runs them."""
+
+    PROFORMA = ["Vendor: Acme Ltd", "2 x Chairs @ 50.00", "Total: 100.00"]
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        memory_cache.clear()
+        self.addCleanup(memory_cache.clear)
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def upload_proforma(self, **data):
+        data.setdefault("title", "Chairs")
+        data.setdefault("description", "d")
+        data["proforma"] = SimpleUploadedFile("quote.pdf", proforma_pdf(self.PROFORMA))
+        response = self.client.post("/api/v1/purchase-request/", data, format="multipart")
+        self.assertEqual(response.status_code, 202, response.data)
+        return response
+
+    def poll(self, job_id):
+        response = self.client.get(f"/api/v1/jobs/{job_id}/")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_proforma_job_is_queued_and_reported(self):
+        response = self.upload_proforma()
+        job = DocumentJob.objects.get()
+        self.assertEqual((job.kind, job.status, job.purchase_request_id), ("proforma", "queued", response.data["id"]))
+        self.assertEqual(response.data["job"]["id"], job.id)
+        self.assertEqual(self.poll(job.id)["status"], "queued")
+
+        run_job(claim_next("w1"))
+        polled = self.poll(job.id)
+        self.assertEqual(polled["status"], "succeeded")
+        self.assertEqual((polled["result"]["vendor"], polled["result"]["items_created"]), ("Acme Ltd", 1))
+
+        other = CustomUser.objects.create_user(username="other", password="password123", role="staff")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f"/api/v1/jobs/{job.id}/").status_code, 404)
+
+    def test_proforma_job_fills_in_missing_items(self):
+        response = self.upload_proforma()
+        run_job(claim_next("w1"))
+        purchase = PurchaseRequest.objects.get(pk=response.data["id"])
+        self.assertEqual(purchase.proforma_data["vendor"], "Acme Ltd")
+        self.assertEqual(
+            list(purchase.items.values_list("description", "quantity", "unit_price")),
+            [("Chairs", 2, Decimal("50.00"))],
+        )
+        self.assertEqual(purchase.amount, Decimal("100.00"))
+
+    def test_proforma_job_keeps_submitted_items(self):
+        items = [{"description": "Desk", "quantity": 1, "unit_price": "80.00"}]
+        response = self.upload_proforma(items=json.dumps(items))
+        job = run_job(claim_next("w1"))
+        purchase = PurchaseRequest.objects.get(pk=response.data["id"])
+        self.assertEqual(job.result["items_created"], 0)
+        self.assertEqual(list(purchase.items.values_list("description", flat=True)), ["Desk"])
+        self.assertEqual(purchase.amount, Decimal("80.00"))
+        self.assertEqual(purchase.proforma_data["total_amount"], 100.0)
+
+    def submit_receipt(self, lines):
+        purchase = PurchaseRequest.objects.create(title="Chairs", description="d", amount=100, created_by=self.staff, status="approved")
+        po = PurchaseOrder.objects.create(
+            purchase_request=purchase, po_number=f"PO-{purchase.id}", vendor="Acme Ltd", total_amount=Decimal("100.00"),
+            item_snapshot=[{"description": "Chairs", "quantity": 2, "unit_price": 50.0}],
+        )
+        PurchaseRequest.objects.filter(pk=purchase.pk).update(purchase_order=po)
+        response = self.client.post(
+            f"/api/v1/submit-receipt/{purchase.id}/",
+            {"receipt_file": SimpleUploadedFile("receipt.pdf", proforma_pdf(lines))},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 202, response.data)
+        job = DocumentJob.objects.get(kind="receipt", purchase_request=purchase)
+        self.assertEqual((job.status, job.receipt_id), ("queued", response.data["receipt"]["id"]))
+        self.assertEqual(self.poll(job.id)["status"], "queued")
+        run_job(claim_next("w1"))
+        return Receipt.objects.get(pk=job.receipt_id), self.poll(job.id)
+
+    def test_receipt_job_validates_against_the_po(self):
+        receipt, polled = self.submit_receipt(["Seller: Acme Ltd", "2 x Chairs @ 50.00", "Total: 100.00"])
+        self.assertEqual(polled["status"], "succeeded")
+        self.assertTrue(receipt.validated)
+        self.assertEqual(receipt.discrepancies, [])
+        self.assertEqual(receipt.extracted_data["total_amount"], 100.0)
+        self.assertEqual(polled["result"]["validated"], True)
+
+    def test_receipt_job_records_discrepancies(self):
+        receipt, polled = self.submit_receipt(["Seller: Other Store", "3 x Chairs @ 50.00", "Total: 150.00"])
+        self.assertFalse(receipt.validated)
+        types = {issue["type"] for issue in receipt.discrepancies}
+        self.assertTrue({"vendor_mismatch", "amount_mismatch", "quantity_mismatch"} <= types, types)
+        self.assertEqual(polled["result"]["discrepancies"], receipt.discrepancies)
+
+    def test_receipt_needs_a_purchase_order(self):
+        purchase = PurchaseRequest.objects.create(title="Chairs", description="d", amount=100, created_by=self.staff)
+        response = self.client.post(
+            f"/api/v1/submit-receipt/{purchase.id}/",
+            {"receipt_file": SimpleUploadedFile("receipt.pdf", proforma_pdf(["Total: 1.00"]))},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DocumentJob.objects.exists())
+
+
+class DocumentJobQueueTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.request = PurchaseRequest.objects.create(title="Chairs", description="d", amount=100, created_by=self.staff)
+
+    def job(self, **fields):
+        fields.setdefault("kind", "proforma")
+        return DocumentJob.objects.create(purchase_request=self.request, created_by=self.staff, **fields)
+
+    def test_claims_oldest_runnable_job_once(self):
+        later = self.job(run_after=timezone.now() + timedelta(minutes=5))
+        first = self.job(run_after=timezone.now() - timedelta(minutes=2))
+        second = self.job(run_after=timezone.now() - timedelta(minutes=1))
+
+        job = claim_next("w1")
+        self.assertEqual((job.pk, job.status, job.attempts, job.locked_by), (first.pk, "running", 1, "w1"))
+        self.assertEqual(claim_next("w2").pk, second.pk)
+        self.assertIsNone(claim_next("w3"))
+        self.assertEqual(DocumentJob.objects.get(pk=later.pk).status, "queued")
+
+    def test_failures_back_off_exponentially(self):
+        self.job(kind="proforma")
+        with mock.patch.dict("P_order.jobs.HANDLERS", {"proforma": mock.Mock(side_effect=RuntimeError("boom"))}):
+            for attempt in (1, 2):
+                started = timezone.now()
+                job = run_job(claim_next("w1"))
+                self.assertEqual((job.status, job.attempts, job.error), ("queued", attempt, "boom"))
+                delay = job.run_after - started
+                self.assertGreaterEqual(delay, RETRY_DELAY * 2 ** (attempt - 1))
+                self.assertLess(delay, RETRY_DELAY * 2 ** (attempt - 1) + timedelta(seconds=5))
+                DocumentJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            job = run_job(claim_next("w1"))
+        self.assertEqual((job.status, job.attempts), ("failed", MAX_ATTEMPTS))
+        self.assertIsNone(claim_next("w1"))
+
+    def test_reclaims_jobs_of_dead_workers(self):
+        stale = timezone.now() - LOCK_TIMEOUT - timedelta(seconds=1)
+        job = self.job(status="running", attempts=1, locked_by="dead", locked_at=stale)
+        self.job(status="running", attempts=1, locked_by="alive", locked_at=timezone.now())
+
+        claimed = claim_next("w1")
+        self.assertEqual((claimed.pk, claimed.attempts, claimed.locked_by), (job.pk, 2, "w1"))
+        self.assertIsNone(claim_next("w2"))
+
+    def test_dead_letters_reclaimed_job_on_its_last_attempt(self):
+        po = PurchaseOrder.objects.create(
+            purchase_request=self.request, po_number="PO-1", vendor="Acme", item_snapshot=[], total_amount=100
+        )
+        stale = timezone.now() - LOCK_TIMEOUT - timedelta(seconds=1)
+        dead = self.job(kind="purchase_order", status="running", attempts=MAX_ATTEMPTS, locked_by="dead", locked_at=stale)
+        queued = self.job()
+
+        self.assertEqual(claim_next("w1").pk, queued.pk)
+        dead.refresh_from_db()
+        self.assertEqual((dead.status, dead.attempts, dead.locked_by), ("failed", MAX_ATTEMPTS, ""))
+        self.assertIsNotNone(dead.finished_at)
+        # The failure handler ran, as it does for a job that raised on its last attempt.
+        po.refresh_from_db()
+        self.assertEqual(po.file_status, "failed")
+
+
+class SearchTests(TransactionTestCase):
+    """Runs with real commits: documents are rebuilt by on_commit callbacks."""
+
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.other = CustomUser.objects.create_user(username="other", password="password123", role="staff")
+        self.manager = CustomUser.objects.create_user(username="manager", password="password123", role="manager_1")
+        self.in_title = PurchaseRequest.objects.create(title="Laptop stand", description="Desk", amount=10, created_by=self.staff)
+        self.in_body = PurchaseRequest.objects.create(title="Bags", description="Laptop sleeves", amount=10, created_by=self.other)
+        self.unrelated = PurchaseRequest.objects.create(title="Chairs", description="Office", amount=10, created_by=self.staff)
+
+    def ids(self, query, user=None):
+        return [pk for pk, _ in search(query, user=user or self.manager)]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.ids("laptop"), [self.in_title.pk, self.in_body.pk])
+        self.assertEqual(self.ids("lapt"), [self.in_title.pk, self.in_body.pk])
+        self.assertEqual(self.ids("laptop desk"), [self.in_title.pk])
+        self.assertEqual(self.ids("laptop", self.staff), [self.in_title.pk])
+
+    def test_changes_are_reindexed(self):
+        RequestItem.objects.create(purchase_request=self.unrelated, description="Ergonomic cushion", quantity=1, unit_price=5)
+        self.assertEqual(self.ids("ergonomic"), [self.unrelated.pk])
+        po = PurchaseOrder.objects.create(
+            purchase_request=self.unrelated, po_number="PO-1", vendor="Zebra Supplies", item_snapshot=[], total_amount=5
+        )
+        self.assertEqual(self.ids("zebra"), [self.unrelated.pk])
+        po.delete()
+        self.assertEqual(self.ids("zebra"), [])
+
+    def test_one_rebuild_per_transaction_and_none_after_rollback(self):
+        with mock.patch("P_order.search.build_document") as build:
+            with transaction.atomic():
+                self.unrelated.save()
+                RequestItem.objects.create(purchase_request=self.unrelated, description="Pad", quantity=1, unit_price=5)
+            self.assertEqual(build.call_count, 1)
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.unrelated.save()
+                raise RuntimeError
+            self.assertEqual(build.call_count, 1)
+            with transaction.atomic():
+                self.unrelated.save()
+            self.assertEqual(build.call_count, 2)
+
+    def test_other_databases_match_substrings(self):
+        with mock.patch.object(connection, "vendor", "mysql"):
+            self.assertEqual(self.ids("laptop"), [self.in_title.pk, self.in_body.pk])
+            self.assertEqual(self.ids("laptop desk"), [self.in_title.pk])
+            self.assertEqual(self.ids("laptop", self.staff), [self.in_title.pk])
+
+
+class LLMClientTests(SimpleTestCase):
+    """Runs the shared LLM client against the local stub server."""
+
+    PROMPT = "Extract:\nVendor: Acme Ltd\n2 x Chairs @ 50.00\nTotal: 100.00"
+
+    def setUp(self):
+        self.server = StubLLMServer().start()
+        self.addCleanup(self.server.stop)
+
+    def make_client(self, **kwargs):
+        options = {"base_url": self.server.url, "api_key": "test", "model": "stub", "timeout": 2, "max_concurrency": 4}
+        options.update(kwargs)
+        return LLMClient(**options)
+
+    def test_answers_reuse_one_connection(self):
+        client = self.make_client()
+        for _ in range(3):
+            result = client.extract_json("system", self.PROMPT)
+            self.assertEqual(result["vendor"], "Acme Ltd")
+            self.assertEqual(result["total_amount"], 100.0)
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_disabled_without_key(self):
+        self.assertIsNone(self.make_client(api_key="").extract_json("system", self.PROMPT))
+        self.assertEqual(self.server.requests, 0)
+
+    def test_slow_upstream_times_out_and_opens_breaker(self):
+        self.server.delay = 0.5
+        client = self.make_client(timeout=0.1, breaker_threshold=2, breaker_cooldown=60)
+        started = time.monotonic()
+        self.assertIsNone(client.extract_json("system", self.PROMPT))
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertIsNone(client.extract_json("system", self.PROMPT))
+        self.assertEqual(client.breaker.state, "open")
+
+        self.assertIsNone(client.extract_json("system", self.PROMPT))
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(client.stats["short_circuited"], 1)
+
+    def test_breaker_recovers_after_cooldown(self):
+        self.server.status = 503
+        client = self.make_client(breaker_threshold=1, breaker_cooldown=0.05)
+        self.assertIsNone(client.extract_json("system", self.PROMPT))
+        self.assertEqual(client.breaker.state, "open")
+        self.server.status = 200
+        time.sleep(0.06)
+        self.assertEqual(client.extract_json("system", self.PROMPT)["vendor"], "Acme Ltd")
+        self.assertEqual(client.breaker.state, "closed")
+
+    def test_concurrency_limit_sheds_excess_calls(self):
+        self.server.delay = 0.3
+        client = self.make_client(max_concurrency=1, timeout=1)
+        holder = threading.Thread(target=client.extract_json, args=("system", self.PROMPT))
+        holder.start()
+        time.sleep(0.05)
+        self.assertIsNone(client.extract_json("system", self.PROMPT, timeout=0.1))
+        holder.join()
+        self.assertEqual(client.stats["busy"], 1)
+        self.assertEqual(client.stats["succeeded"], 1)
+
+    def test_regex_fallback_when_provider_fails(self):
+        self.server.status = 500
+        buffer = BytesIO()
+        pdf = canvas.Canvas(buffer)
+        for n, line in enumerate(["Vendor: Acme Ltd", "2 x Chairs @ 50.00", "Total: 100.00"]):
+            pdf.drawString(50, 800 - 20 * n, line)
+        pdf.save()
+        client = self.make_client()
+        with mock.patch("P_order.document_processor.get_client", return_value=client):
+            data = extract_proforma_data(SimpleUploadedFile("p.pdf", buffer.getvalue(), content_type="application/pdf"))
+        self.assertEqual(client.stats["failed"], 1)
+        self.assertEqual(data["vendor"], "Acme Ltd")
+        self.assertEqual(data["total_amount"], 100.0)
+        self.assertEqual(data["extraction"]["source"], "regex_fallback")
+
+
+class ExtractionCacheTests(TestCase):
+    def setUp(self):
+        memory_cache.clear()
+        self.addCleanup(memory_cache.clear)
+
+    def extract(self, source):
+        extractor = mock.Mock(return_value={"vendor": "Acme", "extraction": {"status": "ok", "source": source}})
+        for _ in range(2):
+            data = cached_extraction("proforma", BytesIO(f"doc-{source}".encode()), extractor)
+        return data, extractor.call_count
+
+    def test_results_are_reused(self):
+        data, calls = self.extract("regex")
+        self.assertEqual((data["vendor"], calls), ("Acme", 1))
+        self.assertEqual(ExtractionCacheEntry.objects.count(), 1)
+
+    def test_regex_fallback_is_not_stored(self):
+        data, calls = self.extract("regex_fallback")
+        self.assertEqual((data["vendor"], calls), ("Acme", 2))
+        self.assertFalse(ExtractionCacheEntry.objects.exists())
+
+
+class SandboxTests(SimpleTestCase):
+    def pdf(self, pages):
+        buffer = BytesIO()
+        pdf = canvas.Canvas(buffer)
+        for n in range(pages):
+            pdf.drawString(50, 800, f"Page {n + 1}")
+            pdf.showPage()
+        pdf.save()
+        return SimpleUploadedFile("doc.pdf", buffer.getvalue(), content_type="application/pdf")
+
+    def test_waiting_for_a_slot_counts_against_the_timeout(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        started = time.monotonic()
+        with mock.patch("P_order.sandbox._slots", slots):
+            outcome = extract_text_sandboxed(self.pdf(1), timeout=0.2)
+        self.assertEqual(outcome.status, "timeout")
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_child_reads_pages_without_the_process_pool(self):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        with mock.patch("P_order.document_processor.PDF_PARALLEL_MIN_PAGES", 1), \
+                mock.patch("P_order.document_processor.PDF_EXTRACTION_PROCESSES", 4), \
+                mock.patch("P_order.document_processor._get_pool", side_effect=AssertionError("pool used")):
+            # Run in this process without resource limits.
+            sandbox_child(sender, "doc.pdf", "application/pdf", self.pdf(3).read(), (), None, None, None)
+        status, text, detail = receiver.recv()
+        self.assertEqual(status, "ok", detail)
+        self.assertIn("Page 3", text)
+
+
+class ReceiptMatchingTests(SimpleTestCase):
+    po_data = {
+        "vendor": "Acme Ltd",
+        "total_amount": 250.0,
+        "item_snapshot": [
+            {"description": "Office chair", "quantity": 4, "unit_price": 50.0},
+            {"description": "A4 paper ream", "quantity": 10, "unit_price": 5.0},
+        ],
+    }
+
+    def test_ocr_variants_and_split_lines_validate(self):
+        receipt = {
+            "seller": "Acme Ltd",
+            "total_amount": 250.0,
+            "items": [
+                {"description": "A4 PAPER REAMS", "quantity": 10, "unit_price": 5.0},
+                {"description": "0ffice chairs", "quantity": 2, "unit_price": 50.0},
+                {"description": "Office chair", "quantity": 2, "unit_price": 50.0},
+            ],
+        }
+        result = validate_receipt_against_po(receipt, self.po_data)
+        self.assertEqual(result["discrepancies"], [])
+        self.assertTrue(result["validated"])
+
+    def test_reports_quantity_price_and_unknown_items(self):
+        receipt = {
+            "seller": "Acme Ltd",
+            "items": [
+                {"description": "Office chair", "quantity": 3, "unit_price": 50.0},
+                {"description": "A4 paper ream", "quantity": 10, "unit_price": 6.0},
+                {"description": "Coffee", "quantity": 1, "unit_price": 3.0},
+            ],
+        }
+        result = validate_receipt_against_po(receipt, self.po_data)
+        self.assertFalse(result["validated"])
+        self.assertEqual(
+            sorted(d["type"] for d in result["discrepancies"]),
+            ["price_mismatch", "quantity_mismatch", "unexpected_item"],
+        )
+
+    def test_reports_missing_items(self):
+        receipt = {"seller": "Acme Ltd", "items": [{"description": "Office chair", "quantity": 4, "unit_price": 50.0}]}
+        result = validate_receipt_against_po(receipt, self.po_data)
+        missing = [d for d in result["discrepancies"] if d["type"] == "missing_item"]
+        self.assertEqual([d["po_item"] for d in missing], ["A4 paper ream"])
+
+    def test_assignment_is_one_to_one(self):
+        po = [{"description": "blue pen"}, {"description": "blue pen refill"}]
+        receipt = [{"description": "blue pen refills"}, {"description": "blue pens"}]
+        result = match_items(po, receipt)
+        pairs = {m["po_index"]: m["receipt_indexes"] for m in result["matches"]}
+        self.assertEqual(pairs, {0: [1], 1: [0]})
+        self.assertEqual(result["unmatched_po"], [])
+        self.assertEqual(result["unmatched_receipt"], [])
+
+
+    def look_alikes(self, n):
+        po = [{"description": f"office chair model {k}"} for k in range(n)]
+        receipt = [{"description": f"0ffice chair modl {k}"} for k in range(n)]
+        return po, receipt
+
+    def test_large_groups_skip_the_exact_assignment(self):
+        po, receipt = self.look_alikes(ITEM_ASSIGNMENT_LIMIT * 6)
+        with mock.patch("P_order.matching._assign", wraps=matching_assign) as exact:
+            start = time.perf_counter()
+            result = match_items(po, receipt)
+            elapsed = time.perf_counter() - start
+        exact.assert_not_called()
+        self.assertLess(elapsed, 2.0)
+        self.assertEqual([m["receipt_indexes"] for m in result["matches"]], [[k] for k in range(len(po))])
+
+    def test_groups_within_the_limit_use_the_exact_assignment(self):
+        po, receipt = self.look_alikes(ITEM_ASSIGNMENT_LIMIT)
+        with mock.patch("P_order.matching._assign", wraps=matching_assign) as exact:
+            result = match_items(po, receipt)
+        exact.assert_called_once()
+        self.assertEqual(len(result["matches"]), ITEM_ASSIGNMENT_LIMIT)
+
+class DownloadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.data = bytes(range(256)) * 40
+        user = CustomUser.objects.create_user(username="staff", password="password123", role="staff")
+        self.request = PurchaseRequest.objects.create(title="Chairs", description="d", amount=100, created_by=user)
+        self.request.proforma.save("quote.pdf", SimpleUploadedFile("quote.pdf", self.data))
+        self.url = f"/api/v1/download/proforma/{self.request.id}/"
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_full_download_and_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.data)}")
+        self.assertEqual(b"".join(response.streaming_content), self.data[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), self.data[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.data)}-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, f"bytes */{len(self.data)}"))
+
+        # A stale If-Range, or several ranges, get the whole file.
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=0-9,20-29").status_code, 200)
+
+    def test_offload_modes_send_headers_only(self):
+        with mock.patch("P_order.downloads.MODE", "x-accel-redirect"):
+            response = self.client.get(self.url, HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.request.proforma.name}")
+        self.assertEqual(response.content, b"")
+
+        with mock.patch("P_order.downloads.MODE", "x-sendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Sendfile"], self.request.proforma.path)
+        self.assertIn("ETag", response)
+
+    def test_missing_file_is_404(self):
+        os.remove(self.request.proforma.path)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class EarlyStopTests(SimpleTestCase):
+    """How much of a PDF is read before the probed fields are all found."""
+
+    def read(self, pages):
+        # Head pages, then the last one, then the middle, as page_order yields them.
+        return sorted(_read_pages(iter(pages), ("vendor", "total"), None))
+
+    def test_subtotal_and_line_amounts_are_not_the_total(self):
+        pages = [(0, "Vendor: Acme\nAmount: 50.00"), (1, "Subtotal: 90.00"), (3, "Notes"), (2, "Total: 99.00")]
+        self.assertEqual(self.read(pages), [0, 1, 2, 3])
+
+    def test_keeps_reading_while_items_run_on(self):
+        pages = [(0, "Vendor: Acme\n2 x Chair @ 50.00"), (1, "1 x Desk @ 80.00"), (5, "Total: 180.00"),
+                 (2, "1 x Lamp @ 10.00"), (3, "Delivery within 5 days"), (4, "Signature")]
+        self.assertEqual(self.read(pages), [0, 1, 2, 3, 5])
+
+    def test_stops_once_fields_are_found_and_items_ended(self):
+        pages = [(0, "Vendor: Acme"), (1, "Notes"), (4, "2 x Chair @ 50.00\nTotal: 100.00"), (2, "x"), (3, "y")]
+        self.assertEqual(self.read(pages), [0, 1, 4])
+
+
+SAMPLE_PDFS = sorted(Path(settings.BASE_DIR, "media").glob("*/*.pdf"))
+
+
+def sample_text(engine, path):
+    document = open_pdf(engine, path.read_bytes())
+    try:
+        return "\n".join(document.page_text(i) for i in range(len(document)))
+    finally:
+        document.close()
+
+
+@skipUnless(OCR_AVAILABLE, "Pillow or pytesseract is not installed")
+class OcrPreprocessTests(SimpleTestCase):
+    """Each preprocessing step on small synthetic images; Tesseract itself is not run."""
+
+    def page(self, size=(800, 600), box=(300, 200, 500, 260), desk=0):
+        image = Image.new("L", size, 0 if desk else 255)
+        if desk:
+            ImageDraw.Draw(image).rectangle((desk, desk, size[0] - desk, size[1] - desk), fill=255)
+        ImageDraw.Draw(image).rectangle(box, fill=0)
+        return image
+
+    def test_threshold_splits_a_bimodal_image(self):
+        image = Image.new("L", (100, 100), 40)
+        image.paste(200, (0, 0, 100, 50))
+        self.assertTrue(40 <= otsu_threshold(image) < 200)
+
+    def test_oversized_images_are_downscaled(self):
+        self.assertEqual(downscale_factor(Image.new("RGB", (4000, 3000))), 0.6)
+        trusted = Image.new("RGB", (4000, 3000))
+        trusted.info["dpi"] = (600, 600)
+        self.assertEqual(downscale_factor(trusted), 0.5)
+        self.assertEqual(downscale_factor(Image.new("RGB", (1000, 800))), 1.0)
+        self.assertEqual(preprocess(Image.new("RGB", (4000, 3000), "white"), binarize=False).size, (2400, 1800))
+
+    def test_exif_rotation_is_applied(self):
+        for size, expected in (((200, 100), (100, 200)), ((4000, 2000), (1200, 2400))):
+            exif = Image.Exif()
+            exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise.
+            buffer = BytesIO()
+            Image.new("RGB", size, "white").save(buffer, "JPEG", exif=exif)
+            buffer.seek(0)
+            self.assertEqual(preprocess(Image.open(buffer), binarize=False).size, expected)
+
+    def test_crop_keeps_the_text_box(self):
+        for desk in (0, 40):
+            cropped = crop_to_text(self.page(desk=desk))
+            # The 200 x 60 box plus the margin, give or take the reduction factor.
+            self.assertAlmostEqual(cropped.width, 200 + 2 * 16, delta=8)
+            self.assertAlmostEqual(cropped.height, 60 + 2 * 16, delta=8)
+            self.assertEqual(cropped.getpixel((cropped.width // 2, cropped.height // 2)), 0)
+        blank = Image.new("L", (400, 300), 255)
+        self.assertEqual(crop_to_text(blank).size, blank.size)
+
+
+@skipUnless(PDFIUM_AVAILABLE, "pypdfium2 is not installed")
+class SamplePdfTests(SimpleTestCase):
+    """The uploaded documents in media/ read at least as well through pdfium as through pdfplumber."""
+
+    def test_pdfium_follows_the_page_layout(self):
+        text = sample_text("pdfium", Path(settings.BASE_DIR, "media/proformas/Invoice_1.pdf")).splitlines()
+        self.assertIn("goood 1 $9.00 $9.00", text)
+        self.assertIn("Total: $9.63", text)
+        parsed = parse_text("\n".join(text))
+        self.assertEqual(parsed["items"], [{"description": "goood", "quantity": 1, "unit_price": 9.0}])
+        self.assertEqual(parsed["total_amount"], 9.63)
+
+    def test_engines_agree_on_samples(self):
+        self.assertTrue(SAMPLE_PDFS)
+        for path in SAMPLE_PDFS:
+            with self.subTest(path.name):
+                fast = parse_text(sample_text("pdfium", path))
+                if path.name == "Homework_Assignment_IV.pdf":
+                    # Not an invoice; pdfplumber wraps its rubric table into a fake item row.
+                    self.assertEqual(fast["items"], [])
+                    continue
+                reference = parse_text(sample_text("pdfplumber", path))
+                self.assertEqual(fast["items"], reference["items"])
+                # pdfplumber garbles some overlapping runs ("TOTAL AMOUN$9T3:0.00");
+                # pdfium must find every total it finds.
+                self.assertIn(reference["total_amount"], (0.0, fast["total_amount"]))
+
+
+class ParsingTests(SimpleTestCase):
+    def items(self, text):
+        return [(i["description"], i["quantity"], i["unit_price"]) for i in parse_text(text)["items"]]
+
+    def test_item_shapes(self):
+        cases = {
+            "2 x Office chair @ 50.00": ("Office chair", 2, 50.0),
+            "3 x Desk lamp 12.50 37.50": ("Desk lamp", 3, 12.5),
+            "Office chair 2 x 50.00 100.00": ("Office chair", 2, 50.0),
+            "1. Laptop Lenovo ThinkPad X1 — Qty: 2 — Unit: $1200": ("Laptop Lenovo ThinkPad X1", 2, 1200.0),
+            "Toner cartridge, qty 4, price RWF 1,250.00": ("Toner cartridge", 4, 1250.0),
+            "Monitor Dell P2419H 3 $200 $600": ("Monitor Dell P2419H", 3, 200.0),
+            "2 Laptop 1200": ("Laptop", 2, 1200.0),
+            "5 Paper reams 4,50": ("Paper reams", 5, 4.5),
+        }
+        for line, expected in cases.items():
+            with self.subTest(line):
+                self.assertEqual(self.items(line), [expected])
+
+    def test_non_items(self):
+        for line in ("Item Qty Price Amount", "Date: 2025-11-25", "Subtotal: $3000", "Tax (7%): $0.63", "# 1"):
+            with self.subTest(line):
+                self.assertEqual(self.items(line), [])
+
+    def test_total_ignores_subtotal(self):
+        self.assertEqual(parse_text("Subtotal: $3000\nTax: $150\nTotal: $3150")["total_amount"], 3150.0)
+        self.assertEqual(parse_text("Subtotal: $3000\nTax: $150")["total_amount"], 0.0)
+        self.assertEqual(parse_text("Total Paid: $3,150.00")["total_amount"], 3150.0)
+        self.assertEqual(parse_text("Balance Due: $9.63\nGrand Total: 9.63 USD")["total_amount"], 9.63)
+
+    def test_headings_and_labels_are_not_the_vendor(self):
+        parsed = parse_text("INVOICE\n# 1\nItem Qty Price Amount\nBalance Due: $9.63\nIsmail business\n2 Laptop 1200")
+        self.assertEqual(parsed["vendor"], "Ismail business")
+        self.assertEqual(parse_text("FROM: TO:\nVendor: Acme Ltd")["vendor"], "Acme Ltd")
+
+    def test_long_lines_stay_fast(self):
+        text = "Vendor: Acme\n" + "word 12 " * 2000 + "\n2 x Chair @ 50.00\n" + "a" * 16000
+        start = time.perf_counter()
+        parsed = parse_text(text)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(parsed["items"], [{"description": "Chair", "quantity": 2, "unit_price": 50.0}])
+
+    def test_sample_documents(self):
+        media = Path(settings.BASE_DIR, "media")
+        expected = {
+            "proformas/Invoice_1.pdf": ("Ismail business", [("goood", 1, 9.0)], 9.63),
+            "proformas/Untitled_document.pdf": (
+                "Acme Supplies Ltd.",
+                [("Laptop Lenovo ThinkPad X1", 2, 1200.0), ("Monitor Dell P2419H", 3, 200.0)],
+                3150.0,
+            ),
+            "receipts/sample_receipt.pdf": (
+                "Acme Supplies Ltd.",
+                [("Laptop Lenovo ThinkPad X1", 2, 1200.0), ("Monitor Dell P2419H", 3, 200.0)],
+                3150.0,
+            ),
+            "receipts/now_result.pdf": (None, [("good one", 11, 10.0)], 121.0),
+        }
+        for name, (vendor, items, total) in expected.items():
+            with self.subTest(name):
+                parsed = parse_text(sample_text("pdfplumber", media / name))
+                if vendor:
+                    self.assertEqual(parsed["vendor"], vendor)
+                self.assertEqual(self.items(sample_text("pdfplumber", media / name)), items)
+                self.assertEqual(parsed["total_amount"], total)
+
+
+class LayoutTemplateTests(SimpleTestCase):
+    def setUp(self):
+        # The registry is module state; each test starts from an empty one.
+        for name, value in (("_templates", []), ("_fingerprints", None)):
+            patcher = mock.patch(f"P_order.parsing.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.kigali = register_template(LayoutTemplate(
+            name="kigali",
+            fingerprint=r"kigali\s+office\s+supplies",
+            vendor="Kigali Office Supplies Ltd",
+            item_patterns=[rf"{QTY}\s*\|\s*{DESC}\s*\|\s*{PRICE}"],
+            total_pattern=r"amount\s+payable\s*=\s*(?P<value>[\d.,]+)",
+        ))
+        self.umoja = register_template(LayoutTemplate(name="umoja", fingerprint=r"umoja\s+traders"))
+
+    def test_registered_layout_is_selected_by_its_marker(self):
+        self.assertIs(select_template("KIGALI OFFICE SUPPLIES\nProforma"), self.kigali)
+        self.assertIs(select_template("Umoja Traders\nQuotation"), self.umoja)
+        # Earlier registrations win when both markers appear.
+        self.assertIs(select_template("Umoja Traders, agents of Kigali Office Supplies"), self.kigali)
+
+    def test_generic_layout_is_the_fallback(self):
+        self.assertIs(select_template("Acme Ltd\nInvoice"), GENERIC)
+        # Only the start of the document is fingerprinted.
+        self.assertIs(select_template("x" * FINGERPRINT_WINDOW + "\nKigali Office Supplies"), GENERIC)
+        self.assertEqual(parse_text("Vendor: Acme Ltd\n2 x Chair @ 50.00")["template"], "generic")
+
+    def test_template_patterns_pull_its_fields(self):
+        parsed = parse_text("Kigali Office Supplies\nCustomer: IST\n3 | Toner cartridge | 1,250.00\nAmount payable = 3,750.00")
+        self.assertEqual(parsed["template"], "kigali")
+        self.assertEqual((parsed["vendor"], parsed["seller"]), ("Kigali Office Supplies Ltd", "Kigali Office Supplies Ltd"))
+        self.assertEqual(parsed["items"], [{"description": "Toner cartridge", "quantity": 3, "unit_price": 1250.0}])
+        self.assertEqual(parsed["total_amount"], 3750.0)
+        # The generic item shapes are not part of this layout.
+        self.assertEqual(parse_text("Kigali Office Supplies\n2 x Chair @ 50.00")["items"], [])
+
+    def test_fingerprint_is_required(self):
+        with self.assertRaises(ValueError):
+            register_template(LayoutTemplate(name="anonymous"))
@@ -7,9 +7,15 @@ urlpatterns=[
     path('purchase-request/',PurchaseRequestView.as_view(), name="purchase-request"),
     path('Get-purchase-request/',PurchaseRequestListView.as_view(), name="Get-purchase-request"),
     path('Get-purchase-request/<int:id>/', PurchaseRequestByIdView.as_view(), name="Get-purchase-request-by-id"),
+    path('inbox/', ApproverInboxView.as_view(), name="inbox"),
+    path('cache-stats/', CacheStatsView.as_view(), name="cache-stats"),
+    path('export/', ExportView.as_view(), name="export"),
+    path('search/', SearchView.as_view(), name="search"),
+    path('reports/spend/', SpendReportView.as_view(), name="spend-report"),
     path('update-purchase-request/<int:id>/',UpdatePurchaseRequestView.as_view(), name="update-purchase-request"),
     path('approve-request/<int:id>/',ApproveRequestView.as_view(), name="approve-request"),
     path('reject-request/<int:id>/',RejectRequestView.as_view(), name="reject-request"),
     path('submit-receipt/<int:id>/', SubmitReceiptView.as_view(), name="submit-receipt"),
+    path('jobs/<int:id>/', DocumentJobView.as_view(), name="document-job"),
     path('download/<str:file_type>/<int:file_id>/', DownloadFileView.as_view(), name="download-file"),
 ]
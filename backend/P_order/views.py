@@ -1,24 +1,39 @@
 from rest_framework.response import Response
 from rest_framework.decorators import permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
-from django.http import FileResponse, Http404
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
 from django.conf import settings
+from django.db import transaction
 import os
+from datetime import datetime
     
 import json
 from rest_framework import status
+from rest_framework.utils.urls import replace_query_param
 
-from django.core.files.base import ContentFile
-from django.core.mail import EmailMessage
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from io import BytesIO
 
 from  accounts.permissions import *
+from notifications.digest import notify
 from .serializer import *
 from .models import *
-from .document_processor import extract_proforma_data, extract_receipt_data, validate_receipt_against_po
+from .analytics import record_purchase_order, record_rejection, spend_report
+from .cache import ResponseCache, cache_stats, detail_scope, list_scope
+from .conditional import Validators
+from .downloads import serve_file
+from .exports import DATASETS, OUTPUTS
+from .filters import filter_purchase_requests
+from .jobs import enqueue
+from .pagination import KeysetPagination, OldestFirstKeysetPagination
+from .querysets import (
+    awaiting_level,
+    inbox_age_counts,
+    purchase_request_queryset,
+    purchase_request_summary_queryset,
+    purchase_requests_for,
+)
+from .search import search
 
 # Create your views here.
 
@@ -26,32 +41,193 @@ from .document_processor import extract_proforma_data, extract_receipt_data, val
 
 class PurchaseRequestListView(APIView):
     permission_classes=[IsAuthenticated]
+    pagination_class = KeysetPagination
+    cache_responses = True
 
-    def get(self, request):
-        role = getattr(request.user, 'role', None)
+    def scope_queryset(self, request, queryset):
+        return purchase_requests_for(request.user, queryset)
 
-        if role == 'staff':
-        
-            purchase = PurchaseRequest.objects.filter(created_by=request.user)
-        else:
-        
-            purchase = PurchaseRequest.objects.all()
+    def get_validators(self, request, keys):
+        return Validators.for_page(request, keys)
+
+    def extra_data(self, request):
+        return {}
 
-        serializers = PurchaseRequestSerialzer(purchase, many=True)
-        return Response(serializers.data, status=status.HTTP_200_OK)
+    def get(self, request):
+        response_cache = ResponseCache(request, list_scope(request.user), enabled=self.cache_responses)
+        cached = response_cache.lookup(request)
+        if cached is not None:
+            return cached
+
+        if request.query_params.get("view") == "summary":
+            purchase = self.scope_queryset(request, purchase_request_summary_queryset())
+            serializer_class, options = PurchaseRequestSummarySerializer, {}
+        else:
+            fields, expand = requested_fields(request)
+            selected = PurchaseRequestSerialzer.selected_fields(fields, expand)
+            purchase = self.scope_queryset(request, purchase_request_queryset(selected))
+            serializer_class, options = PurchaseRequestSerialzer, {"fields": fields, "expand": expand}
+
+        purchase = filter_purchase_requests(purchase, request.query_params, request.user)
+        paginator = self.pagination_class()
+        validators = self.get_validators(request, paginator.page_keys(purchase, request))
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        page = paginator.paginate_queryset(purchase, request, view=self)
+        serializers = serializer_class(page, many=True, context={"request": request}, **options)
+        response = paginator.get_paginated_response(serializers.data)
+        response.data.update(self.extra_data(request))
+        return response_cache.store(validators.apply(response), validators)
     
 
 
+class ApproverInboxView(PurchaseRequestListView):
+    """
+    Requests actionable at the caller's approval level, oldest first,
+    with counts by age.
+    """
+    permission_classes=[IsAuthenticated, IsApprover]
+    pagination_class = OldestFirstKeysetPagination
+    # The age counts change with the clock, not with writes, so no
+    # invalidation would ever catch them.
+    cache_responses = False
+
+    def scope_queryset(self, request, queryset):
+        return awaiting_level(queryset, APPROVAL_LEVEL_BY_ROLE[request.user.role])
+
+    def get_validators(self, request, keys):
+        # Age buckets shift with time alone, so they are part of the ETag.
+        self.counts = inbox_age_counts(APPROVAL_LEVEL_BY_ROLE[request.user.role])
+        return Validators.for_page(request, keys, *sorted(self.counts.items()))
+
+    def extra_data(self, request):
+        return {"level": APPROVAL_LEVEL_BY_ROLE[request.user.role], "counts": self.counts}
+
+
 class PurchaseRequestByIdView(APIView):
     permission_classes=[IsAuthenticated,Is_Staff]
     def get(self, request, id):
-        try:
-            purchase=PurchaseRequest.objects.get(id=id, created_by=request.user)
-        except PurchaseRequest.DoesNotExist:
+        response_cache = ResponseCache(request, detail_scope(id))
+        cached = response_cache.lookup(request)
+        if cached is not None:
+            return cached
+
+        fields, expand = requested_fields(request)
+        selected = PurchaseRequestSerialzer.selected_fields(fields, expand)
+        queryset = purchase_request_queryset(selected).filter(id=id, created_by=request.user)
+
+        validators = Validators.for_queryset(request, queryset)
+        if not validators.count:
             return Response({"error":"Purchase Request not found."}, status=status.HTTP_404_NOT_FOUND)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        purchase = queryset.get()
+        serializer=PurchaseRequestSerialzer(purchase, context={"request": request}, fields=fields, expand=expand)
+        return response_cache.store(validators.apply(Response(serializer.data, status=status.HTTP_200_OK)), validators)
+
+
+class SearchView(APIView):
+    """
+    Full-text search over titles, descriptions, line items, PO vendors and
+    extracted document text. ?q=..., ?page=1, ?page_size=20. Best match first.
+    """
+    permission_classes=[IsAuthenticated]
+    page_size = 20
+    max_page_size = 100
+    max_results = 1000
+
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"q": ["This parameter is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(int(request.query_params.get("page", 1)), 1)
+            page_size = min(max(int(request.query_params.get("page_size", self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            return Response({"page": ["Expected an integer."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        offset = (page - 1) * page_size
+        if offset >= self.max_results:
+            return Response({"page": ["Refine the query to see more results."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = search(query, user=request.user, limit=page_size + 1, offset=offset)
+        has_more = len(hits) > page_size and offset + page_size < self.max_results
+        hits = hits[:page_size]
+        rows = purchase_request_summary_queryset().in_bulk([pk for pk, _ in hits])
+        results = []
+        for pk, rank in hits:
+            if pk in rows:
+                results.append({**PurchaseRequestSummarySerializer(rows[pk]).data, "rank": rank})
+
+        base_url = request.build_absolute_uri()
+        return Response({
+            "next": replace_query_param(base_url, "page", page + 1) if has_more else None,
+            "previous": replace_query_param(base_url, "page", page - 1) if page > 1 else None,
+            "results": results,
+        }, status=status.HTTP_200_OK)
+
+
+class ExportView(APIView):
+    """
+    Stream purchase requests as CSV or NDJSON.
+    ?dataset=line_items|requests|purchase_orders, ?output=csv|ndjson, plus the list filters.
+    """
+    permission_classes=[IsAuthenticated, Is_Finance]
+
+    def get(self, request):
+        dataset = request.query_params.get("dataset", "line_items")
+        output = request.query_params.get("output", "csv")
+        if dataset not in DATASETS:
+            return Response({"dataset": [f"Expected one of: {', '.join(DATASETS)}."]}, status=status.HTTP_400_BAD_REQUEST)
+        if output not in OUTPUTS:
+            return Response({"output": [f"Expected one of: {', '.join(OUTPUTS)}."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        requests = filter_purchase_requests(PurchaseRequest.objects.all(), request.query_params, request.user)
+        header, rows = DATASETS[dataset](requests)
+        stream, content_type = OUTPUTS[output]
+
+        response = StreamingHttpResponse(stream(header, rows), content_type=content_type)
+        filename = f"{dataset}-{timezone.now():%Y%m%d-%H%M%S}.{output}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class SpendReportView(APIView):
+    """
+    Spend totals read from the rollup tables.
+    ?dimension=vendor|requester|month|outcome, optional ?from=YYYY-MM&to=YYYY-MM.
+    """
+    permission_classes=[IsAuthenticated, IsApprover]
+    dimensions = ("vendor", "requester", "month", "outcome")
+
+    def get(self, request):
+        dimension = request.query_params.get("dimension", "vendor")
+        if dimension not in self.dimensions:
+            return Response({"dimension": [f"Expected one of: {', '.join(self.dimensions)}."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        bounds = {}
+        for param in ("from", "to"):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    bounds[param] = datetime.strptime(value, "%Y-%m").date()
+                except ValueError:
+                    return Response({param: ["Expected YYYY-MM."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = spend_report(dimension, bounds.get("from"), bounds.get("to"))
+        return Response({"dimension": dimension, "results": rows}, status=status.HTTP_200_OK)
+
 
-        serializer=PurchaseRequestSerialzer(purchase)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+class CacheStatsView(APIView):
+    """Hit/miss counters for the purchase request response cache."""
+    permission_classes=[IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats(), status=status.HTTP_200_OK)
             
 
 class PurchaseRequestView(APIView):
@@ -60,7 +236,6 @@ class PurchaseRequestView(APIView):
     def post(self, request):
       
         proforma_file = request.FILES.get('proforma')
-        proforma_data = None
         
 
         data = {}
@@ -91,21 +266,27 @@ class PurchaseRequestView(APIView):
                     pass
         
         if proforma_file:
-          
-            proforma_data = extract_proforma_data(proforma_file)
-            
-          
-            if proforma_data.get('items') and not data.get('items'):
-                data['items'] = proforma_data['items']
-            
-         
             data['proforma'] = proforma_file
         
         serializer = PurchaseRequestSerialzer(data=data, context={"request": request})
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        instance = serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if not proforma_file:
+            instance = serializer.save()
+            instance = purchase_request_queryset().get(pk=instance.pk)
+            return Response(
+                PurchaseRequestSerialzer(instance, context={"request": request}).data,
+                status=status.HTTP_201_CREATED,
+            )
+
+        # Extraction runs in run_doc_worker; the client polls the job for the result.
+        with transaction.atomic():
+            instance = serializer.save()
+            job = enqueue("proforma", instance, request.user)
+        instance = purchase_request_queryset().get(pk=instance.pk)
+        body = PurchaseRequestSerialzer(instance, context={"request": request}).data
+        body["job"] = DocumentJobSerializer(job).data
+        return Response(body, status=status.HTTP_202_ACCEPTED)
     
 
 class UpdatePurchaseRequestView(APIView):
@@ -136,53 +317,64 @@ class UpdatePurchaseRequestView(APIView):
                     )
             else:
                 data[key] = value
+
+        extra = {}
+        proforma_file = request.FILES.get('proforma')
+        if proforma_file:
+            extra['proforma_data'] = None
         
         serializer=PurchaseRequestSerialzer(purchase, data=data, context={"request": request})  
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with transaction.atomic():
+            instance = serializer.save(**extra)
+            job = enqueue("proforma", instance, request.user) if proforma_file else None
+        instance = purchase_request_queryset().get(pk=instance.pk)
+        body = PurchaseRequestSerialzer(instance, context={"request": request}).data
+        if job is None:
+            return Response(body, status=status.HTTP_200_OK)
+        body["job"] = DocumentJobSerializer(job).data
+        return Response(body, status=status.HTTP_202_ACCEPTED)
              
 
 
 
 
-def send_staff_notification(subject, message, staff_email, attachment=None, filename=None):
-    email = EmailMessage(
-        subject=subject,
-        body=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        to=[staff_email],
-    )
-    if attachment and filename:
-        email.attach(filename, attachment, 'application/pdf')
-    email.send()
-
 class ApproveRequestView(APIView):
     permission_classes = [IsAuthenticated, IsApprover]
 
     def patch(self, request, id):
-        try:
-            purchase = PurchaseRequest.objects.get(id=id)
-        except PurchaseRequest.DoesNotExist:
-            return Response({"error": "Purchase Request not found"}, status=404)
-
-        if purchase.status != "pending":
-            return Response({"error": f"Request is already {purchase.status}"}, status=400)
-
         role = request.user.role
-        if role == "manager_1":
-            level = 1
-        elif role == "manager_2":
-            level = 2
-        elif role == "finance":
-            level = 3
-        else:
+        level = APPROVAL_LEVEL_BY_ROLE.get(role)
+        if level is None:
             return Response({"error": "Unauthorized role"}, status=403)
 
         comments = request.data.get("comments", "")
 
-   
-        if level in (1, 2):
+        with transaction.atomic():
+            try:
+                purchase = PurchaseRequest.objects.select_for_update().select_related("created_by").get(id=id)
+            except PurchaseRequest.DoesNotExist:
+                return Response({"error": "Purchase Request not found"}, status=404)
+
+            if purchase.status != "pending":
+                return Response({"error": f"Request is already {purchase.status}"}, status=400)
+
+            if purchase.next_level != level:
+                if level == 3:
+                    message = "Finance approval requires both level 1 and level 2 approvals first."
+                elif purchase.next_level is None or level < purchase.next_level:
+                    message = f"Request is already approved at level {level}."
+                else:
+                    message = f"Request is awaiting level {purchase.next_level} approval first."
+                return Response({"message": message}, status=400)
+
+            if level == 3 and purchase.proforma and purchase.proforma_data is None:
+                # The PO's vendor comes from the proforma; never issue one before it is read.
+                return Response(
+                    {"error": "The proforma has not been read yet. Approve again once its document job has finished."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
             Approval.objects.create(
                 purchase_request=purchase,
                 approver=request.user,
@@ -190,35 +382,33 @@ class ApproveRequestView(APIView):
                 approved=True,
                 comments=comments,
             )
-            send_staff_notification(
-                subject="Purchase Requested for Approval",
-                    message=f"Your Purchase Request '{purchase.title}' has been approved at {role}.",
-                    staff_email=purchase.created_by.email
-            )
-    
-        approved_levels = list(
-            purchase.approvals.filter(approved=True).values_list("level", flat=True)
-        )
+            purchase.record_decision(level, approved=True, approver=request.user)
+            if level != 3:
+                notify(
+                    purchase.created_by,
+                    subject="Purchase Requested for Approval",
+                    body=f"Your Purchase Request '{purchase.title}' has been approved at {role}.",
+                )
+            else:
+                # Same transaction as the approval: a request is never left
+                # approved without its PO, nor a PO without its PDF job.
+                po, job = self.generate_po(purchase, request.user)
 
-    
         if level == 3:
-            if 1 in approved_levels and 2 in approved_levels:
-                return self.generate_po(purchase, request.user)
             return Response(
                 {
-                    "message": "Finance approval requires both level 1 and level 2 approvals first.",
+                    "message": "Purchase Order created; its PDF is being generated.",
+                    "purchase_order": PurchaseOrderSerializer(po, context={"request": request}).data,
+                    "job": DocumentJobSerializer(job).data,
                 },
-                status=400,
+                status=status.HTTP_202_ACCEPTED,
             )
 
         return Response({"message": f"Approved at level {level}."}, status=200)
 
 
     def generate_po(self, purchase, approver):
-
-        purchase.status = "approved"
-        purchase.approved_by = approver
-        purchase.save()
+        """Create the PO and queue its PDF; call inside the approval's transaction."""
 
         po_number = f"PO-{purchase.id}-{purchase.created_at.strftime('%Y%m%d')}"
 
@@ -233,25 +423,15 @@ class ApproveRequestView(APIView):
 
         total_amount = sum(i["quantity"] * i["unit_price"] for i in items_snapshot)
 
-        vendor_name = "Vendor Name"
-        if purchase.proforma:
-            try:
-                purchase.proforma.seek(0)
-                proforma_data = extract_proforma_data(purchase.proforma)
-
-            
-                print("PROFORMA_DATA:", proforma_data)
-
-                vendor_value = proforma_data.get('vendor')
-                print("PROFORMA VENDOR VALUE:", vendor_value)
-
-                if vendor_value:
-                    vendor_name = vendor_value
-            except Exception as e:
-                print("ERROR IN extract_proforma_data:", e)
-                pass
+        # Extracted when the proforma was uploaded (or by backfill_proforma_data);
+        # approval never parses the document itself. Without a proforma, or when
+        # none was found in it, the vendor is left blank rather than made up.
+        vendor_name = (purchase.proforma_data or {}).get('vendor') or ""
+        vendor_name = vendor_name[:PurchaseOrder._meta.get_field('vendor').max_length]
 
 
+        # The PDF and the email to the requester are produced by the document
+        # worker; the PO exists as soon as the approval commits.
         po = PurchaseOrder.objects.create(
             purchase_request=purchase,
             po_number=po_number,
@@ -259,254 +439,54 @@ class ApproveRequestView(APIView):
             item_snapshot=items_snapshot,
             total_amount=total_amount,
         )
-
-      
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
-        
-    
-        dark_blue_r, dark_blue_g, dark_blue_b = 0.1, 0.2, 0.4
-        light_gray_r, light_gray_g, light_gray_b = 0.9, 0.9, 0.9
-        
-
-        c.setFillColorRGB(dark_blue_r, dark_blue_g, dark_blue_b)
-        c.rect(0, height - 100, width, 100, fill=1, stroke=0)
-    
-        c.setFillColorRGB(1, 1, 1)
-        c.setFont("Helvetica-Bold", 24)
-        c.drawString(50, height - 45, "IST AFRICA")
-        
-        c.setFont("Helvetica-Bold", 18)
-        c.drawString(50, height - 70, "PURCHASE ORDER")
-    
-        c.setFont("Helvetica-Bold", 12)
-        c.drawRightString(width - 50, height - 45, f"PO #: {po.po_number}")
-        c.setFont("Helvetica", 10)
-        c.drawRightString(width - 50, height - 65, f"Date: {purchase.created_at.strftime('%B %d, %Y')}")
-        c.drawRightString(width - 50, height - 80, f"Request ID: PR-{purchase.id}")
-        
-        y_position = height - 130
-    
-        c.setFillColorRGB(0, 0, 0)
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(50, y_position, "FROM:")
-        c.setFont("Helvetica", 10)
-        c.drawString(50, y_position - 15, "IST Africa")
-        c.drawString(50, y_position - 30, "Procurement Department")
-        c.drawString(50, y_position - 45, "Email: procurement@ist.africa")
-        
-       
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(300, y_position, "TO:")
-        c.setFont("Helvetica", 10)
-        vendor_lines = vendor_name.split('\n') if '\n' in vendor_name else [vendor_name]
-        for i, line in enumerate(vendor_lines[:4]): 
-            c.drawString(300, y_position - 15 - (i * 15), line[:50])
-        
-        y_position -= 80
-   
-        c.setFillColorRGB(light_gray_r, light_gray_g, light_gray_b)
-        c.rect(50, y_position - 20, width - 100, 50, fill=1, stroke=0)
-        c.setFillColorRGB(0, 0, 0)
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(60, y_position, "PURCHASE REQUEST DETAILS")
-        c.setFont("Helvetica", 9)
-        c.drawString(60, y_position - 15, f"Title: {purchase.title}")
-    
-        desc_lines = []
-        desc = purchase.description
-        while len(desc) > 80:
-            desc_lines.append(desc[:80])
-            desc = desc[80:]
-        if desc:
-            desc_lines.append(desc)
-        for i, line in enumerate(desc_lines[:2]): 
-            c.drawString(60, y_position - 30 - (i * 12), line)
-        
-        y_position -= 90
-        
-        
-
-        c.setFillColorRGB(dark_blue_r, dark_blue_g, dark_blue_b)
-        c.rect(50, y_position - 20, width - 100, 25, fill=1, stroke=0)
-        c.setFillColorRGB(1, 1, 1)
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(60, y_position - 5, "ITEM DESCRIPTION")
-        c.drawString(350, y_position - 5, "QTY")
-        c.drawString(400, y_position - 5, "UNIT PRICE")
-        c.drawString(480, y_position - 5, "TOTAL")
-        
-        y_position -= 35
-        
-    
-        c.setFillColorRGB(0, 0, 0)
-        c.setFont("Helvetica", 9)
-        row_height = 20
-        for idx, item in enumerate(items_snapshot):
-            
-            if idx % 2 == 0:
-                c.setFillColorRGB(light_gray_r, light_gray_g, light_gray_b)
-                c.rect(50, y_position - row_height, width - 100, row_height, fill=1, stroke=0)
-                c.setFillColorRGB(0, 0, 0)
-            
-            item_total = item['quantity'] * item['unit_price']
-            
-            
-            desc = item['description']
-            if len(desc) > 45:
-                desc = desc[:42] + "..."
-            c.drawString(60, y_position - 5, desc)
-            
-    
-            c.drawString(350, y_position - 5, str(item['quantity']))
-            
-            c.drawString(400, y_position - 5, f"${item['unit_price']:,.2f}")
-            
-    
-            c.drawString(480, y_position - 5, f"${item_total:,.2f}")
-            
-            y_position -= row_height
-            
-
-            if y_position < 200:
-                c.showPage()
-                y_position = height - 50
-        
-        
-        c.setStrokeColorRGB(0, 0, 0)
-        c.setLineWidth(1)
-        c.line(50, y_position, width - 50, y_position)
-        y_position -= 10
-        
-    
-        c.setFont("Helvetica", 9)
-        c.drawString(400, y_position, "Subtotal:")
-        c.drawString(480, y_position, f"${total_amount:,.2f}")
-        y_position -= 15
-        
-        c.drawString(400, y_position, "Tax (0%):")
-        c.drawString(480, y_position, "$0.00")
-        y_position -= 20
-        
-       
-        c.setFillColorRGB(dark_blue_r, dark_blue_g, dark_blue_b)
-        c.rect(380, y_position - 20, width - 430, 25, fill=1, stroke=0)
-        c.setFillColorRGB(1, 1, 1)
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(400, y_position - 5, "TOTAL AMOUNT:")
-        c.drawString(480, y_position - 5, f"${total_amount:,.2f}")
-        
-        y_position -= 50
-        
-       
-        c.setFillColorRGB(0, 0, 0)
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(50, y_position, "TERMS AND CONDITIONS:")
-        y_position -= 15
-        c.setFont("Helvetica", 8)
-        terms = [
-            "1. Delivery must be made within 30 days of PO approval.",
-            "2. All items must meet specified quality standards.",
-            "3. Payment terms: Net 30 days from invoice date.",
-            "4. This PO is subject to company approval and budget availability.",
-        ]
-        for term in terms:
-            c.drawString(60, y_position, term)
-            y_position -= 12
-        
-        y_position -= 20
-        
-     
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(50, y_position, "APPROVED BY:")
-        y_position -= 20
-        c.setFont("Helvetica", 9)
-        c.drawString(50, y_position, f"{approver.get_full_name() if hasattr(approver, 'get_full_name') and approver.get_full_name() else approver.username}")
-        c.drawString(50, y_position - 12, f"Finance Department")
-        c.drawString(50, y_position - 24, f"Date: {purchase.updated_at.strftime('%B %d, %Y')}")
-        
-
-        c.setLineWidth(0.5)
-        c.line(50, y_position - 35, 200, y_position - 35)
-        c.setFont("Helvetica", 7)
-        c.drawString(50, y_position - 42, "Authorized Signature")
-        
-
-        c.setFont("Helvetica", 7)
-        c.setFillColorRGB(0.5, 0.5, 0.5)
-    
-        c.drawCentredString(width / 2, 30, "This is a computer-generated document. No signature required.")
-        c.drawCentredString(width / 2, 20, f"Generated on {purchase.updated_at.strftime('%Y-%m-%d %H:%M:%S')}")
-
-        
-        c.showPage()
-        c.save()
-
-        pdf_bytes = buffer.getvalue()
-        buffer.close()
-
-        po_filename = f"{po_number}.pdf"
-        po.po_file.save(po_filename, ContentFile(pdf_bytes), save=True)
-        send_staff_notification(
-                subject="Purchase Request Fully Approved",
-    message=(
-        f"Hello {purchase.created_by.username},\n\n"
-        f"Your purchase request '{purchase.title}' has been fully approved.\n"
-        f"Purchase Order Number: {po.po_number}\n\n"
-        f"The PDF Purchase Order is attached."
-    ),
-    staff_email=purchase.created_by.email,
-    attachment=pdf_bytes,
-    filename=f"{po.po_number}.pdf"
-        ) 
+        record_purchase_order(po, purchase)
         purchase.purchase_order = po
         purchase.save(update_fields=["purchase_order"])
-
-        return  Response(
-            {"message": "Purchase Order generated successfully."},
-            status=status.HTTP_200_OK,
-        )
+        job = enqueue("purchase_order", purchase, approver)
+        return po, job
 
 
 class RejectRequestView(APIView):
     permission_classes=[IsAuthenticated, IsApprover]
     def patch(self, request, id):
-        try:
-       
-            purchase=PurchaseRequest.objects.get(id=id)
-        except PurchaseRequest.DoesNotExist:
-            return Response({"error":"Purchase Request not found."}, status=status.HTTP_404_NOT_FOUND)
-        if purchase.status !='pending':
-            return Response({"error":f"Purchase Request is already {purchase.status}."}, status=status.HTTP_400_BAD_REQUEST)
-        role = request.user.role
-        if role == "approver_level_1":
-            level = 1
-        elif role == "approver_level_2":
-            level = 2
-        else:
+        level = APPROVAL_LEVEL_BY_ROLE.get(request.user.role)
+        if level is None:
             return Response({"error": "Unauthorized role"}, status=403)
 
         comments = request.data.get("comments", "")
 
-        Approval.objects.create(
-            purchase_request=purchase,
-            approver=request.user,
-            level=level,
-            approved=False,
-            comments=comments,
-        )    
-        purchase.status = 'rejected'
-        purchase.save()
-        send_staff_notification(
-    subject="Purchase Request Rejected",
-    message=(
-        f"Hello {purchase.created_by.username},\n\n"
-        f"Your purchase request '{purchase.title}' has been rejected.\n"
-        f"Reason: {comments}"
-    ),
-    staff_email=purchase.created_by.email
-)
+        with transaction.atomic():
+            try:
+                purchase=PurchaseRequest.objects.select_for_update().select_related("created_by").get(id=id)
+            except PurchaseRequest.DoesNotExist:
+                return Response({"error":"Purchase Request not found."}, status=status.HTTP_404_NOT_FOUND)
+            if purchase.status !='pending':
+                return Response({"error":f"Purchase Request is already {purchase.status}."}, status=status.HTTP_400_BAD_REQUEST)
+            if purchase.next_level != level:
+                return Response(
+                    {"error": f"Request is awaiting level {purchase.next_level} review, not level {level}."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            Approval.objects.create(
+                purchase_request=purchase,
+                approver=request.user,
+                level=level,
+                approved=False,
+                comments=comments,
+            )
+            purchase.record_decision(level, approved=False, approver=request.user)
+            record_rejection(purchase)
+            notify(
+                purchase.created_by,
+                subject="Purchase Request Rejected",
+                body=(
+                    f"Hello {purchase.created_by.username},\n\n"
+                    f"Your purchase request '{purchase.title}' has been rejected.\n"
+                    f"Reason: {comments}"
+                ),
+            )
+
         return Response({"message": "Purchase Request rejected."}, status=status.HTTP_200_OK)
 
 
@@ -537,39 +517,33 @@ class SubmitReceiptView(APIView):
             )
         
         
-        receipt_data = extract_receipt_data(receipt_file)
-        
-        
-        po = purchase.purchase_order
-        po_data = {
-            "vendor": po.vendor,
-            "item_snapshot": po.item_snapshot,
-            "total_amount": float(po.total_amount),
-        }
-        
- 
-        validation_result = validate_receipt_against_po(receipt_data, po_data)
-        
-    
-        receipt = Receipt.objects.create(
-            purchase_request=purchase,
-            uploaded_by=request.user,
-            receipt_file=receipt_file,
-            extracted_data=receipt_data,
-            validated=validation_result["validated"],
-            discrepancies=validation_result["discrepancies"],
-        )
+        with transaction.atomic():
+            receipt = Receipt.objects.create(
+                purchase_request=purchase,
+                uploaded_by=request.user,
+                receipt_file=receipt_file,
+            )
+            job = enqueue("receipt", purchase, request.user, receipt=receipt)
         
-        serializer = ReceiptSerializer(receipt)
+        fields, expand = requested_fields(request)
+        serializer = ReceiptSerializer(receipt, context={"request": request}, fields=fields, expand=expand)
         
         return Response({
-            "message": "Receipt submitted successfully.",
+            "message": "Receipt submitted. Validation is running; poll the job for the result.",
             "receipt": serializer.data,
-            "validation": {
-                "validated": validation_result["validated"],
-                "discrepancies": validation_result["discrepancies"],
-            }
-        }, status=status.HTTP_201_CREATED)
+            "job": DocumentJobSerializer(job).data,
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class DocumentJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, id):
+        try:
+            job = DocumentJob.objects.get(id=id, created_by=request.user)
+        except DocumentJob.DoesNotExist:
+            return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(DocumentJobSerializer(job).data)
 
 
 class DownloadFileView(APIView):
@@ -585,40 +559,37 @@ class DownloadFileView(APIView):
         file_id: ID of the related object
         """
         try:
+            immutable = False
             if file_type == 'proforma':
                 purchase = PurchaseRequest.objects.get(id=file_id)
                 if not purchase.proforma:
                     raise Http404("Proforma not found")
-                file_path = purchase.proforma.path
+                field_file = purchase.proforma
                 filename = os.path.basename(purchase.proforma.name)
                 
             elif file_type == 'po':
                 po = PurchaseOrder.objects.get(id=file_id)
                 if not po.po_file:
                     raise Http404("PO file not found")
-                file_path = po.po_file.path
-                filename = os.path.basename(po.po_file.name)
+                field_file = po.po_file
+                filename = f"{po.po_number}.pdf"
+                # Rendered once and named by content.
+                immutable = True
                 
             elif file_type == 'receipt':
                 receipt = Receipt.objects.get(id=file_id)
                 if not receipt.receipt_file:
                     raise Http404("Receipt file not found")
-                file_path = receipt.receipt_file.path
+                field_file = receipt.receipt_file
                 filename = os.path.basename(receipt.receipt_file.name)
             else:
                 raise Http404("Invalid file type")
-            
-            if not os.path.exists(file_path):
-                raise Http404("File not found on server")
-            
-            response = FileResponse(
-                open(file_path, 'rb'),
-                content_type='application/pdf' if filename.lower().endswith('.pdf') else 'application/octet-stream'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response
+
+            return serve_file(request, field_file, filename, immutable=immutable)
             
         except (PurchaseRequest.DoesNotExist, PurchaseOrder.DoesNotExist, Receipt.DoesNotExist):
             raise Http404("File not found")
+        except Http404:
+            raise
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
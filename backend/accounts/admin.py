@@ -9,6 +9,6 @@ from .models import CustomUser
 
 
 class CustomUserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'role', 'is_staff', 'is_active','is_approved', 'is_superuser')
-    list_filter = ('role', 'is_staff', 'is_active',"is_approved", 'is_superuser')
+    list_display = ('username', 'email', 'role', 'is_staff', 'is_active','is_approved', 'notification_mode', 'is_superuser')
+    list_filter = ('role', 'is_staff', 'is_active',"is_approved", 'notification_mode', 'is_superuser')
 
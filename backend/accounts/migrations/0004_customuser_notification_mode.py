@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_customuser_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='notification_mode',
+            field=models.CharField(choices=[('immediate', 'immediate'), ('hourly', 'hourly digest'), ('daily', 'daily digest')], default='immediate', max_length=20),
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from django.core.mail import send_mail
-from django.conf import settings
+
+from notifications.outbox import queue_email
 
 
 # Create your models here.
@@ -19,8 +19,15 @@ class CustomUser(AbstractUser):
         ('finance', 'finance')
     )
 
+    NOTIFICATION_CHOICES = (
+        ('immediate', 'immediate'),
+        ('hourly', 'hourly digest'),
+        ('daily', 'daily digest'),
+    )
+
     role=models.CharField(max_length=30, choices=ROLE_CHOICES, default='staff')
     is_approved = models.BooleanField(default=False)
+    notification_mode = models.CharField(max_length=20, choices=NOTIFICATION_CHOICES, default='immediate')
 
     def  is_staff_user(self):
         return self.role == 'staff'
@@ -34,14 +41,12 @@ class CustomUser(AbstractUser):
     def is_finance(self):
         return self.role == 'finance'
     
-    def send_email(self):
+    def queue_approval_email(self):
         if self.is_approved:
-            send_mail(
+            queue_email(
                 subject="Your account has been approved",
-                message=f"Hello {self.username}, your account has been approved. You can now login: https://procuresystem.vercel.app/login",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[self.email],
-                fail_silently=False,
+                body=f"Hello {self.username}, your account has been approved. You can now login: https://procuresystem.vercel.app/login",
+                to=self.email,
             )
             
     def __init__(self, *args, **kwargs):
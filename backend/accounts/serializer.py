@@ -71,3 +71,9 @@ class AuthenticateSerialiser(serializers.ModelSerializer):
 
 
             
+
+
+class NotificationPreferenceSerializer(serializers.ModelSerializer):
+      class Meta:
+            model=CustomUser
+            fields=['notification_mode']
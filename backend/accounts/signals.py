@@ -8,4 +8,4 @@ def send_approval_email(sender, instance, created, **kwargs):
     if not created:
      
         if instance.is_approved and instance.last_approval_status != instance.is_approved:
-            instance.send_email()
+            instance.queue_approval_email()
@@ -1,11 +1,12 @@
 from django.urls import path
 
 
-from .views import RegisterView,LoginView
+from .views import RegisterView,LoginView,NotificationPreferenceView
 
 
 
 urlpatterns=[
 path('register/', RegisterView.as_view(), name="register"),
 path('login/', LoginView.as_view(), name="login"),
+path('notification-preferences/', NotificationPreferenceView.as_view(), name="notification-preferences"),
 ]
\ No newline at end of file
@@ -1,12 +1,12 @@
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import permission_classes
 
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .serializer import RegisterSerializer, AuthenticateSerialiser
+from .serializer import RegisterSerializer, AuthenticateSerialiser, NotificationPreferenceSerializer
 from .models import CustomUser
 
 
@@ -21,7 +21,7 @@ class RegisterView(APIView):
         serializer=RegisterSerializer(data=request.data)
         if serializer.is_valid():
             user=serializer.save()
-            user.send_email()
+            user.queue_approval_email()
             return Response('user created succcessfully', status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -49,11 +49,18 @@ class LoginView(APIView):
                 'user': serializer.validated_data["username"],
                 'role': user.role,
             }, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)    
-
-
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 
+class NotificationPreferenceView(APIView):
+    permission_classes=[IsAuthenticated]
 
+    def get(self, request):
+        return Response(NotificationPreferenceSerializer(request.user).data)
 
+    def patch(self, request):
+        serializer=NotificationPreferenceSerializer(request.user, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
@@ -0,0 +1,18 @@
+from django.contrib import admin
+
+from .models import NotificationEvent, OutboxEmail
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+   list_display=["id", "subject", "status", "attempts", "next_attempt_at", "created_at", "sent_at"]
+   list_filter=["status"]
+   search_fields=["subject", "last_error"]
+
+
+@admin.register(NotificationEvent)
+class NotificationEventAdmin(admin.ModelAdmin):
+   list_display=["id", "recipient", "subject", "created_at", "digested_at", "email"]
+   list_filter=["digested_at"]
+   search_fields=["subject", "recipient__username"]
+   raw_id_fields=["recipient", "email"]
@@ -0,0 +1,115 @@
+"""
+Per-user notification digests.
+
+``notify`` is what views call to tell a user something. Users in
+``immediate`` mode get an outbox email straight away. Users who chose an
+hourly or daily digest get a ``NotificationEvent`` row instead, and
+``manage.py send_digests`` folds each recipient's pending events into one
+outbox email once their period has closed. An approver clearing a queue of
+a hundred requests from the same requester then costs that requester one
+email rather than a hundred.
+
+Periods are aligned to the clock: an hourly digest covers events up to the
+top of the hour, and a daily digest covers events up to
+``NOTIFICATION_DIGEST_HOUR`` (in ``TIME_ZONE``). The scheduler is stateless,
+so running it late or twice just sends whatever has become due.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import NotificationEvent
+from .outbox import queue_email
+
+logger = logging.getLogger(__name__)
+
+DIGEST_HOUR = getattr(settings, "NOTIFICATION_DIGEST_HOUR", 8)
+DIGEST_LABELS = {"hourly": "an hourly digest", "daily": "a daily digest"}
+
+
+def notify(user, subject, body):
+    """
+    Tell ``user`` something, by email now or in their next digest. Call it
+    inside the transaction that makes the change being reported.
+    """
+    mode = getattr(user, "notification_mode", "immediate")
+    if mode not in DIGEST_LABELS:
+        return queue_email(subject, body, user.email)
+    if not user.email:
+        return None
+    return NotificationEvent.objects.create(recipient=user, subject=subject[:255], body=body)
+
+
+def period_end(mode, now):
+    """Events created before this moment are due for a recipient in ``mode``."""
+    if mode == "hourly":
+        return now.replace(minute=0, second=0, microsecond=0)
+    if mode == "daily":
+        local = timezone.localtime(now)
+        end = local.replace(hour=DIGEST_HOUR, minute=0, second=0, microsecond=0)
+        return end if end <= local else end - timedelta(days=1)
+    # Immediate (e.g. the user switched back from a digest): flush what is left.
+    return now
+
+
+def render_digest(recipient, mode, events):
+    """Subject and body of one digest. A single event is sent as it was written."""
+    if len(events) == 1:
+        return events[0].subject, events[0].body
+    lines = [f"Hello {recipient['recipient__username']},", "", f"You have {len(events)} updates:", ""]
+    for n, event in enumerate(events, 1):
+        stamp = timezone.localtime(event.created_at).strftime("%Y-%m-%d %H:%M")
+        lines.append(f"{n}. {event.subject} ({stamp})")
+        lines.extend(f"   {line}" if line else "" for line in event.body.strip().splitlines())
+        lines.append("")
+    if mode in DIGEST_LABELS:
+        lines.append(f"You receive these updates as {DIGEST_LABELS[mode]}.")
+    return f"{len(events)} purchase request updates", "\n".join(lines)
+
+
+def send_digests(now=None):
+    """
+    Queue one email per recipient whose digest period has closed. Returns
+    (digests queued, events folded into them).
+    """
+    now = now or timezone.now()
+    recipients = (
+        NotificationEvent.objects.filter(digested_at__isnull=True)
+        .values("recipient_id", "recipient__username", "recipient__email", "recipient__notification_mode")
+        .annotate(oldest=Min("created_at"))
+        .order_by("oldest")
+    )
+    digests = folded = 0
+    for recipient in recipients:
+        mode = recipient["recipient__notification_mode"]
+        end = period_end(mode, now)
+        if recipient["oldest"] >= end:
+            continue
+        with transaction.atomic():
+            events = list(
+                NotificationEvent.objects.select_for_update(skip_locked=True)
+                .filter(recipient_id=recipient["recipient_id"], digested_at__isnull=True, created_at__lt=end)
+                .order_by("created_at", "id")
+            )
+            if not events:
+                continue
+            ids = [event.pk for event in events]
+            # Backends without row locks (SQLite) fall back to compare-and-set:
+            # if another scheduler got any of these first, leave them to it.
+            claimed = NotificationEvent.objects.filter(pk__in=ids, digested_at__isnull=True).update(digested_at=now)
+            if claimed != len(ids):
+                transaction.set_rollback(True)
+                continue
+            subject, body = render_digest(recipient, mode, events)
+            email = queue_email(subject, body, recipient["recipient__email"])
+            if email is not None:
+                NotificationEvent.objects.filter(pk__in=ids).update(email=email)
+                digests += 1
+            folded += len(ids)
+    if digests:
+        logger.info("Queued %s digests covering %s notifications.", digests, folded)
+    return digests, folded
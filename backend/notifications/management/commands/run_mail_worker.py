@@ -0,0 +1,64 @@
+import json
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notifications.outbox import BATCH_SIZE, Mailer, claim_batch, queue_stats
+
+
+class Command(BaseCommand):
+    help = "Deliver queued emails in batches over a reused SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the outbox and exit instead of polling.")
+        parser.add_argument("--sleep", type=float, default=5.0, help="Seconds to wait when the outbox is empty.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+        parser.add_argument("--stats", action="store_true", help="Print outbox counts as JSON and exit.")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.stdout.write(json.dumps(queue_stats(), indent=2))
+            return
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        worker_id = options["worker_id"]
+        mailer = Mailer()
+        self.stdout.write(f"Mail worker {worker_id} started.")
+        try:
+            while not self.stopping:
+                close_old_connections()
+                batch = claim_batch(worker_id, options["batch_size"])
+                if not batch:
+                    # Don't hold an SMTP connection open while idle.
+                    mailer.close()
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+                    continue
+                start = time.monotonic()
+                sent, failed = mailer.deliver(batch)
+                elapsed = time.monotonic() - start
+                self.stdout.write(
+                    f"Batch of {len(batch)}: {sent} sent, {failed} failed in {elapsed:.2f}s "
+                    f"({sent / elapsed if elapsed else 0:.1f} msg/s)"
+                )
+        finally:
+            mailer.close()
+
+        stats = mailer.stats
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {stats['sent']} in {stats['batches']} batches over {stats['connections']} connections "
+            f"({mailer.throughput:.1f} msg/s); {stats['retrying']} retrying, {stats['dead']} dead-lettered."
+        ))
+
+    def stop(self, signum, frame):
+        # Finish the current batch, then exit.
+        self.stopping = True
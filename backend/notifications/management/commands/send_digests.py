@@ -0,0 +1,32 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notifications.digest import send_digests
+
+
+class Command(BaseCommand):
+    help = "Fold pending notification events into one digest email per recipient."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Send whatever is due and exit, e.g. from cron.")
+        parser.add_argument("--sleep", type=float, default=60.0, help="Seconds between checks.")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while not self.stopping:
+            close_old_connections()
+            digests, events = send_digests()
+            if digests or options["once"]:
+                self.stdout.write(f"Queued {digests} digests covering {events} notifications.")
+            if options["once"]:
+                break
+            time.sleep(options["sleep"])
+
+    def stop(self, signum, frame):
+        self.stopping = True
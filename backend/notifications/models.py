@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be sent. Rows are written in the same transaction as
+    the change they report and delivered by ``manage.py run_mail_worker``.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'pending'),
+        ('sending', 'sending'),
+        ('sent', 'sent'),
+        ('dead', 'dead'),
+    )
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True, default="")
+    to = models.JSONField(default=list)
+    # [{"filename", "path", "mimetype"}] of files in default storage.
+    attachments = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at", "id"], name="outbox_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}"
+
+
+class NotificationEvent(models.Model):
+    """
+    A notification held back for a recipient who gets digests. ``manage.py
+    send_digests`` folds a recipient's pending events into one outbox email
+    and marks them with it.
+    """
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="notification_events")
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+    digested_at = models.DateTimeField(null=True, blank=True)
+    email = models.ForeignKey(OutboxEmail, on_delete=models.SET_NULL, null=True, blank=True, related_name="events")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["digested_at", "recipient", "created_at"], name="notification_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.recipient}"
@@ -0,0 +1,216 @@
+"""
+Transactional email outbox.
+
+Code that changes state calls ``queue_email`` inside the same transaction,
+so a message is stored exactly when the change is committed, and a slow or
+failing mail server can no longer turn a committed change into a 500.
+
+``manage.py run_mail_worker`` claims pending messages in batches with
+``SELECT ... FOR UPDATE SKIP LOCKED``, as the document queue does. It sends
+them over one SMTP connection that stays open while there is mail. Transient
+failures are retried with exponential backoff. Permanent rejections (5xx)
+and messages that run out of attempts are dead-lettered: they stay in the
+table with status ``dead`` and their last error. Delivery is at least once:
+each message is marked ``sent`` as soon as it goes out, so a worker that
+dies mid-batch leaves only the unsent rows in ``sending``, and those are
+reclaimed after ``LOCK_TIMEOUT`` (or dead-lettered if that was their last
+attempt). ``EMAIL_TIMEOUT`` must stay well below ``LOCK_TIMEOUT`` so a hung
+SMTP call cannot outlast the claim.
+"""
+import logging
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, "MAIL_BATCH_SIZE", 50)
+MAX_ATTEMPTS = getattr(settings, "MAIL_MAX_ATTEMPTS", 6)
+RETRY_DELAY = timedelta(seconds=getattr(settings, "MAIL_RETRY_DELAY", 30))
+MAX_RETRY_DELAY = timedelta(seconds=getattr(settings, "MAIL_MAX_RETRY_DELAY", 3600))
+LOCK_TIMEOUT = timedelta(seconds=getattr(settings, "MAIL_LOCK_TIMEOUT", 300))
+
+
+class PermanentFailure(Exception):
+    """The message can never be delivered as it stands."""
+
+
+def queue_email(subject, body, to, attachments=(), from_email=None):
+    """
+    Store an email for the delivery worker. Call it inside the transaction that
+    makes the change being reported. ``attachments`` are
+    ``(filename, storage path, mimetype)`` for files already in default
+    storage. Returns None when there is no one to send to.
+    """
+    recipients = [to] if isinstance(to, str) else list(to)
+    recipients = [address for address in recipients if address]
+    if not recipients:
+        return None
+    return OutboxEmail.objects.create(
+        subject=subject[:255],
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or "",
+        to=recipients,
+        attachments=[
+            {"filename": filename, "path": path, "mimetype": mimetype}
+            for filename, path, mimetype in attachments
+        ],
+    )
+
+
+def claim_batch(worker_id, size=BATCH_SIZE):
+    """Lock up to ``size`` due messages for this worker, oldest first."""
+    now = timezone.now()
+    runnable = Q(status="pending", next_attempt_at__lte=now) | Q(status="sending", locked_at__lt=now - LOCK_TIMEOUT)
+    with transaction.atomic():
+        ids = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(runnable)
+            .order_by("next_attempt_at", "id")
+            .values_list("id", flat=True)[:size]
+        )
+        if not ids:
+            return []
+        # A message whose worker died during its last attempt is not sent again.
+        dead = OutboxEmail.objects.filter(
+            pk__in=ids, status="sending", locked_at__lt=now - LOCK_TIMEOUT, attempts__gte=MAX_ATTEMPTS
+        ).update(
+            status="dead",
+            last_error="Worker stopped during the last attempt.",
+            locked_by="",
+            locked_at=None,
+        )
+        if dead:
+            logger.error("Dead-lettered %s emails whose worker stopped during their last attempt.", dead)
+        # Backends without row locks (SQLite) fall back to compare-and-set.
+        OutboxEmail.objects.filter(runnable, pk__in=ids).update(
+            status="sending",
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+    return list(OutboxEmail.objects.filter(pk__in=ids, status="sending", locked_by=worker_id, locked_at=now).order_by("id"))
+
+
+def build_message(email, connection):
+    message = EmailMessage(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or None,
+        to=email.to,
+        connection=connection,
+    )
+    for attachment in email.attachments:
+        if not default_storage.exists(attachment["path"]):
+            raise PermanentFailure(f"Attachment {attachment['path']} is missing.")
+        with default_storage.open(attachment["path"], "rb") as f:
+            message.attach(attachment["filename"], f.read(), attachment.get("mimetype"))
+    return message
+
+
+def is_permanent(error):
+    if isinstance(error, (PermanentFailure, smtplib.SMTPRecipientsRefused)):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+def backoff(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+class Mailer:
+    """Sends claimed batches over one reused connection and counts what happened."""
+
+    def __init__(self, connection=None):
+        self.connection = connection or get_connection()
+        self.opened = False
+        self.stats = {"batches": 0, "sent": 0, "retrying": 0, "dead": 0, "connections": 0, "seconds": 0.0}
+
+    @property
+    def throughput(self):
+        """Messages sent per second spent delivering."""
+        return self.stats["sent"] / self.stats["seconds"] if self.stats["seconds"] else 0.0
+
+    def _open(self):
+        if not self.opened:
+            self.connection.open()
+            self.opened = True
+            self.stats["connections"] += 1
+
+    def close(self):
+        if self.opened:
+            try:
+                self.connection.close()
+            finally:
+                self.opened = False
+
+    def _send(self, message):
+        self._open()
+        try:
+            self.connection.send_messages([message])
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server dropped an idle connection; reconnect once.
+            self.close()
+            self._open()
+            self.connection.send_messages([message])
+
+    def deliver(self, emails):
+        """Send a claimed batch and record each outcome. Returns (sent, failed)."""
+        start = time.monotonic()
+        sent = failed = 0
+        for email in emails:
+            try:
+                self._send(build_message(email, self.connection))
+            except Exception as e:
+                failed += 1
+                self._failed(email, e)
+                if not is_permanent(e):
+                    # The connection may be unusable; start the next message on a fresh one.
+                    self.close()
+            else:
+                # Record it now, so a worker that dies later in the batch only repeats the message in flight.
+                OutboxEmail.objects.filter(pk=email.pk).update(
+                    status="sent", sent_at=timezone.now(), last_error="", locked_by="", locked_at=None,
+                )
+                sent += 1
+
+        self.stats["batches"] += 1
+        self.stats["sent"] += sent
+        self.stats["seconds"] += time.monotonic() - start
+        return sent, failed
+
+    def _failed(self, email, error):
+        email.last_error = f"{type(error).__name__}: {error}"[:2000]
+        email.locked_by = ""
+        email.locked_at = None
+        if is_permanent(error) or email.attempts >= MAX_ATTEMPTS:
+            email.status = "dead"
+            self.stats["dead"] += 1
+            logger.error("Email %s dead-lettered after %s attempts: %s", email.pk, email.attempts, email.last_error)
+        else:
+            email.status = "pending"
+            email.next_attempt_at = timezone.now() + backoff(email.attempts)
+            self.stats["retrying"] += 1
+            logger.warning("Email %s failed (attempt %s), retrying: %s", email.pk, email.attempts, email.last_error)
+        email.save(update_fields=["status", "last_error", "next_attempt_at", "locked_by", "locked_at"])
+
+
+def queue_stats():
+    """Messages by status, the age of the oldest pending one and recent volume."""
+    now = timezone.now()
+    counts = dict(OutboxEmail.objects.values_list("status").annotate(n=Count("id")).order_by())
+    oldest = OutboxEmail.objects.filter(status="pending").aggregate(oldest=Min("created_at"))["oldest"]
+    return {
+        "by_status": {status: counts.get(status, 0) for status, _ in OutboxEmail.STATUS_CHOICES},
+        "oldest_pending_seconds": (now - oldest).total_seconds() if oldest else 0,
+        "sent_last_hour": OutboxEmail.objects.filter(status="sent", sent_at__gte=now - timedelta(hours=1)).count(),
+    }
@@ -0,0 +1,180 @@
+import smtplib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+
+from .digest import notify, send_digests
+from .models import NotificationEvent, OutboxEmail
+from .outbox import MAX_ATTEMPTS, Mailer, claim_batch, queue_email, queue_stats
+
+
+class CountingBackend(EmailBackend):
+    """locmem backend that counts connections and can fail chosen recipients."""
+
+    def __init__(self, failures=None, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures or {}
+        self.opens = 0
+
+    def open(self):
+        self.opens += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            error = self.failures.get(message.to[0])
+            if error is not None:
+                raise error
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class OutboxTests(TestCase):
+    def queue(self, count, **kwargs):
+        return [queue_email(f"Subject {n}", "Body", f"user{n}@example.com", **kwargs) for n in range(count)]
+
+    def test_rows_follow_the_transaction(self):
+        with transaction.atomic():
+            queue_email("Kept", "Body", "a@example.com")
+        try:
+            with transaction.atomic():
+                queue_email("Rolled back", "Body", "b@example.com")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(list(OutboxEmail.objects.values_list("subject", flat=True)), ["Kept"])
+        self.assertIsNone(queue_email("Nobody", "Body", ""))
+
+    def test_batches_share_one_connection(self):
+        self.queue(25)
+        backend = CountingBackend()
+        mailer = Mailer(backend)
+        while batch := claim_batch("w1", size=10):
+            mailer.deliver(batch)
+        mailer.close()
+
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertEqual(backend.opens, 1)
+        self.assertEqual((mailer.stats["batches"], mailer.stats["sent"]), (3, 25))
+        self.assertEqual(queue_stats()["by_status"]["sent"], 25)
+
+    def test_transient_failures_back_off_then_dead_letter(self):
+        email = queue_email("Flaky", "Body", "flaky@example.com")
+        backend = CountingBackend(failures={"flaky@example.com": smtplib.SMTPServerDisconnected("gone")})
+        mailer = Mailer(backend)
+
+        with mock.patch("notifications.outbox.MAX_ATTEMPTS", 2):
+            mailer.deliver(claim_batch("w1"))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ("pending", 1))
+            self.assertGreater(email.next_attempt_at, timezone.now())
+            self.assertEqual(claim_batch("w1"), [])  # Not due yet.
+
+            OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+            mailer.deliver(claim_batch("w1"))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ("dead", 2))
+        self.assertIn("SMTPServerDisconnected", email.last_error)
+        self.assertEqual(mailer.stats["dead"], 1)
+
+    def test_permanent_rejection_is_dead_lettered_at_once(self):
+        self.queue(3)
+        refused = smtplib.SMTPRecipientsRefused({"user1@example.com": (550, b"No such user")})
+        mailer = Mailer(CountingBackend(failures={"user1@example.com": refused}))
+
+        sent, failed = mailer.deliver(claim_batch("w1"))
+
+        self.assertEqual((sent, failed), (2, 1))
+        self.assertEqual(OutboxEmail.objects.get(to=["user1@example.com"]).status, "dead")
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_a_crash_mid_batch_keeps_earlier_messages_sent(self):
+        self.queue(4)
+        mailer = Mailer(CountingBackend(failures={"user2@example.com": SystemExit()}))
+
+        with self.assertRaises(SystemExit):
+            mailer.deliver(claim_batch("w1"))
+
+        statuses = dict(OutboxEmail.objects.values_list("subject", "status"))
+        self.assertEqual([statuses[f"Subject {n}"] for n in range(4)], ["sent", "sent", "sending", "sending"])
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_stale_claims_are_reclaimed(self):
+        self.queue(1)
+        self.assertEqual(len(claim_batch("crashed")), 1)
+        self.assertEqual(claim_batch("w2"), [])
+        OutboxEmail.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(len(claim_batch("w2")), 1)
+
+    def test_stale_claims_on_the_last_attempt_are_dead_lettered(self):
+        stuck, fresh = self.queue(2)
+        stale = timezone.now() - timedelta(hours=1)
+        OutboxEmail.objects.filter(pk=stuck.pk).update(status="sending", attempts=MAX_ATTEMPTS, locked_by="crashed", locked_at=stale)
+
+        self.assertEqual([email.pk for email in claim_batch("w2")], [fresh.pk])
+        stuck.refresh_from_db()
+        self.assertEqual((stuck.status, stuck.attempts, stuck.locked_by), ("dead", MAX_ATTEMPTS, ""))
+        self.assertIn("last attempt", stuck.last_error)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class DigestTests(TestCase):
+    def setUp(self):
+        self.hourly = CustomUser.objects.create_user("hourly", "hourly@example.com", "pw", notification_mode="hourly")
+        self.daily = CustomUser.objects.create_user("daily", "daily@example.com", "pw", notification_mode="daily")
+        self.now = datetime(2025, 3, 4, 10, 30, tzinfo=dt_timezone.utc)
+
+    def event(self, user, minutes_ago, subject="Approved"):
+        event = notify(user, subject, f"{subject} body")
+        NotificationEvent.objects.filter(pk=event.pk).update(created_at=self.now - timedelta(minutes=minutes_ago))
+        return event
+
+    def test_immediate_users_are_emailed_at_once(self):
+        user = CustomUser.objects.create_user("now", "now@example.com", "pw")
+        self.assertIsInstance(notify(user, "Approved", "Body"), OutboxEmail)
+        self.assertFalse(NotificationEvent.objects.exists())
+
+    def test_events_fold_into_one_email_per_closed_period(self):
+        for minutes in (90, 80, 70):
+            self.event(self.hourly, minutes, subject=f"Update {minutes}")
+        self.event(self.hourly, 10)  # After 10:00, waits for the next digest.
+        self.event(self.daily, 60 * 20)  # Yesterday 14:30, before today's 08:00 cut-off.
+        self.event(self.daily, 60)  # Today 09:30, in tomorrow's digest.
+
+        self.assertEqual(send_digests(self.now), (2, 4))
+        self.assertEqual(send_digests(self.now), (0, 0))
+
+        digest = OutboxEmail.objects.get(to=["hourly@example.com"])
+        self.assertEqual(digest.subject, "3 purchase request updates")
+        self.assertEqual([line for line in digest.body.splitlines() if line[:1].isdigit()][0], "1. Update 90 (2025-03-04 09:00)")
+        self.assertEqual(digest.events.count(), 3)
+        self.assertEqual(OutboxEmail.objects.get(to=["daily@example.com"]).subject, "Approved")
+        self.assertEqual(NotificationEvent.objects.filter(digested_at__isnull=True).count(), 2)
+
+        self.assertEqual(send_digests(self.now + timedelta(hours=1)), (1, 1))
+
+    def test_switching_to_immediate_flushes_pending_events(self):
+        self.event(self.daily, 5)
+        self.assertEqual(send_digests(self.now), (0, 0))
+        self.daily.notification_mode = "immediate"
+        self.daily.save()
+        self.assertEqual(send_digests(self.now), (1, 1))
+
+    def test_preference_endpoint(self):
+        api = APIClient()
+        api.force_authenticate(self.hourly)
+        url = reverse("notification-preferences")
+        self.assertEqual(api.get(url).data, {"notification_mode": "hourly"})
+        self.assertEqual(api.patch(url, {"notification_mode": "weekly"}, format="json").status_code, 400)
+        self.assertEqual(api.patch(url, {"notification_mode": "daily"}, format="json").status_code, 200)
+        self.hourly.refresh_from_db()
+        self.assertEqual(self.hourly.notification_mode, "daily")
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'P_order',
+    'notifications',
     'rest_framework',
     'rest_framework_simplejwt',
     'drf_yasg',
@@ -105,7 +106,7 @@ DATABASES = {
         'default': dj_database_url.config(
             default=os.getenv("DATABASE_URL"),
             conn_max_age=600,
-            ssl_require=True  
+            ssl_require=os.getenv('DATABASE_SSL_REQUIRE', 'True').lower() == 'true'
         )
     }
 
@@ -119,6 +120,40 @@ DATABASES = {
 # }
 
 
+# Cache used for purchase request responses. The worker, mailer and digest
+# processes invalidate it too, so it must be shared between processes, e.g.
+# CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache with a table name
+# (run `python manage.py createcachetable` first), ...filebased.FileBasedCache
+# with a directory every process mounts, or ...redis.RedisCache. With the
+# default per-process locmem backend the response cache is switched off.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'procure-cache'),
+    }
+}
+PURCHASE_REQUEST_CACHE_ALIAS = 'default'
+if os.getenv('PURCHASE_REQUEST_CACHE_ENABLED'):
+    PURCHASE_REQUEST_CACHE_ENABLED = os.getenv('PURCHASE_REQUEST_CACHE_ENABLED').lower() == 'true'
+PURCHASE_REQUEST_CACHE_TIMEOUT = int(os.getenv('PURCHASE_REQUEST_CACHE_TIMEOUT', '300'))
+
+# Extraction results kept in memory per process, in front of the database cache.
+EXTRACTION_CACHE_SIZE = int(os.getenv('EXTRACTION_CACHE_SIZE', '256'))
+
+# LLM extraction is used when a key is set; any OpenAI-compatible endpoint works
+# (`python manage.py run_llm_stub` serves one locally).
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '15'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+
+# Who sends downloaded documents: 'python', 'x-accel-redirect' (nginx) or
+# 'x-sendfile' (Apache/lighttpd). See P_order/downloads.py.
+FILE_DOWNLOAD_MODE = os.getenv('FILE_DOWNLOAD_MODE', 'python')
+FILE_DOWNLOAD_ACCEL_PREFIX = os.getenv('FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -185,6 +220,9 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD'
  )
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+# Seconds per SMTP operation. Keep well below MAIL_LOCK_TIMEOUT (300 s), after
+# which another mail worker may claim a message that is still being sent.
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '20'))
 
 
 
@@ -2,6 +2,26 @@ export const API_BASE_URL = 'https://procure-system.onrender.com'
 
 export type HttpMethod = 'GET' | 'POST' | 'PUT' | 'PATCH' | 'DELETE'
 
+export interface CursorPage<T> {
+  next: string | null
+  previous: string | null
+  results: T[]
+}
+
+// The `next`/`previous` links are absolute; apiRequest wants a path.
+export function pagePath(url: string): string {
+  const parsed = new URL(url, API_BASE_URL)
+  return `${parsed.pathname}${parsed.search}`
+}
+
+export interface DocumentJob<R = Record<string, any>> {
+  id: number
+  kind: string
+  status: 'queued' | 'running' | 'succeeded' | 'failed'
+  result: R | null
+  error: string
+}
+
 export interface RequestOptions {
   method?: HttpMethod
   body?: any
@@ -56,3 +76,17 @@ export async function apiRequest<T>(
 
   return data as T
 }
+
+export async function waitForJob<R = Record<string, any>>(
+  id: number,
+  { intervalMs = 1500, timeoutMs = 120000 } = {}
+): Promise<DocumentJob<R>> {
+  const deadline = Date.now() + timeoutMs
+  for (;;) {
+    const job = await apiRequest<DocumentJob<R>>(`/api/v1/jobs/${id}/`, { auth: true })
+    if (job.status === 'succeeded' || job.status === 'failed' || Date.now() > deadline) {
+      return job
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs))
+  }
+}
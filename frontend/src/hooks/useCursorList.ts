@@ -0,0 +1,48 @@
+import { useEffect, useState } from 'react'
+import { apiRequest, pagePath, type CursorPage } from '../api/client'
+
+// A cursor-paginated list: the first page is fetched on mount and by
+// `refresh`, and `loadMore` appends the page after the last one loaded.
+export function useCursorList<T>(path: string, setError: (message: string | null) => void) {
+  const [items, setItems] = useState<T[]>([])
+  const [nextPage, setNextPage] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
+
+  const refresh = async () => {
+    try {
+      setError(null)
+      const data = await apiRequest<CursorPage<T>>(path, {
+        method: 'GET',
+        auth: true,
+      })
+      setItems(data.results)
+      setNextPage(data.next)
+    } catch (err: unknown) {
+      setError(err instanceof Error ? err.message : 'Failed to load requests')
+    }
+  }
+
+  const loadMore = async () => {
+    if (!nextPage) return
+    setLoadingMore(true)
+    try {
+      setError(null)
+      const data = await apiRequest<CursorPage<T>>(pagePath(nextPage), {
+        method: 'GET',
+        auth: true,
+      })
+      setItems((prev) => [...prev, ...data.results])
+      setNextPage(data.next)
+    } catch (err: unknown) {
+      setError(err instanceof Error ? err.message : 'Failed to load requests')
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  useEffect(() => {
+    refresh()
+  }, [path])
+
+  return { items, nextPage, loadingMore, refresh, loadMore }
+}
@@ -1,6 +1,7 @@
-import React, { useEffect, useState } from 'react'
+import React, { useState } from 'react'
 import { apiRequest, API_BASE_URL } from '../api/client'
 import { useAuth } from '../context/AuthContext'
+import { useCursorList } from '../hooks/useCursorList'
 
 interface Approval {
   id: number
@@ -23,7 +24,6 @@ interface PurchaseRequest {
 
 const ApproverDashboard: React.FC = () => {
   const { username, role, logout } = useAuth()
-  const [requests, setRequests] = useState<PurchaseRequest[]>([])
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [activeTab, setActiveTab] = useState<'pending' | 'approved' | 'rejected'>('pending')
@@ -55,22 +55,8 @@ const ApproverDashboard: React.FC = () => {
     }
   }
 
-  const fetchRequests = async () => {
-    try {
-      setError(null)
-      const data = await apiRequest<PurchaseRequest[]>('/api/v1/Get-purchase-request/', {
-        method: 'GET',
-        auth: true,
-      })
-      setRequests(data)
-    } catch (err: unknown) {
-      setError(err  instanceof Error?err.message : 'Failed to load requests')
-    }
-  }
-
-  useEffect(() => {
-    fetchRequests()
-  }, [])
+  const { items: requests, nextPage, loadingMore, refresh: fetchRequests, loadMore } =
+    useCursorList<PurchaseRequest>('/api/v1/Get-purchase-request/', setError)
 
   const handleAction = async (id: number, action: 'approve' | 'reject') => {
     // Ask the approver to add an optional comment before submitting
@@ -279,6 +265,16 @@ const ApproverDashboard: React.FC = () => {
                 })}
             </ul>
           )}
+          {nextPage && (
+            <button
+              type="button"
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="mt-3 text-xs px-3 py-1 rounded-md border border-slate-600 hover:border-emerald-500 disabled:opacity-60"
+            >
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       </main>
     </div>
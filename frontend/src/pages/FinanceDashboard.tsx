@@ -1,6 +1,7 @@
-import React, { useEffect, useState } from 'react'
-import { apiRequest, API_BASE_URL } from '../api/client'
+import React, { useState } from 'react'
+import { apiRequest, waitForJob, API_BASE_URL, type DocumentJob } from '../api/client'
 import { useAuth } from '../context/AuthContext'
+import { useCursorList } from '../hooks/useCursorList'
 
 interface Approval {
   id: number
@@ -25,6 +26,7 @@ interface PurchaseRequest {
     vendor: string
     total_amount: string
     po_file: string | null
+    file_status: 'pending' | 'ready' | 'failed'
   } | null
   approvals?: Approval[]
   items?: Array<{
@@ -37,7 +39,6 @@ interface PurchaseRequest {
 
 const FinanceDashboard: React.FC = () => {
   const { username, logout } = useAuth()
-  const [requests, setRequests] = useState<PurchaseRequest[]>([])
   const [error, setError] = useState<string | null>(null)
   const [activeTab, setActiveTab] = useState<'pending' | 'approved'>('pending')
 
@@ -68,22 +69,8 @@ const FinanceDashboard: React.FC = () => {
     }
   }
 
-  const fetchRequests = async () => {
-    try {
-      setError(null)
-      const data = await apiRequest<PurchaseRequest[]>('/api/v1/Get-purchase-request/', {
-        method: 'GET',
-        auth: true,
-      })
-      setRequests(data)
-    } catch (err: unknown) {
-      setError(err instanceof Error ? err.message : 'Failed to load requests')
-    }
-  }
-
-  useEffect(() => {
-    fetchRequests()
-  }, [])
+  const { items: requests, nextPage, loadingMore, refresh: fetchRequests, loadMore } =
+    useCursorList<PurchaseRequest>('/api/v1/Get-purchase-request/', setError)
 
   return (
     <div className="min-h-screen bg-slate-950 text-slate-50 flex flex-col md:flex-row">
@@ -261,6 +248,12 @@ const FinanceDashboard: React.FC = () => {
                                 📄 Download PO PDF
                               </button>
                             )}
+                            {r.purchase_order.file_status === 'pending' && (
+                              <p className="mt-2 text-slate-500">PO PDF is being generated…</p>
+                            )}
+                            {r.purchase_order.file_status === 'failed' && (
+                              <p className="mt-2 text-red-400">PO PDF could not be generated.</p>
+                            )}
                           </>
                         ) : (
                           <p className="text-slate-500">PO not generated</p>
@@ -276,12 +269,17 @@ const FinanceDashboard: React.FC = () => {
 
                             try {
                               setError(null)
-                              await apiRequest(`/api/v1/approve-request/${r.id}/`, {
+                              const response = await apiRequest(`/api/v1/approve-request/${r.id}/`, {
                                 method: 'PATCH',
                                 auth: true,
                                 body: { comments: comment },
-                              })
+                              }) as { job?: DocumentJob }
                               fetchRequests()
+                              // The PO exists now; refresh again once its PDF is ready.
+                              if (response.job) {
+                                await waitForJob(response.job.id)
+                                fetchRequests()
+                              }
                             } catch (err: unknown) {
                               setError(err instanceof Error ? err.message : 'Approval failed')
                             }
@@ -296,6 +294,16 @@ const FinanceDashboard: React.FC = () => {
                 ))}
             </ul>
           )}
+          {nextPage && (
+            <button
+              type="button"
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="mt-3 text-xs px-3 py-1 rounded-md border border-slate-600 hover:border-emerald-500 disabled:opacity-60"
+            >
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       </main>
     </div>
@@ -1,6 +1,7 @@
-import React, { useEffect, useState } from 'react'
-import { apiRequest, API_BASE_URL } from '../api/client'
+import React, { useState } from 'react'
+import { apiRequest, waitForJob, API_BASE_URL, type DocumentJob } from '../api/client'
 import { useAuth } from '../context/AuthContext'
+import { useCursorList } from '../hooks/useCursorList'
 
 interface PurchaseRequest {
   id: number
@@ -26,7 +27,6 @@ const StaffDashboard: React.FC = () => {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [success, setSuccess] = useState<string | null>(null)
-  const [requests, setRequests] = useState<PurchaseRequest[]>([])
   const [editingId, setEditingId] = useState<number | null>(null)
   const [activeTab, setActiveTab] = useState<'new' | 'list'>('new')
 
@@ -72,22 +72,8 @@ const StaffDashboard: React.FC = () => {
     0
   )
 
-  const fetchRequests = async () => {
-    try {
-      setError(null)
-      const data = await apiRequest<PurchaseRequest[]>('/api/v1/Get-purchase-request/', {
-        method: 'GET',
-        auth: true,
-      })
-      setRequests(data)
-    } catch (err: unknown) {
-      setError(err instanceof Error?err.message : 'Failed to load requests')
-    }
-  }
-
-  useEffect(() => {
-    fetchRequests()
-  }, [])
+  const { items: requests, nextPage, loadingMore, refresh: fetchRequests, loadMore } =
+    useCursorList<PurchaseRequest>('/api/v1/Get-purchase-request/', setError)
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault()
@@ -199,12 +185,17 @@ const StaffDashboard: React.FC = () => {
           auth: true,
           body: formData,
           isFormData: true,
-        }) as { validation?: { validated?: boolean, discrepancies?: { message: string }[] } }
+        }) as { job: DocumentJob }
 
-        if (response.validation?.validated) {
+        const job = await waitForJob<{ validated?: boolean, discrepancies?: { message: string }[] }>(response.job.id)
+        if (job.status === 'succeeded' && job.result?.validated) {
           setSuccess('Receipt submitted and validated successfully!')
+        } else if (job.status === 'succeeded') {
+          setError(`Receipt submitted but has discrepancies: ${job.result?.discrepancies?.map((d: any) => d.message).join(', ')}`)
+        } else if (job.status === 'failed') {
+          setError(`Receipt submitted but could not be processed: ${job.error}`)
         } else {
-          setError(`Receipt submitted but has discrepancies: ${response.validation?.discrepancies?.map((d: any) => d.message).join(', ')}`)
+          setSuccess('Receipt submitted; validation is still running.')
         }
         fetchRequests()
       } catch (err: unknown) {
@@ -498,6 +489,16 @@ const StaffDashboard: React.FC = () => {
                 ))}
               </ul>
             )}
+            {nextPage && (
+              <button
+                type="button"
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="mt-3 text-xs px-3 py-1 rounded-md border border-slate-600 hover:border-emerald-500 disabled:opacity-60"
+              >
+                {loadingMore ? 'Loading...' : 'Load more'}
+              </button>
+            )}
           </div>
         )}
       </main>